@@ -4,71 +4,141 @@ import logging
 log = logging.getLogger("jellyroll")
 import datetime
 import logging
+import time
 import urllib
 
 from django.conf import settings
-from jellyroll.providers import get_registered_provider, _providers_cache
+from django.db import connection
+from jellyroll.core.registry import get_provider_info
 
 try:
     set
 except NameError:
     from sets import Set as set     # Python 2.3 fallback
 
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None          # Python < 2.6 fallback; always run serially
+
 
 """
 Blah, blah, blah
 
 """
-def active_providers():
+def available_providers():
     """
-    Return a dict of {name: module} of active, enabled providers.
+    Return a dict of {name: ProviderInfo} of active, enabled providers, found
+    without importing them (see ``jellyroll.core.registry``).
 
     """
     providers = {}
     for provider in settings.JELLYROLL_PROVIDERS:
         try:
-            mod = __import__(provider, '', '', [], -1)
-            mod = __import__(provider, '', '', [ get_registered_provider(provider) ], -1)
-            provider_cls = getattr(mod, get_registered_provider(provider))
+            info = get_provider_info(provider)
         except ImportError, e:
             log.error("Couldn't import provider %r: %s" % (provider, e))
             raise
 
-        if provider_cls().enabled():
-            providers[provider] = provider_cls
+        if info.enabled():
+            providers[provider] = info
         else:
             log.debug( "Provider %s will not be enabled." % provider )
 
     return providers
 
-def update(providers):
+def active_providers():
+    """
+    Return a dict of {name: provider class} of active, enabled providers.
+    This imports every one of them; ``available_providers`` doesn't.
+
+    """
+    return dict((name, info.load()) for name, info in available_providers().items())
+
+def update(providers, workers=None):
     """
     Update a given set of providers. If the list is empty, it means update all
     of 'em.
 
+    Up to ``workers`` providers are updated at once, each in a separate process
+    so that every ``Provider.run_update()`` gets its own database connection and
+    transaction state. ``workers`` defaults to ``settings.JELLYROLL_UPDATE_WORKERS``
+    (itself defaulting to 1, which runs every provider serially in this process).
+
+    Each run's report (see ``Provider.get_report``) is stored as a
+    ``ProviderRun``. Returns a dict of {name: (succeeded, seconds, report)}.
+
     """
-    active = active_providers()
+    active = available_providers()
     if providers is None:
         providers = active.keys()
     else:
         providers = set(active.keys()).intersection(providers)
-        
+
+    queue = []
     for provider in providers:
-        log.debug("Updating from provider %r", provider)
         try:
-            provider_cls = active[provider]
+            queue.append( (provider, active[provider]) )
         except KeyError:
             log.error("Unknown provider: %r" % provider)
-            continue
 
-        log.info("Running '%s.update()'", provider)
+    if workers is None:
+        workers = getattr(settings, 'JELLYROLL_UPDATE_WORKERS', 1)
+    workers = min(int(workers), len(queue))
+
+    results = {}
+    if workers > 1 and multiprocessing is not None:
+        # Forked workers must not share the parent's connection; each one
+        # will open its own the first time it touches the database.
+        connection.close()
+        pool = multiprocessing.Pool(workers)
         try:
-            provider_cls().run_update()
-        except (KeyboardInterrupt, SystemExit):
-            raise
-        except Exception, e:
-            log.error("Failed during '%s.update()'", provider)
-            log.exception(e)
-            continue
+            for provider, succeeded, elapsed, report in pool.imap_unordered(_update_provider, queue):
+                results[provider] = (succeeded, elapsed, report)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for args in queue:
+            provider, succeeded, elapsed, report = _update_provider(args)
+            results[provider] = (succeeded, elapsed, report)
+
+    return results
+
+def _update_provider(args):
+    """
+    Build (with ``make_provider``, usually a ``ProviderInfo``) and run a single
+    provider, isolating its failures from the others, and record its report.
+    Returns a tuple of (name, succeeded, seconds, report).
+
+    """
+    from jellyroll.core.models import ProviderRun
+
+    provider, make_provider = args
+    log.debug("Updating from provider %r", provider)
+    log.info("Running '%s.update()'", provider)
+
+    started = datetime.datetime.now()
+    start = time.time()
+    instance = None
+    try:
+        instance = make_provider()
+        instance.run_update()
+        succeeded = True
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except Exception, e:
+        succeeded = False
+        log.error("Failed during '%s.update()' after %.2fs", provider, time.time() - start)
+        log.exception(e)
+    elapsed = time.time() - start
+    if succeeded:
+        log.info("Done with provider %r in %.2fs", provider, elapsed)
 
-        log.info("Done with provider %r", provider)
+    report = instance is not None and instance.get_report() or {}
+    report.update(provider=provider, started=started.isoformat(), seconds=elapsed, succeeded=succeeded)
+    try:
+        ProviderRun.objects.record(provider, started, elapsed, succeeded, report)
+    except Exception, e:
+        log.error("Couldn't record the run of %r: %s", provider, e)
+    return (provider, succeeded, elapsed, report)
@@ -1,8 +1,18 @@
-from django.utils import text
+import datetime
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.db import models
+from django.db.models import signals
+from django.utils import text
 from jellyroll.core.models import Item
 
 
+# How many commits' items are looked up per query by ``commit_items``, keeping
+# well under the number of parameters SQLite allows in one statement.
+COMMIT_ITEM_BATCH_SIZE = 400
+
 SCM_CHOICES = (
     ("svn", "Subversion"),
     ("git", "Git"),
@@ -29,6 +39,52 @@ class CodeRepository(models.Model):
     def __unicode__(self):
         return self.name
 
+    def commit_items(self, limit=None):
+        """
+        The ``Item`` objects for the ``limit`` newest commits to this
+        repository (or all of them), newest first, with their objects
+        attached.
+
+        The commits are read off the ``(repository, timestamp)`` index on
+        ``CodeCommit``, and their items looked up by the unique
+        ``(content_type, object_id)`` index on ``Item``, so the work done
+        depends on ``limit`` rather than on how many commits there are.
+        Items come back in their commits' order; the items' own timestamps
+        aren't relied on to match.
+        """
+        commits = self.commits.exclude(timestamp=None).order_by('-timestamp', '-id').values_list('pk', flat=True)
+        if limit is not None:
+            commits = commits[:limit]
+        order = dict([ (unicode(pk), i) for i, pk in enumerate(commits) ])
+        object_ids = order.keys()
+
+        items = []
+        for start in range(0, len(object_ids), COMMIT_ITEM_BATCH_SIZE):
+            items.extend(Item.objects.get_for_model(CodeCommit).filter(
+                object_id__in = object_ids[start:start + COMMIT_ITEM_BATCH_SIZE],
+            ).with_objects())
+        items.sort(key=lambda item: order[item.object_id])
+        return items
+
+    def recent_commit_items(self, limit):
+        """
+        The ``limit`` newest items from ``commit_items``, cached until a
+        commit to this repository, or one of their items, is saved or
+        deleted.
+        """
+        version_key = "jellyroll.code.commits.version:%s" % self.pk
+        version = cache.get(version_key)
+        if version is None:
+            version = "%f" % time.time()
+            cache.set(version_key, version)
+
+        key = "jellyroll.code.commits:%s:%s:%s" % (self.pk, version, limit)
+        items = cache.get(key)
+        if items is None:
+            items = self.commit_items(limit)
+            cache.set(key, items)
+        return items
+
 class CodeCommit(models.Model):
     """
     A code change you checked in.
@@ -36,11 +92,19 @@ class CodeCommit(models.Model):
     repository = models.ForeignKey(CodeRepository, related_name="commits")
     revision = models.CharField(max_length=200)
     message = models.TextField()
+    # Denormalized from the commit's Item, and indexed along with the
+    # repository by sql/codecommit.sql, for CodeRepository.commit_items.
+    timestamp = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         ordering = ["-revision"]
         app_label = 'jellyroll'
 
+    def save(self, force_insert=False, force_update=False):
+        if self.timestamp is None:
+            self.timestamp = datetime.datetime.now()
+        super(CodeCommit, self).save(force_insert, force_update)
+
     def __unicode__(self):
         return "[%s] %s" % (self.format_revision(), text.truncate_words(self.message, 10))
 
@@ -60,3 +124,16 @@ class CodeCommit(models.Model):
     url = property(url)
 
 Item.objects.follow_model(CodeCommit)
+
+def invalidate_recent_commits(instance, **kwargs):
+    cache.delete("jellyroll.code.commits.version:%s" % instance.repository_id)
+signals.post_save.connect(invalidate_recent_commits, sender=CodeCommit)
+signals.post_delete.connect(invalidate_recent_commits, sender=CodeCommit)
+
+def invalidate_recent_commit_items(instance, **kwargs):
+    if instance.content_type_id != ContentType.objects.get_for_model(CodeCommit).id:
+        return
+    for repository_id in CodeCommit.objects.filter(pk=instance.object_id).values_list('repository', flat=True):
+        cache.delete("jellyroll.code.commits.version:%s" % repository_id)
+signals.post_save.connect(invalidate_recent_commit_items, sender=Item)
+signals.post_delete.connect(invalidate_recent_commit_items, sender=Item)
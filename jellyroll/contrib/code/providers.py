@@ -24,6 +24,7 @@ class CodeRepositoryProvider(Provider):
     def __init__(self):
         super(CodeRepositoryProvider,self).__init__()
         self.register_model(CodeCommit)
+        self.pending_revisions = {}
 
     def enabled(self):
         if not self._meta.repository_type:
@@ -34,19 +35,47 @@ class CodeRepositoryProvider(Provider):
         return "%s:r%s" % (smart_str(extra['repository'].url),
                           smart_str(extra['revision']))
 
-    def get_last_updated(self, model_cls, **kwargs):
+    def checkpoint_scope(self, model_cls, extra):
+        return str(extra['repository'].pk)
+
+    def scan_last_updated(self, model_cls, extra):
         return Item.objects.get_last_update_of_model(
-            model_cls, source_id__startswith=kwargs['repository'].url)
+            model_cls, source_id__startswith=extra['repository'].url)
+
+    def get_last_revision(self, repository):
+        """
+        Return the last revision of ``repository`` seen by a completed update,
+        or ``None`` if there hasn't been one.
+
+        """
+        return self.get_checkpoint(CodeCommit,{'repository':repository}).cursor or None
+
+    def set_last_revision(self, repository, revision):
+        """
+        Record ``revision`` as the newest revision of ``repository`` seen by
+        this update. It is saved with the repository's checkpoint once every
+        commit has been handled (see ``complete_checkpoints``), so an
+        interrupted update starts over from the previous revision.
+
+        """
+        self.pending_revisions[repository.pk] = (repository, revision)
+
+    def complete_checkpoints(self, model_cls):
+        for repository, revision in self.pending_revisions.values():
+            checkpoint = self.get_checkpoint(CodeCommit,{'repository':repository})
+            checkpoint.cursor = str(revision)
+            checkpoint.save()
+        self.pending_revisions = {}
 
     def get_update_data(self, model_cls, model_str):
         return CodeRepository.objects.filter(type=self._meta.repository_type)
 
     def update_codecommit(self, repositories):
-        self.incoming["codecommit"] = list()
         for repository in repositories:
             last_update_date = self.get_last_updated(CodeCommit,repository=repository)
             log.info("Updating changes from %s since %s", repository.url, last_update_date)
 
             func = getattr(self,'_'.join([ 'update_codecommit',self._meta.repository_type ]))
-            func(repository,last_update_date,self.incoming["codecommit"])
+            for obj in func(repository,last_update_date):
+                yield obj
 
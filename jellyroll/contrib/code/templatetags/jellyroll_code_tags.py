@@ -1,6 +1,7 @@
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django import template
+instrumented_render = __import__("jellyroll.core.instrumentation", {}, {}, [""]).instrumented_render
 
 # Hack until relative imports
 CodeRepository = models.get_model("jellyroll", "coderepository")
@@ -14,16 +15,14 @@ class CodeCommitsForRepositoryNode(template.Node):
         self.context_var = context_var
         self.limit = limit
 
+    @instrumented_render
     def render(self, context):
         try:
             repository = CodeRepository.objects.get(name=self.repository_name)
-            items = Item.objects.get_for_model(CodeCommit).order_by("-timestamp")
-            codecommits = [ item for item in items if item.object.repository == repository ]
-
             if self.limit:
-                context[self.context_var] = codecommits[:self.limit]
+                context[self.context_var] = repository.recent_commit_items(self.limit)
             else:
-                context[self.context_var] = codecommits
+                context[self.context_var] = repository.commit_items()
         except CodeRepository.DoesNotExist:
             pass
 
@@ -1,7 +1,7 @@
 from bookmark.models import Bookmark
 from code.models import CodeCommit, CodeRepository
 from message.models import Message
-from photo.models import Photo, Photoset
+from photo.models import Photo, PhotoExif, Photoset
 from search.models import WebSearch, WebSearchResult, SearchEngine
 from track.models import Track
 from utils.models import ContentLink
@@ -1,3 +1,4 @@
+import re
 import urllib
 import urlparse
 
@@ -48,15 +49,23 @@ class Photo(models.Model):
     class Meta:
         app_label = 'jellyroll'
     
-    # EXIF metadata
+    # EXIF metadata. The decoded dict is kept along with the JSON it came
+    # from, so templates can look up several keys without decoding it each
+    # time; it's shared, so assign a new dict rather than changing it.
     _exif = models.TextField(blank=True)
     def _set_exif(self, d):
         self._exif = simplejson.dumps(d)
+        self._exif_cache = (self._exif, d)
     def _get_exif(self):
+        cache = getattr(self, '_exif_cache', None)
+        if cache is not None and cache[0] is self._exif:
+            return cache[1]
         if self._exif:
-            return simplejson.loads(self._exif)
+            d = simplejson.loads(self._exif)
         else:
-            return {}
+            d = {}
+        self._exif_cache = (self._exif, d)
+        return d
     exif = property(_get_exif, _set_exif, "Photo EXIF data, as a dict.")
     
     def _get_farm(self):
@@ -141,6 +150,105 @@ class Photo(models.Model):
 
 Item.objects.follow_model(Photo)
 
+# The EXIF labels (as Flickr reports them) each of ``PhotoExif``'s columns is
+# read from, most preferred first.
+EXIF_LABELS = {
+    'make':         ('Make',),
+    'model':        ('Model',),
+    'lens':         ('Lens Model', 'Lens', 'Lens Type'),
+    'focal_length': ('Focal Length',),
+    'exposure':     ('Exposure', 'Exposure Time'),
+    'aperture':     ('Aperture', 'F Number'),
+    'iso':          ('ISO Speed', 'ISO'),
+}
+
+NUMBER_RE = re.compile(r'(\d+(?:\.\d+)?)(?:/(\d+(?:\.\d+)?))?')
+
+def parse_exif_number(value):
+    """
+    The first number in an EXIF value -- ``"50 mm"``, ``"f/5.6"``, ``"1/125"``
+    or ``"0.008 sec (1/125)"`` -- as a float, or ``None``.
+    """
+    match = NUMBER_RE.search(value or "")
+    if match is None:
+        return None
+    number, denominator = match.groups()
+    if denominator is None:
+        return float(number)
+    if float(denominator) == 0:
+        return None
+    return float(number) / float(denominator)
+
+class PhotoExifManager(models.Manager):
+    def update_for_photo(self, photo):
+        """
+        Store (or replace) the indexed columns for ``photo``'s EXIF data.
+        Photos without any EXIF data don't get a row.
+        """
+        exif = photo.exif
+        if not exif:
+            self.filter(photo=photo).delete()
+            return None
+
+        values = {}
+        for field, labels in EXIF_LABELS.items():
+            values[field] = u""
+            for label in labels:
+                if exif.get(label):
+                    values[field] = exif[label]
+                    break
+
+        obj = self.model(photo=photo)
+        obj.make = values['make'][:100]
+        obj.model = values['model'][:100]
+        obj.lens = values['lens'][:100]
+        obj.focal_length = parse_exif_number(values['focal_length'])
+        obj.exposure = parse_exif_number(values['exposure'])
+        obj.aperture = parse_exif_number(values['aperture'])
+        iso = parse_exif_number(values['iso'])
+        if iso is not None:
+            iso = int(iso)
+        obj.iso = iso
+        obj.save()
+        return obj
+
+    def rebuild(self):
+        """
+        Recreate the rows for every photo from its EXIF data, returning how
+        many were stored.
+        """
+        self.all().delete()
+        count = 0
+        for photo in Photo.objects.exclude(_exif=""):
+            if self.update_for_photo(photo) is not None:
+                count += 1
+        return count
+
+class PhotoExif(models.Model):
+    """
+    The parts of a photo's EXIF data worth searching by, in indexed columns,
+    so that finding the photos taken with a lens (or at a focal length)
+    doesn't mean decoding every photo's EXIF. ``FlickrProvider`` fills it in
+    as it saves photos; ``./manage.py jellyroll_rebuild_exif`` fills it in
+    for photos that are already there.
+    """
+    photo        = models.OneToOneField(Photo, primary_key=True)
+    make         = models.CharField(max_length=100, blank=True)
+    model        = models.CharField(max_length=100, blank=True, db_index=True)
+    lens         = models.CharField(max_length=100, blank=True, db_index=True)
+    focal_length = models.FloatField(blank=True, null=True, db_index=True)   # mm
+    exposure     = models.FloatField(blank=True, null=True, db_index=True)   # seconds
+    aperture     = models.FloatField(blank=True, null=True)                  # f-number
+    iso          = models.PositiveIntegerField(blank=True, null=True)
+
+    objects = PhotoExifManager()
+
+    class Meta:
+        app_label = 'jellyroll'
+
+    def __unicode__(self):
+        return u"EXIF for %s" % self.photo_id
+
 class Photoset(models.Model):
     """
 
@@ -1,5 +1,6 @@
 from django.db import models
 from django import template
+instrumented_render = __import__("jellyroll.core.instrumentation", {}, {}, [""]).instrumented_render
 
 # Hack until relative imports
 #Photo = models.get_model("jellyroll", "photo")
@@ -11,6 +12,7 @@ class PhotosetNode(template.Node):
         self.name = name.strip('\"')
         self.context_var = context_var
 
+    @instrumented_render
     def render(self, context):
         try:
             photoset = Photoset.objects.get(title=self.name)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib.syndication.feeds import Feed
 from django.utils.feedgenerator import Atom1Feed
 from django.contrib.sites.models import Site
@@ -17,30 +18,45 @@ class JellyrollBaseFeed(Feed):
         return self.item_class._meta.verbose_name_plural
     verbose_name_plural = property(_get_verbose_name_plural)
 
+    def _get_item_limit(self):
+        return getattr(settings, 'JELLYROLL_FEED_ITEM_LIMIT', 30)
+    item_limit = property(_get_item_limit)
+
+    def _get_site(self):
+        return Site.objects.get_current()
+    site = property(_get_site)
+
     def link(self):
-        if not hasattr(self, '_site'):
-            self._site = Site.objects.get_current()
-        return u"http://%s" % self._site.domain
+        return u"http://%s" % self.site.domain
 
     def item_link(self, item):
         return item.url
 
     def title(self):
-        if not hasattr(self, '_site'):
-            self._site = Site.objects.get_current()
-        return u"%s %s" % (self._site.name, self.verbose_name_plural)
+        return u"%s %s" % (self.site.name, self.verbose_name_plural)
 
     def description(self):
-        if not hasattr(self, '_site'):
-            self._site = Site.objects.get_current()
-        return u"Latest %s on %s" % (self._site.name, self.verbose_name_plural)
+        return u"Latest %s on %s" % (self.site.name, self.verbose_name_plural)
 
     def items(self):
-        return Item.objects.get_for_model(self.item_class)
+        return Item.objects.get_for_model(self.item_class).with_objects()[:self.item_limit]
 
     def item_pubdate(self, item):
         return item.timestamp
 
+    def latest_timestamp(self):
+        """
+        The timestamp of the newest item this feed could include, or ``None``
+        if there aren't any; ``jellyroll.views.feeds.feed`` uses it for
+        conditional GETs and to know when a cached feed is out of date.
+        """
+        timestamps = Item.objects.get_for_model(self.item_class) \
+                                 .order_by('-timestamp').values_list('timestamp', flat=True)
+        try:
+            return timestamps[0]
+        except IndexError:
+            return None
+
 class JellyrollBaseAtomFeed(JellyrollBaseFeed):
     feed_type = Atom1Feed
     subtitle = JellyrollBaseFeed.description
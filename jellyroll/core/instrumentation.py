@@ -0,0 +1,209 @@
+"""
+Per-request timings and query counts for jellyroll's views, template tags and
+feeds.
+
+To turn it on, add ``jellyroll.core.instrumentation.InstrumentationMiddleware``
+to ``MIDDLEWARE_CLASSES`` and set ``JELLYROLL_INSTRUMENTATION = True``. Every
+instrumented call made while a request is handled is then recorded as a
+``Measurement``: its name (``calendar.year``, ``JellyrenderNode``,
+``feeds.photos``, ...), the time it took and the number of database
+statements it ran, including anything nested inside it. When the response goes
+out the measurements are summarized in an ``X-Jellyroll-Instrumentation``
+header, logged to the ``jellyroll.instrumentation`` logger and passed to each
+hook (see ``register_hook`` and ``JELLYROLL_INSTRUMENTATION_HOOKS``).
+
+Without the middleware (or with the setting off, in which case the middleware
+removes itself) an instrumented call costs one thread-local lookup.
+
+"""
+import logging
+log = logging.getLogger("jellyroll.instrumentation")
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.urlresolvers import get_callable
+from django.utils.functional import wraps
+
+_local = threading.local()
+_hooks = []
+
+
+class Measurement(object):
+    def __init__(self, name, seconds, queries):
+        self.name = name
+        self.seconds = seconds
+        self.queries = queries
+
+    def __repr__(self):
+        return "<Measurement: %s %.1fms %dq>" % (self.name, self.seconds * 1000, self.queries)
+
+class CountingCursor(object):
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def execute(self, sql, params=()):
+        self.counter.statements += 1
+        return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self.counter.statements += 1
+        return self.cursor.executemany(sql, param_list)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+class StatementCounter(object):
+    """
+    Counts the statements run through ``connection`` (in this thread) while
+    installed. Unlike ``connection.queries`` this works with ``DEBUG`` off
+    and doesn't keep the SQL around. Counters can be nested, as long as each
+    is uninstalled before the one installed ahead of it.
+
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.statements = 0
+        self._previous = None
+
+    def install(self):
+        self._previous = self.connection.__dict__.get('cursor')
+        cursor = self.connection.cursor
+        self.connection.cursor = lambda: CountingCursor(cursor(), self)
+
+    def uninstall(self):
+        if self._previous is None:
+            del self.connection.cursor
+        else:
+            self.connection.cursor = self._previous
+
+def start():
+    """
+    Start collecting measurements in this thread.
+
+    """
+    from django.db import connection
+    finish()
+    counter = StatementCounter(connection)
+    counter.install()
+    _local.counter = counter
+    _local.measurements = []
+
+def finish():
+    """
+    Stop collecting measurements in this thread, and return the ``Measurement``
+    list, in the order the calls finished.
+
+    """
+    counter = getattr(_local, 'counter', None)
+    if counter is None:
+        return []
+    counter.uninstall()
+    measurements = _local.measurements
+    del _local.counter, _local.measurements
+    return measurements
+
+def measure(name, func, *args, **kwargs):
+    """
+    Call ``func(*args, **kwargs)``, recording it as ``name`` if measurements
+    are being collected.
+
+    """
+    counter = getattr(_local, 'counter', None)
+    if counter is None:
+        return func(*args, **kwargs)
+    statements = counter.statements
+    began = time.time()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _local.measurements.append(Measurement(name, time.time() - began, counter.statements - statements))
+
+def instrumented(name):
+    """
+    Decorator that records calls to the function as ``name``.
+
+    """
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            return measure(name, func, *args, **kwargs)
+        return wraps(func)(wrapper)
+    return decorator
+
+def instrumented_render(render):
+    """
+    Decorator for a template ``Node``'s ``render`` that records calls under
+    the node's class name.
+
+    """
+    def wrapper(self, context):
+        if getattr(_local, 'counter', None) is None:
+            return render(self, context)
+        return measure(self.__class__.__name__, render, self, context)
+    return wraps(render)(wrapper)
+
+def summarize(measurements):
+    """
+    Total ``measurements`` by name: returns a list of ``(name, calls, seconds,
+    queries)`` in the order each name first appears.
+
+    """
+    totals = {}
+    names = []
+    for m in measurements:
+        if m.name not in totals:
+            totals[m.name] = [0, 0.0, 0]
+            names.append(m.name)
+        total = totals[m.name]
+        total[0] += 1
+        total[1] += m.seconds
+        total[2] += m.queries
+    return [ (name,) + tuple(totals[name]) for name in names ]
+
+def format_summary(summary):
+    return ", ".join([ "%s %dx %.1fms %dq" % (name, calls, seconds * 1000, queries)
+                       for name, calls, seconds, queries in summary ])
+
+def register_hook(hook):
+    """
+    Call ``hook(request, response, measurements)`` at the end of every
+    instrumented request.
+
+    """
+    if hook not in _hooks:
+        _hooks.append(hook)
+
+class InstrumentationMiddleware(object):
+    """
+    Collects measurements for each request when ``JELLYROLL_INSTRUMENTATION``
+    is on. Hooks named (by dotted path) in ``JELLYROLL_INSTRUMENTATION_HOOKS``
+    are called along with those given to ``register_hook``.
+
+    """
+    def __init__(self):
+        if not getattr(settings, 'JELLYROLL_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.hooks = [ get_callable(path) for path in getattr(settings, 'JELLYROLL_INSTRUMENTATION_HOOKS', ()) ]
+
+    def process_request(self, request):
+        start()
+
+    def process_response(self, request, response):
+        measurements = finish()
+        if not measurements:
+            return response
+
+        summary = format_summary(summarize(measurements))
+        response['X-Jellyroll-Instrumentation'] = summary
+        log.info("%s %s: %s", request.method, request.path, summary)
+        for hook in self.hooks + _hooks:
+            try:
+                hook(request, response, measurements)
+            except Exception:
+                log.exception("Instrumentation hook %r failed", hook)
+        return response
@@ -1,11 +1,119 @@
 import datetime
+import md5
+import time
 
-from django.db import models
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, models, transaction, IntegrityError
 from django.db.models import signals
+from django.db.models.query import QuerySet
 from django.db.models.loading import get_model
 from django.contrib.contenttypes.models import ContentType
-from django.utils.encoding import force_unicode
+from django.utils.encoding import force_unicode, smart_str
+from django.utils import simplejson
 from tagging.fields import TagField
+from tagging.models import Tag
+from tagging.utils import calculate_cloud, parse_tag_input
+
+
+ITEM_BOUNDS_CACHE_KEY = "jellyroll.item.bounds"
+ITEM_VERSION_CACHE_KEY = "jellyroll.item.version:%s:%s"
+ITEM_TAG_USAGE_CACHE_KEY = "jellyroll.item.tags"
+
+
+def hash_source_id(source_id):
+    """
+    Return the hash of an ``Item.source_id`` that's stored (and indexed) as
+    ``Item.source_id_hash``, since ``source_id`` is too long to index.
+
+    """
+    return md5.new(smart_str(source_id)).hexdigest()
+
+
+def attach_objects(items):
+    """
+    Fetch the objects behind the ``Item`` objects in ``items`` with one query
+    per content type, and attach them (and their content types) so that
+    ``item.object`` and ``item.content_type`` don't each cost a query.
+
+    """
+    ct_cache = models.get_model('jellyroll','item')._meta.get_field('content_type').get_cache_name()
+    by_type = {}
+    for item in items:
+        by_type.setdefault(item.content_type_id, []).append(item)
+
+    for content_type_id, typed_items in by_type.iteritems():
+        ctype = ContentType.objects.get_for_id(content_type_id)
+        model = ctype.model_class()
+        if model is None:
+            continue
+        pk_field = model._meta.pk
+        objects = model._default_manager.in_bulk(
+            [ pk_field.to_python(item.object_id) for item in typed_items ])
+        for item in typed_items:
+            setattr(item, ct_cache, ctype)
+            obj = objects.get(pk_field.to_python(item.object_id))
+            if obj is not None:
+                object_id = item.object_id
+                item.object = obj
+                item.object_id = object_id
+    return items
+
+
+def with_objects(queryset):
+    """
+    ``queryset.with_objects()`` if ``queryset`` is an ``ItemQuerySet``. Any
+    other queryset of items -- a plain ``QuerySet`` or ``EmptyQuerySet``
+    handed to a view, say -- is returned as it is, its items fetching their
+    objects one at a time as they always have.
+
+    """
+    if hasattr(queryset, 'with_objects'):
+        return queryset.with_objects()
+    return queryset
+
+
+class ItemQuerySet(QuerySet):
+    """
+    A ``QuerySet`` of ``Item`` objects that can fetch the objects behind
+    them in bulk; see ``with_objects``.
+
+    """
+    # How many items' objects are fetched at a time when iterating.
+    object_batch_size = 100
+
+    def __init__(self, model=None, query=None):
+        super(ItemQuerySet, self).__init__(model, query)
+        self._with_objects = False
+
+    def with_objects(self):
+        """
+        Return a copy of this queryset whose items come with their objects
+        already attached (see ``attach_objects``).
+
+        """
+        return self._clone(_with_objects=True)
+
+    def _clone(self, klass=None, setup=False, **kwargs):
+        kwargs.setdefault('_with_objects', self._with_objects)
+        return super(ItemQuerySet, self)._clone(klass, setup, **kwargs)
+
+    def iterator(self):
+        items = super(ItemQuerySet, self).iterator()
+        if not self._with_objects:
+            for item in items:
+                yield item
+            return
+
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= self.object_batch_size:
+                for item in attach_objects(batch):
+                    yield item
+                batch = []
+        for item in attach_objects(batch):
+            yield item
 
 
 class ItemManager(models.Manager):
@@ -13,12 +121,21 @@ class ItemManager(models.Manager):
     def __init__(self):
         super(ItemManager, self).__init__()
         self.models_by_name = {}
+
+    def get_query_set(self):
+        return ItemQuerySet(self.model)
+
+    def with_objects(self):
+        return self.get_query_set().with_objects()
     
     def create_or_update(self, instance, timestamp=None, url=None, tags="", 
-                         source="INTERACTIVE", source_id="", **kwargs):
+                         source="INTERACTIVE", source_id="", item=None, **kwargs):
         """
         Create or update an Item from some instance.
 
+        Callers that have already fetched the ``Item`` following ``instance``
+        may pass it as ``item`` to save looking it up again.
+
         """
         # If the instance hasn't already been saved, save it first. This
         # requires disconnecting the post-save signal that might be sent to
@@ -55,27 +172,42 @@ class ItemManager(models.Manager):
             if hasattr(instance,'url'):
                 url = instance.url
 
-        # Create the Item object.
-        ctype = ContentType.objects.get_for_model(instance)
-        item, created = self.get_or_create(
-            content_type = ctype, 
-            object_id = force_unicode(instance._get_pk_val()),
-            defaults = dict(
-                timestamp = timestamp,
-                source = source,
-                source_id = source_id,
-                tags = tags,
-                url = url,
-            )
-        )
+        # Find or create the Item object.
+        created = False
+        old_date = None
+        if item is None:
+            ctype = ContentType.objects.get_for_model(instance)
+            object_id = force_unicode(instance._get_pk_val())
+            try:
+                item = self.get(content_type=ctype, object_id=object_id)
+            except self.model.DoesNotExist:
+                item = self.model(content_type=ctype, object_id=object_id)
+                created = True
+        elif item.pk is None:
+            created = True
+        if not created and item.timestamp is not None:
+            old_date = item.timestamp.date()
+        old_tags = not created and item.tags or ""
 
-        # Update the Item object.
+        # Update the Item object. Binding ``instance`` as its object also
+        # spares ``Item.save`` a query to denormalize the object's __unicode__.
+        item.object = instance
+        item.object_id = force_unicode(instance._get_pk_val())
         item.timestamp = timestamp
         item.source_id = source_id
         item.source = source
         item.tags = tags
         item.url = url
-        item.save()
+        item.save(force_insert=created)
+
+        # Keep the daily item counts up to date.
+        ItemCount = get_model('jellyroll','itemcount')
+        if old_date != timestamp.date():
+            if old_date is not None:
+                ItemCount.objects.increment(old_date, item.content_type_id, -1)
+            ItemCount.objects.increment(timestamp.date(), item.content_type_id)
+        if old_tags != (tags or ""):
+            self.update_tag_usage(old_tags, tags)
 
         return item
 
@@ -88,7 +220,8 @@ class ItemManager(models.Manager):
         item_model_cls = get_model('jellyroll','item')
         provider_cls = provider.__class__
         id = provider.source_id(model_cls,extra)
-        return self.get_query_set().get(source=provider_cls.__name__, source_id=id)
+        return self.get_query_set().get(source=provider_cls.__name__, 
+                                        source_id_hash=hash_source_id(id), source_id=id)
 
     def follow_model(self, model):
         """
@@ -97,6 +230,7 @@ class ItemManager(models.Manager):
         """
         self.models_by_name[model.__name__.lower()] = model
         signals.post_save.connect(self.create_or_update, sender=model)
+        signals.post_save.connect(self.bump_object_version, sender=model)
         
     def get_for_model(self, model):
         """
@@ -105,6 +239,139 @@ class ItemManager(models.Manager):
         """
         return self.filter(content_type=ContentType.objects.get_for_model(model))
         
+    def get_bounds(self):
+        """
+        Return the timestamps of the first and last items as a ``(first,
+        last)`` tuple, or ``None`` if there aren't any items. The bounds are
+        kept in the cache until an item is saved or deleted.
+
+        """
+        bounds = cache.get(ITEM_BOUNDS_CACHE_KEY)
+        if bounds is None:
+            timestamps = self.values_list('timestamp', flat=True)
+            try:
+                bounds = (timestamps.order_by('timestamp')[0], timestamps.order_by('-timestamp')[0])
+            except IndexError:
+                return None
+            cache.set(ITEM_BOUNDS_CACHE_KEY, bounds)
+        return bounds
+
+    def invalidate_bounds(self, **kwargs):
+        """
+        Forget the cached bounds (see ``get_bounds``). Also a signal receiver.
+
+        """
+        cache.delete(ITEM_BOUNDS_CACHE_KEY)
+
+    def get_version(self, item):
+        """
+        Return a token that changes whenever ``item`` or the object it follows
+        is saved, for use in the keys of anything cached about it.
+
+        """
+        key = ITEM_VERSION_CACHE_KEY % (item.content_type_id, item.object_id)
+        version = cache.get(key)
+        if version is None:
+            version = self.bump_version(item)
+        return version
+
+    def bump_version(self, instance, **kwargs):
+        """
+        Give ``instance`` (an ``Item``) a new version; see ``get_version``.
+        Also a signal receiver.
+
+        """
+        return self._bump_version(instance.content_type_id, instance.object_id)
+
+    def bump_object_version(self, instance, **kwargs):
+        """
+        Give the ``Item`` following ``instance`` a new version, without
+        looking the item up. A signal receiver for followed models, which
+        (unlike ``create_or_update``) stays connected while providers handle
+        records, so rows they rewrite drop their cached fragments too.
+
+        """
+        ctype = ContentType.objects.get_for_model(instance)
+        return self._bump_version(ctype.pk, force_unicode(instance._get_pk_val()))
+
+    def _bump_version(self, content_type_id, object_id):
+        version = "%f" % time.time()
+        cache.set(ITEM_VERSION_CACHE_KEY % (content_type_id, object_id), version)
+        return version
+
+    def _tag_usage(self):
+        """
+        Return ``(pk, name, count)`` for every tag used on items. It's worked
+        out with one query and then kept in the cache until an item's tags
+        change (see ``update_tag_usage``).
+
+        """
+        usage = cache.get(ITEM_TAG_USAGE_CACHE_KEY)
+        if usage is None:
+            usage = [ (tag.pk, tag.name, tag.count) for tag in Tag.objects.usage_for_model(self.model, counts=True) ]
+            cache.set(ITEM_TAG_USAGE_CACHE_KEY, usage)
+        return usage
+
+    def get_tag_usage(self):
+        """
+        Return a dictionary mapping the name of every tag used on items to
+        how many items use it.
+
+        """
+        return dict([ (name, count) for pk, name, count in self._tag_usage() ])
+
+    def invalidate_tag_usage(self, **kwargs):
+        """
+        Forget the cached tag usage, so that it's worked out again the next
+        time it's needed. Also a signal receiver.
+
+        """
+        cache.delete(ITEM_TAG_USAGE_CACHE_KEY)
+
+    def update_tag_usage(self, old_tags, new_tags):
+        """
+        Forget the cached tag usage if an item's tags changing from
+        ``old_tags`` to ``new_tags`` (both tag strings) changes it.
+
+        The cached counts aren't adjusted in place: concurrent provider runs
+        would lose each other's adjustments, and a transaction rolling back
+        wouldn't take its adjustments back with it. The provider framework
+        also forgets the usage after each chunk it commits, in case it was
+        worked out again from before the chunk's changes were visible.
+
+        """
+        lowercase = getattr(settings, 'FORCE_LOWERCASE_TAGS', False)
+        def tag_set(tags):
+            tags = parse_tag_input(tags or "")
+            if lowercase:
+                tags = [ tag.lower() for tag in tags ]
+            return set(tags)
+        if tag_set(old_tags) != tag_set(new_tags):
+            self.invalidate_tag_usage()
+
+    def forget_tags(self, instance, **kwargs):
+        """
+        Take a deleted ``Item``'s tags out of the tag usage. A signal receiver.
+
+        """
+        self.update_tag_usage(instance.tags, "")
+
+    def tag_cloud(self, steps=4):
+        """
+        Return the tags used on items, alphabetically, as ``Tag`` objects
+        with ``count`` and ``font_size`` (from 1 to ``steps``) attributes.
+
+        """
+        tags = []
+        for pk, name, count in self._tag_usage():
+            tag = Tag(id=pk, name=name)
+            tag.count = count
+            tags.append(tag)
+        tags.sort(key=lambda tag: tag.name.lower())
+        if tags:
+            calculate_cloud(tags, steps)
+        return tags
+
     def get_last_update_of_model(self, model, **kwargs):
         """
         Return the last time a given model's items were updated. Returns the
@@ -118,3 +385,196 @@ class ItemManager(models.Manager):
             return qs.order_by('-timestamp')[0].timestamp
         except IndexError:
             return datetime.datetime.fromtimestamp(0)
+
+
+class HttpValidatorManager(models.Manager):
+
+    def get_for_url(self, url):
+        """
+        Return the ``HttpValidator`` for ``url``, or an unsaved, empty one if
+        the URL hasn't been fetched before.
+
+        """
+        url_hash = md5.new(smart_str(url)).hexdigest()
+        try:
+            return self.get(url_hash=url_hash)
+        except self.model.DoesNotExist:
+            return self.model(url_hash=url_hash, url=url)
+
+    def set_for_url(self, url, etag="", last_modified=""):
+        """
+        Remember the validators most recently served for ``url``.
+
+        """
+        validator = self.get_for_url(url)
+        validator.etag = etag or ""
+        validator.last_modified = last_modified or ""
+        validator.save()
+        return validator
+
+
+class CheckpointManager(models.Manager):
+
+    def get_for(self, provider, model_cls, scope=""):
+        """
+        Return ``provider``'s ``Checkpoint`` for ``model_cls`` within ``scope``,
+        or an unsaved one if it hasn't recorded one yet.
+
+        """
+        lookup = dict(
+            provider = provider.__class__.__name__,
+            model = model_cls.__name__.lower(),
+            scope = scope,
+        )
+        try:
+            return self.get(**lookup)
+        except self.model.DoesNotExist:
+            return self.model(**lookup)
+
+
+class CacheEntryManager(models.Manager):
+
+    def key_hash(self, key):
+        return md5.new(smart_str(key)).hexdigest()
+
+    def get_value(self, namespace, key):
+        """
+        Return ``(found, value)`` for ``key`` in ``namespace``, ignoring (and
+        removing) an expired entry.
+
+        """
+        now = datetime.datetime.now()
+        try:
+            entry = self.get(namespace=namespace, key_hash=self.key_hash(key))
+        except self.model.DoesNotExist:
+            return False, None
+        if entry.expires <= now:
+            entry.delete()
+            return False, None
+        self.filter(pk=entry.pk).update(accessed=now)
+        return True, simplejson.loads(entry.value)
+
+    def set_value(self, namespace, key, value, ttl):
+        """
+        Store ``value`` (which must be JSON-serializable) under ``key`` for
+        ``ttl`` seconds.
+
+        """
+        now = datetime.datetime.now()
+        key_hash = self.key_hash(key)
+        try:
+            entry = self.get(namespace=namespace, key_hash=key_hash)
+        except self.model.DoesNotExist:
+            entry = self.model(namespace=namespace, key_hash=key_hash, key=key)
+        entry.value = simplejson.dumps(value)
+        entry.expires = now + datetime.timedelta(seconds=ttl)
+        entry.accessed = now
+        entry.save()
+        return entry
+
+    def prune(self, namespace, max_entries=None):
+        """
+        Delete expired entries in ``namespace``, then the least recently used
+        ones beyond ``max_entries``. Returns the number of entries kept.
+
+        """
+        entries = self.filter(namespace=namespace)
+        entries.filter(expires__lte=datetime.datetime.now()).delete()
+        count = entries.count()
+        if max_entries is not None and count > max_entries:
+            # By primary key, not by an ``accessed`` cutoff: entries tied
+            # with the cutoff (easy at one-second precision) would all go.
+            stale = entries.order_by('accessed', 'id').values_list('id', flat=True)[:count - max_entries]
+            self.filter(pk__in=list(stale)).delete()
+            count = entries.count()
+        return count
+
+
+class ItemCountManager(models.Manager):
+
+    def increment(self, date, content_type_id, delta=1):
+        """
+        Add ``delta`` to the count of items of ``content_type_id`` on ``date``.
+
+        """
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        cursor.execute("UPDATE %s SET %s = %s + %%s WHERE %s = %%s AND %s = %%s AND %s + %%s >= 0" % \
+                           (qn(self.model._meta.db_table), qn('count'), qn('count'), 
+                            qn('date'), qn('content_type_id'), qn('count')),
+                       [delta, date, content_type_id, delta])
+        transaction.commit_unless_managed()
+        if cursor.rowcount or delta <= 0:
+            return
+
+        # There's no row for that day yet. Another process may be adding it
+        # too, so fall back to updating it if that's the case.
+        sid = transaction.savepoint()
+        try:
+            self.create(date=date, content_type_id=content_type_id, count=delta)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+            self.increment(date, content_type_id, delta)
+        else:
+            transaction.savepoint_commit(sid)
+
+    def decrement_item(self, instance, **kwargs):
+        """
+        Take a deleted ``Item`` out of the counts. A signal receiver.
+
+        """
+        self.increment(instance.timestamp.date(), instance.content_type_id, -1)
+
+    def rebuild(self):
+        """
+        Recount every item. Returns the number of item counts stored.
+
+        """
+        Item = get_model('jellyroll','item')
+        counts = {}
+        for content_type_id, timestamp in Item.objects.values_list('content_type', 'timestamp').order_by().iterator():
+            key = (timestamp.date(), content_type_id)
+            counts[key] = counts.get(key, 0) + 1
+
+        self.all().delete()
+        for (date, content_type_id), count in counts.iteritems():
+            self.create(date=date, content_type_id=content_type_id, count=count)
+        return len(counts)
+    rebuild = transaction.commit_on_success(rebuild)
+
+    def counts_by_day(self, start, end, content_types=None):
+        """
+        Return a dictionary mapping each day from ``start`` to ``end`` (dates,
+        inclusive) that has items to how many there are, counting only items
+        of the given ``ContentType`` ids if ``content_types`` is given.
+
+        """
+        qs = self.filter(date__range=(start, end))
+        if content_types is not None:
+            qs = qs.filter(content_type__in=content_types)
+        counts = {}
+        for date, count in qs.values_list('date', 'count'):
+            counts[date] = counts.get(date, 0) + count
+        return counts
+
+
+class ProviderRunManager(models.Manager):
+
+    def record(self, provider, started, seconds, succeeded, report):
+        """
+        Store the ``report`` (which must be JSON-serializable) of a run of
+        ``provider``, then drop all but the latest
+        ``settings.JELLYROLL_PROVIDER_RUN_HISTORY`` (default 500) of its runs.
+
+        """
+        run = self.create(provider=provider, started=started, seconds=seconds,
+                          succeeded=succeeded, report=simplejson.dumps(report))
+        keep = getattr(settings, 'JELLYROLL_PROVIDER_RUN_HISTORY', 500)
+        runs = self.filter(provider=provider)
+        # By primary key, not by a ``started`` cutoff, which would also take
+        # any later runs tied with it.
+        old = runs.order_by('-started', '-id').values_list('id', flat=True)[keep:]
+        old = list(old)
+        if old:
+            self.filter(pk__in=old).delete()
+        return run
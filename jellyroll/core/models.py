@@ -5,10 +5,12 @@ from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes import generic
 from django.db import models
+from django.db.models import signals
 from django.utils import simplejson, text
 from django.utils.encoding import smart_unicode
 
-from jellyroll.core.managers import ItemManager
+from jellyroll.core.managers import hash_source_id, ItemManager, HttpValidatorManager, CheckpointManager, \
+    CacheEntryManager, ItemCountManager, ProviderRunManager
 from tagging.fields import TagField
 
 
@@ -24,13 +26,17 @@ class Item(models.Model):
     
     # "Standard" metadata each object provides.
     url = models.URLField(blank=True, max_length=1000)
-    timestamp = models.DateTimeField()
+    timestamp = models.DateTimeField(db_index=True)
     tags = TagField(max_length=2500)
     
     # Metadata about where the object "came from" -- used by data providers to
     # figure out which objects to update when asked.
     source = models.CharField(max_length=100, blank=True)
     source_id = models.TextField(blank=True)
+    # A hash of source_id, since it's too long to index. The composite
+    # indexes on (source, source_id_hash) and (content_type, timestamp) are
+    # created by sql/item.sql, as this version of Django can't declare them.
+    source_id_hash = models.CharField(max_length=32, blank=True, editable=False)
     
     # Denormalized object __unicode__, for performance 
     object_str = models.TextField(blank=True)
@@ -49,6 +55,133 @@ class Item(models.Model):
         return cmp(self.timestamp, other.timestamp)
     
     def save(self, force_insert=False, force_update=False):
-        ct = "%s_%s" % (self.content_type.app_label, self.content_type.model.lower())
         self.object_str = smart_unicode(self.object)
+        self.source_id_hash = hash_source_id(self.source_id)
         super(Item, self).save(force_insert, force_update)
+
+signals.post_save.connect(Item.objects.invalidate_bounds, sender=Item)
+signals.post_save.connect(Item.objects.bump_version, sender=Item)
+signals.post_delete.connect(Item.objects.invalidate_bounds, sender=Item)
+signals.post_delete.connect(Item.objects.forget_tags, sender=Item)
+
+
+class ItemCount(models.Model):
+    """
+    How many items of a type there are on a day, kept up to date by
+    ``ItemManager.create_or_update`` so traffic graphs and calendars don't
+    have to count items. ``./manage.py jellyroll_rebuild_counts`` recounts
+    them from scratch.
+    """
+    date         = models.DateField()
+    content_type = models.ForeignKey(ContentType)
+    count        = models.PositiveIntegerField(default=0)
+
+    objects = ItemCountManager()
+
+    class Meta:
+        unique_together = [("date", "content_type")]
+        app_label = "jellyroll"
+
+    def __unicode__(self):
+        return u"%s %s: %s" % (self.date, self.content_type, self.count)
+
+signals.post_delete.connect(ItemCount.objects.decrement_item, sender=Item)
+
+
+class HttpValidator(models.Model):
+    """
+    The cache validators (``ETag`` and ``Last-Modified``) last served for a
+    structured data URL, so providers can make conditional GETs and skip
+    feeds that haven't changed.
+    """
+    url_hash      = models.CharField(max_length=32, unique=True)
+    url           = models.TextField()
+    etag          = models.CharField(max_length=250, blank=True)
+    last_modified = models.CharField(max_length=100, blank=True)
+    updated       = models.DateTimeField(auto_now=True)
+
+    objects = HttpValidatorManager()
+
+    class Meta:
+        app_label = "jellyroll"
+
+    def __unicode__(self):
+        return self.url
+
+
+class Checkpoint(models.Model):
+    """
+    How far a provider got the last time it updated a model -- optionally
+    within a narrower ``scope``, such as a single code repository -- so that
+    incremental updates can start without scanning ``Item`` and interrupted
+    crawls can pick up where they stopped.
+
+    ``timestamp`` is the high-water mark of what has been handled; ``page``
+    and ``cursor`` are for the provider to use as it sees fit (e.g. the page
+    a crawl was on, or the last revision seen).
+    """
+    provider  = models.CharField(max_length=100)
+    model     = models.CharField(max_length=100)
+    scope     = models.CharField(max_length=100, blank=True)
+    timestamp = models.DateTimeField(blank=True, null=True)
+    page      = models.PositiveIntegerField(blank=True, null=True)
+    cursor    = models.TextField(blank=True)
+    updated   = models.DateTimeField(auto_now=True)
+
+    objects = CheckpointManager()
+
+    class Meta:
+        unique_together = [("provider", "model", "scope")]
+        app_label = "jellyroll"
+
+    def __unicode__(self):
+        return u":".join([ bit for bit in (self.provider, self.model, self.scope) if bit ])
+
+
+class CacheEntry(models.Model):
+    """
+    A cached value (stored as JSON) that outlives a single update run, such
+    as the tags last.fm reports for an artist. Entries expire after a while,
+    and the least recently used are pruned when a namespace grows too big.
+    """
+    namespace = models.CharField(max_length=100)
+    key_hash  = models.CharField(max_length=32)
+    key       = models.TextField()
+    value     = models.TextField()
+    expires   = models.DateTimeField()
+    accessed  = models.DateTimeField()
+
+    objects = CacheEntryManager()
+
+    class Meta:
+        unique_together = [("namespace", "key_hash")]
+        app_label = "jellyroll"
+
+    def __unicode__(self):
+        return u"%s:%s" % (self.namespace, self.key)
+
+
+class ProviderRun(models.Model):
+    """
+    The report (see ``Provider.get_report``) of a provider's update, kept so
+    that a provider that got slower, or started failing, can be compared with
+    its earlier runs.
+    """
+    provider  = models.CharField(max_length=100, db_index=True)
+    started   = models.DateTimeField(db_index=True)
+    seconds   = models.FloatField()
+    succeeded = models.BooleanField()
+    report    = models.TextField()
+
+    objects = ProviderRunManager()
+
+    class Meta:
+        ordering = ['-started']
+        get_latest_by = 'started'
+        app_label = "jellyroll"
+
+    def __unicode__(self):
+        return u"%s at %s" % (self.provider, self.started)
+
+    def get_report(self):
+        return simplejson.loads(self.report)
@@ -0,0 +1,137 @@
+"""
+What jellyroll knows about providers without importing them.
+
+Deciding which providers can run only takes their name, class and the
+settings and modules they need, so the providers that ship with jellyroll
+are described here by ``ProviderInfo`` objects; ``jellyroll.update`` only
+imports and builds the providers it's actually going to run. Providers from
+elsewhere can ``register`` their own ``ProviderInfo``; otherwise they are
+imported once to read their ``Meta``.
+
+"""
+import imp
+import logging
+log = logging.getLogger("jellyroll.registry")
+import sys
+
+from django.conf import settings
+
+
+class ProviderInfo(object):
+    """
+    A provider: the ``module`` it's defined (and registered) in, its
+    ``class_name``, and the ``settings`` and ``modules`` it needs, as in its
+    ``Meta``. Calling it imports the module and returns a new provider.
+
+    """
+    def __init__(self, module, class_name, settings=(), modules=()):
+        self.module = module
+        self.class_name = class_name
+        self.settings = tuple(settings)
+        self.modules = tuple(modules)
+
+    def __repr__(self):
+        return "<ProviderInfo: %s.%s>" % (self.module, self.class_name)
+
+    def __call__(self):
+        return self.load()()
+
+    def missing_settings(self):
+        return [ name for name in self.settings if not hasattr(settings, name) ]
+
+    def missing_modules(self):
+        return [ name for name in self.modules if not module_available(name) ]
+
+    def enabled(self):
+        """
+        Whether the provider's settings are set and the modules it needs are
+        installed, found without importing either it or them.
+
+        """
+        for name in self.missing_settings():
+            log.debug("%s needs the setting %s, which is not set.", self.module, name)
+            return False
+        for name in self.missing_modules():
+            log.debug("%s needs the module %s, which is not installed.", self.module, name)
+            return False
+        return True
+
+    def load(self):
+        """
+        Import and return the provider class.
+
+        """
+        mod = __import__(self.module, {}, {}, [self.class_name])
+        return getattr(mod, self.class_name)
+
+def module_available(name):
+    """
+    Whether the (possibly dotted) module ``name`` could be imported, found
+    without importing it.
+
+    """
+    if name in sys.modules:
+        return True
+    path = None
+    for part in name.split('.'):
+        try:
+            f, pathname, description = imp.find_module(part, path)
+        except ImportError:
+            return False
+        if f is not None:
+            f.close()
+        path = [pathname]
+    return True
+
+GOOGLE_SETTINGS = ('GOOGLE_USERNAME', 'GOOGLE_PASSWORD')
+
+BUILTIN_PROVIDERS = [
+    ProviderInfo('jellyroll.providers.delicious', 'DeliciousProvider',
+                 settings=('DELICIOUS_USERNAME', 'DELICIOUS_PASSWORD')),
+    ProviderInfo('jellyroll.providers.flickr', 'FlickrProvider',
+                 settings=('FLICKR_API_KEY', 'FLICKR_USER_ID')),
+    ProviderInfo('jellyroll.providers.gitscm', 'GitSCMProvider',
+                 modules=('git',)),
+    ProviderInfo('jellyroll.providers.gsearch', 'GoogleSearchProvider',
+                 settings=GOOGLE_SETTINGS),
+    ProviderInfo('jellyroll.providers.lastfm', 'LastfmProvider',
+                 settings=('LASTFM_USERNAME',)),
+    ProviderInfo('jellyroll.providers.svn', 'SubversionProvider',
+                 modules=('pysvn',)),
+    ProviderInfo('jellyroll.providers.twitter', 'TwitterProvider',
+                 settings=('TWITTER_USERNAME',)),
+    ProviderInfo('jellyroll.providers.youtube', 'YoutubeProvider',
+                 settings=GOOGLE_SETTINGS, modules=('gdata',)),
+]
+
+_registry = dict((info.module, info) for info in BUILTIN_PROVIDERS)
+
+def register(info):
+    """
+    Describe a provider with a ``ProviderInfo``, so it can be found without
+    being imported.
+
+    """
+    _registry[info.module] = info
+
+def get_provider_info(name):
+    """
+    Return the ``ProviderInfo`` for the provider module ``name``. A provider
+    that hasn't been described is imported to find out about it; raises
+    ``ImportError`` if that fails or it doesn't register a provider.
+
+    """
+    try:
+        return _registry[name]
+    except KeyError:
+        pass
+
+    from jellyroll.providers import get_registered_provider
+    mod = __import__(name, {}, {}, [''])
+    class_name = get_registered_provider(name)
+    if class_name is None:
+        raise ImportError("%s doesn't register a provider" % name)
+    meta = getattr(mod, class_name)._meta
+    info = ProviderInfo(name, class_name, getattr(meta, 'settings', ()), getattr(meta, 'modules', ()))
+    _registry[name] = info
+    return info
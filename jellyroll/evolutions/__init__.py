@@ -8,4 +8,6 @@ SEQUENCE = [
     'item_url_max_length',
     'track_url_max_length',
     'photo_add_farm_id',
+    'item_add_indexes',
+    'codecommit_add_timestamp',
 ]
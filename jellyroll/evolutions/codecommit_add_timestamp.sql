@@ -0,0 +1,3 @@
+ALTER TABLE jellyroll_codecommit ADD COLUMN timestamp timestamp with time zone NULL;
+UPDATE jellyroll_codecommit SET timestamp = (SELECT i.timestamp FROM jellyroll_item i, django_content_type ct WHERE ct.app_label = 'jellyroll' AND ct.model = 'codecommit' AND i.content_type_id = ct.id AND i.object_id = jellyroll_codecommit.id::text);
+CREATE INDEX jellyroll_codecommit_repository_timestamp ON jellyroll_codecommit (repository_id, timestamp);
@@ -0,0 +1,5 @@
+ALTER TABLE jellyroll_item ADD COLUMN source_id_hash varchar(32) NOT NULL DEFAULT '';
+UPDATE jellyroll_item SET source_id_hash = md5(source_id);
+CREATE INDEX jellyroll_item_timestamp ON jellyroll_item (timestamp);
+CREATE INDEX jellyroll_item_content_type_timestamp ON jellyroll_item (content_type_id, timestamp);
+CREATE INDEX jellyroll_item_source_source_id_hash ON jellyroll_item (source, source_id_hash);
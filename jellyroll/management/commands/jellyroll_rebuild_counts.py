@@ -0,0 +1,12 @@
+from django.core.management.base import NoArgsCommand
+
+from jellyroll.models import ItemCount
+
+
+class Command(NoArgsCommand):
+    help = "Recount the daily item counts used by traffic graphs and the calendar views."
+
+    def handle_noargs(self, **options):
+        count = ItemCount.objects.rebuild()
+        if int(options.get('verbosity', 1)) > 0:
+            print "Stored %s daily item counts." % count
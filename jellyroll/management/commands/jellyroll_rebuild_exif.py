@@ -0,0 +1,12 @@
+from django.core.management.base import NoArgsCommand
+
+from jellyroll.contrib.photo.models import PhotoExif
+
+
+class Command(NoArgsCommand):
+    help = "Refill the searchable EXIF columns (camera, lens, focal length, ...) from each photo's EXIF data."
+
+    def handle_noargs(self, **options):
+        count = PhotoExif.objects.rebuild()
+        if int(options.get('verbosity', 1)) > 0:
+            print "Stored EXIF data for %s photos." % count
@@ -3,6 +3,7 @@ import optparse
 import jellyroll
 
 from django.core.management.base import BaseCommand
+from django.utils import simplejson
 
 
 class Command(BaseCommand):
@@ -19,6 +20,18 @@ class Command(BaseCommand):
             action="store_true", 
             help="Display a list of active data providers."
         ),
+        optparse.make_option(
+            "-w", "--workers",
+            dest="workers",
+            type="int",
+            help="Number of providers to update at once (default: JELLYROLL_UPDATE_WORKERS, or 1)."
+        ),
+        optparse.make_option(
+            "-j", "--json",
+            dest="json",
+            action="store_true",
+            help="Print each provider's run report as JSON."
+        ),
     )
     
     def handle(self, *args, **options):
@@ -44,14 +57,27 @@ class Command(BaseCommand):
                     self.print_providers()
                     return 0
 
-        jellyroll.update(options['providers'])
+        results = jellyroll.update(options['providers'], workers=options.get('workers'))
+        if options.get('json'):
+            self.print_reports(results)
+        elif level <= logging.INFO:
+            self.print_timings(results)
 
     def available_providers(self):
-        return jellyroll.active_providers()
+        return jellyroll.available_providers()
 
     def print_providers(self):
         available = sorted(self.available_providers().keys())
         print "Available data providers:"
         for provider in available:
             print "   ", provider
-        
+
+    def print_timings(self, results):
+        print "Provider update times:"
+        for provider in sorted(results.keys()):
+            succeeded, elapsed, report = results[provider]
+            print "    %-40s %8.2fs%s" % (provider, elapsed, not succeeded and " (failed)" or "")
+
+    def print_reports(self, results):
+        reports = dict((provider, report) for provider, (succeeded, elapsed, report) in results.items())
+        print simplejson.dumps(reports, indent=2, sort_keys=True)
@@ -1 +1 @@
-from jellyroll.core.models import Item
+from jellyroll.core.models import Item, HttpValidator, Checkpoint, CacheEntry, ItemCount, ProviderRun
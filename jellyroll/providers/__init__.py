@@ -3,14 +3,21 @@ import logging
 log = logging.getLogger("jellyroll.provider")
 import urllib
 import logging
+import time
 
 from django.utils.encoding import smart_unicode, smart_str
 from django.db.models.loading import get_model
+from django.db.models import signals
 from django.conf import settings
-from django.db import transaction
+from django.db import connection, models, transaction
+from django.utils import simplejson
+from tagging.fields import TagField
 
-from jellyroll.core.models import Item
+from jellyroll.core.models import Item, HttpValidator, Checkpoint
+from jellyroll.core.instrumentation import StatementCounter
+from jellyroll.core.managers import hash_source_id
 from jellyroll.providers import utils
+from jellyroll.providers.utils.stats import RunStats
 
 
 class Options(object):
@@ -59,6 +66,14 @@ class ProviderException(Exception):
 class ProviderNotEnabled(ProviderException):
     pass
 
+class NotModified(ProviderException):
+    """
+    Raised by ``get_update_data`` when the source hasn't changed since the last
+    update, in which case there is nothing for ``update_<model>`` to do.
+
+    """
+    pass
+
 class Provider(object):
     """ 
     The base class for the Jellyroll Provider subsystem.
@@ -122,6 +137,10 @@ class Provider(object):
         self.updater_funcs = {}
         self.call_queue = {}
         self.incoming = {}
+        self.prefetched_objects = None
+        self.prefetched_items = None
+        self.checkpoints = {}
+        self.stats = RunStats()
 
     # Abstract methods
     def source_id(self, model_cls, extra):
@@ -151,8 +170,29 @@ class Provider(object):
         associated with the last item bound with the model given by ``model_cls``,
         created by this provider.
 
+        By default this is the timestamp of the provider's ``Checkpoint`` for
+        ``model_cls`` (and the scope given by ``checkpoint_scope(model_cls, kwargs)``).
+
         """
-        raise NotImplementedError()
+        return self.get_checkpoint(model_cls,kwargs).timestamp
+
+    def scan_last_updated(self, model_cls, extra):
+        """
+        This method is used to seed a provider's ``Checkpoint`` the first time it
+        is needed, and should find the date of the latest item bound with the model
+        given by ``model_cls`` (within the scope given by ``extra``) the slow way.
+
+        """
+        return Item.objects.get_last_update_of_model(model_cls)
+
+    def checkpoint_scope(self, model_cls, extra):
+        """
+        This method returns the checkpoint scope -- a string -- that the data
+        object (or ``get_last_updated`` keyword arguments) ``extra`` falls into.
+        By default each model has a single, unscoped checkpoint.
+
+        """
+        return ""
 
     # Core methods
     def prepare(self):
@@ -239,11 +279,51 @@ class Provider(object):
         """
         This method is the public entry-point.
 
+        While it runs, the provider's HTTP requests, records and database
+        statements are counted in ``self.stats``; see ``get_report``.
+
         """
         self.prepare()
 
-        self.update_main()
-        self.handle_main()
+        session_pool = utils.get_session_pool()
+        session_pool.add_observer(self.stats.observe_request)
+        counter = StatementCounter(connection)
+        counter.install()
+        try:
+            began = time.time()
+            self.update_main()
+            self.stats.add_phase('update_main', time.time() - began)
+
+            began = time.time()
+            self.handle_main()
+            self.stats.add_phase('handle_main', time.time() - began)
+        finally:
+            counter.uninstall()
+            self.stats.queries += counter.statements
+            session_pool.remove_observer(self.stats.observe_request)
+
+    def get_report(self):
+        """
+        Return a report of the last ``run_update``, as a dictionary that can be
+        serialized as JSON: HTTP requests (count, bytes, latency histogram),
+        records (fetched, created, updated, skipped, failed), database
+        statements, cache hits (see ``get_cache_stats``) and the time spent
+        in each phase. ``handle_chunks`` is the part of ``update_main`` and
+        ``handle_main`` spent handling records, since generator updaters
+        handle theirs as they're produced.
+
+        """
+        report = self.stats.as_dict()
+        report['caches'] = self.get_cache_stats()
+        return report
+
+    def get_cache_stats(self):
+        """
+        Return ``{name: {'hits': hits, 'misses': misses}}`` for the caches
+        this provider uses. By default it doesn't use any.
+
+        """
+        return {}
 
     def update_main(self):
         """
@@ -253,6 +333,12 @@ class Provider(object):
         like to change the behaviour of ``update`` you should instead override the
         ```` method.
 
+        Alternatively, an ``update_<model>`` method may be a generator that yields
+        its data objects rather than collecting them in ``self.incoming``. Those are
+        handled as they are produced, a chunk at a time (see ``handle_records``),
+        so memory use doesn't grow with the size of the backlog and whatever has
+        been handled is kept even if the crawl fails part way through.
+
         """
         update_queue = self.updater_funcs.keys()
         if self.call_queue:
@@ -260,7 +346,15 @@ class Provider(object):
 
         for model_str in update_queue:
             func = self.updater_funcs[model_str]
-            func( self.get_update_data(self.registered_classes[model_str],model_str) )
+            try:
+                data = self.get_update_data(self.registered_classes[model_str],model_str)
+            except NotModified:
+                log.info("No changes to %s data for %s; skipping update." % (model_str,self.__class__.__name__))
+                continue
+
+            records = func( data )
+            if records is not None:
+                self.handle_records(model_str, records)
 
     def handle_main(self):
         """
@@ -273,31 +367,228 @@ class Provider(object):
             handle_queue.sort( cmp=lambda x,y: cmp(self.call_queue[x],self.call_queue[y]) )
 
         for model_str in handle_queue:
+            if model_str in self.incoming:
+                self.handle_records(model_str, self.incoming[model_str])
 
-            def default_func(model_str, model_cls, data):
-                try:
-                    func = self.handler_funcs[model_str]
-                except KeyError:
-                    func = self.handle_default
+    def get_chunk_size(self):
+        """
+        Return the number of records handled per transaction: ``Meta.chunk_size``
+        if the provider sets it, else ``settings.JELLYROLL_HANDLE_CHUNK_SIZE``
+        (default 100).
 
-                self.pre_handle_default(model_str,model_cls,data)
-                (model_instance,created) = func(model_str, model_cls,data)
-                self.post_handle_default(model_instance,model_str,model_cls,data,created)
+        """
+        return getattr(self._meta, 'chunk_size', None) or \
+            getattr(settings, 'JELLYROLL_HANDLE_CHUNK_SIZE', 100)
 
-                return (model_instance,created)
-            default_func = transaction.commit_on_success( default_func )
+    def handle_records(self, model_str, records):
+        """
+        Handle ``records`` (data objects of the model given by ``model_str``)
+        in chunks of ``get_chunk_size()``; see ``handle_chunk``.
+
+        """
+        model_cls = self.registered_classes[model_str]
+        chunk = []
+        for data in records:
+            self.stats.fetched += 1
+            chunk.append( data )
+            if len(chunk) >= self.get_chunk_size():
+                self.timed_handle_chunk(model_str, model_cls, chunk)
+                chunk = []
+        if chunk:
+            self.timed_handle_chunk(model_str, model_cls, chunk)
+
+        self.complete_checkpoints(model_cls)
+
+    def timed_handle_chunk(self, model_str, model_cls, records):
+        began = time.time()
+        try:
+            self.handle_chunk(model_str, model_cls, records)
+        finally:
+            self.stats.add_phase('handle_chunks', time.time() - began)
+        # The chunk is committed now; tag usage worked out while it was
+        # still being handled wouldn't have seen its changes.
+        Item.objects.invalidate_tag_usage()
+
+    def handle_chunk(self, model_str, model_cls, records):
+        """
+        Handle a chunk of data objects inside a single transaction.
 
-            for data in self.incoming[model_str]:
+        Existing model instances and ``Item`` objects for the whole chunk are
+        loaded up front (see ``prefetch``), and the automatic ``Item`` updates
+        that ``ItemManager.follow_model`` wires up are suspended, since
+        ``handle_item`` takes care of those itself. Each record still gets its
+        own savepoint, so a failing record is logged and skipped without
+        taking the rest of the chunk with it. Databases without savepoints
+        (SQLite and MySQL, to this version of Django) commit each record that
+        succeeds instead, so that a failing one can be rolled back alone.
+
+        """
+        try:
+            handler = self.handler_funcs[model_str]
+        except KeyError:
+            handler = self.handle_default
+        use_savepoints = connection.features.uses_savepoints
+
+        handled = []
+        self.prefetch(model_cls, records)
+        signals.post_save.disconnect(Item.objects.create_or_update, sender=model_cls)
+        try:
+            for data in records:
+                if use_savepoints:
+                    sid = transaction.savepoint()
+                known_items = self.prefetched_items.copy()
+                model_instance, created = None, False
                 try:
-                    model_cls = self.registered_classes[model_str]
-                    (model_instance,created) = default_func( model_str, model_cls, data )
+                    self.pre_handle_default(model_str,model_cls,data)
+                    (model_instance,created) = handler(model_str,model_cls,data)
+                    self.post_handle_default(model_instance,model_str,model_cls,data,created)
+
                     self.pre_handle_item( model_instance, data, created )
                     item_instance = self.handle_item( model_instance, data, created )
                     self.post_handle_item( item_instance, model_instance, data, created )
                 except Exception, e:
+                    if use_savepoints:
+                        transaction.savepoint_rollback(sid)
+                    else:
+                        transaction.rollback()
+                    # Forget what was prefetched for rows that were just rolled back.
+                    self.prefetched_items = known_items
+                    if created:
+                        self.prefetched_objects.pop(model_instance._get_pk_val(), None)
+                    self.stats.failed += 1
                     log.error( "Encountered exception while processing for %s for %s: %s" % \
                                    (data,model_str,str(e)))
-                    
+                else:
+                    if use_savepoints:
+                        transaction.savepoint_commit(sid)
+                    else:
+                        transaction.commit()
+                    if created:
+                        self.stats.created += 1
+                    handled.append( data )
+
+            self.post_handle_chunk(model_str, model_cls, handled)
+            self.advance_checkpoints(model_cls, handled)
+        finally:
+            if model_cls in Item.objects.models_by_name.values():
+                signals.post_save.connect(Item.objects.create_or_update, sender=model_cls)
+            self.prefetched_objects = self.prefetched_items = None
+    handle_chunk = transaction.commit_on_success(handle_chunk)
+
+    def prefetch(self, model_cls, records):
+        """
+        Load the existing ``Item`` objects and ``model_cls`` instances for the
+        data objects in ``records`` with one query each, keyed by source id and
+        primary key respectively, for ``find_item`` and ``handle_default``.
+
+        """
+        self.prefetched_items = {}
+        self.prefetched_objects = {}
+
+        source_ids = []
+        for data in records:
+            try:
+                source_ids.append( self.source_id(model_cls,data) )
+            except NotImplementedError:
+                break
+            except Exception:
+                # leave it to the record's own handling to fail
+                continue
+        if source_ids:
+            items = Item.objects.filter(source=self.__class__.__name__, 
+                                        source_id_hash__in=[ hash_source_id(id) for id in source_ids ])
+            for item in items:
+                self.prefetched_items[item.source_id] = item
+
+        pk_field = model_cls._meta.pk
+        pks = [ data[pk_field.name] for data in records if pk_field.name in data ]
+        pks.extend([ pk_field.to_python(item.object_id) for item in self.prefetched_items.values() ])
+        if pks:
+            self.prefetched_objects = model_cls.objects.in_bulk(pks)
+
+    def get_checkpoint(self, model_cls, extra=None):
+        """
+        Return this provider's ``Checkpoint`` for ``model_cls`` in the scope that
+        ``extra`` falls into (see ``checkpoint_scope``). A checkpoint that doesn't
+        exist yet is seeded from ``scan_last_updated``, but not saved.
+
+        """
+        extra = extra or {}
+        scope = self.checkpoint_scope(model_cls,extra)
+        try:
+            return self.checkpoints[(model_cls,scope)]
+        except KeyError:
+            pass
+
+        checkpoint = Checkpoint.objects.get_for(self,model_cls,scope)
+        if checkpoint.pk is None:
+            checkpoint.timestamp = self.scan_last_updated(model_cls,extra)
+        self.checkpoints[(model_cls,scope)] = checkpoint
+        return checkpoint
+
+    def advance_checkpoints(self, model_cls, records):
+        """
+        This method is called at the end of each chunk, inside its transaction,
+        with the data objects that were handled successfully, and moves the
+        checkpoints they fall into forward to the newest ``timestamp`` among them.
+        Checkpoints that have only been seeded are saved as well, since their
+        seed may already take in the chunk's own items.
+
+        This is right for sources read oldest first. Sources read newest first
+        should override it (and ``complete_checkpoints``) so that an interrupted
+        crawl doesn't leave a high-water mark above data it never reached.
+
+        """
+        advanced = {}
+        for data in records:
+            if data.get('timestamp') is None:
+                continue
+            timestamp = utils.localdate(data['timestamp'])
+            checkpoint = self.get_checkpoint(model_cls,data)
+            if checkpoint.timestamp is None or timestamp > checkpoint.timestamp:
+                checkpoint.timestamp = timestamp
+                advanced[id(checkpoint)] = checkpoint
+            elif checkpoint.pk is None:
+                advanced[id(checkpoint)] = checkpoint
+
+        for checkpoint in advanced.values():
+            checkpoint.save()
+
+    def complete_checkpoints(self, model_cls):
+        """
+        This method is called once every data object for ``model_cls`` has been
+        handled, for providers that need to finalize their checkpoints.
+
+        """
+        pass
+
+    def find_item(self, model_cls, data):
+        """
+        Return the ``Item`` for the data object ``data``, as ``Item.objects.find``
+        would, but from the chunk's prefetched items when there are any. Raises
+        ``Item.DoesNotExist`` if there is no such item.
+
+        """
+        if self.prefetched_items is None:
+            return Item.objects.find(self,model_cls,data)
+        try:
+            return self.prefetched_items[self.source_id(model_cls,data)]
+        except KeyError:
+            raise Item.DoesNotExist()
+
+    def get_existing_object(self, model_cls, pk):
+        """
+        Return the ``model_cls`` instance with primary key ``pk``, from the chunk's
+        prefetched objects when there are any. Raises ``model_cls.DoesNotExist``
+        if there is no such instance.
+
+        """
+        if self.prefetched_objects is None:
+            return model_cls.objects.get(pk=pk)
+        try:
+            return self.prefetched_objects[model_cls._meta.pk.to_python(pk)]
+        except KeyError:
+            raise model_cls.DoesNotExist()
 
     def pre_handle_default(self, model_str, model_cls, data):
         """
@@ -328,22 +619,20 @@ class Provider(object):
         # TODO: add exception handling if we encounter something that isn't derived 
         #       from django.db.models.Model so that users will find it easier to 
         #       avoid ignorance.
-        defaults = {}
-        primary_key = model_cls()._meta.pk.name
-
-        for field in iter( self.get_default_fields(model_cls) ):
-            defaults[field.name] = data[field.name]
+        fields = self.get_default_fields(model_cls)
+        primary_key = model_cls._meta.pk.name
 
         obj, created = (None, False)
         if primary_key in data:
-            obj, created = model_cls.objects.get_or_create(
-                pk = data[primary_key],
-                defaults = defaults
-            )
+            try:
+                obj = self.get_existing_object(model_cls,data[primary_key])
+            except model_cls.DoesNotExist:
+                obj = model_cls(**{primary_key: data[primary_key]})
+                created = True
         else:
             try:
-                item = Item.objects.find(self,model_cls,data)
-                obj = item.object
+                item = self.find_item(model_cls,data)
+                obj = self.get_existing_object(model_cls,item.object_id)
             except Item.DoesNotExist:
                 obj = model_cls()
                 created = True
@@ -352,10 +641,31 @@ class Provider(object):
                           "found. Processing with the default implementation of the method "
                           "handle_default cannot continue. Please implement either of these two "
                           "options to enable processing %s." % (model_cls,self.__class__,model_cls))
-                return
+                raise
+
+        # Only write rows that are new or have actually changed.
+        changed = False
+        for field in fields:
+            value = data[field.name]
+            current = getattr(obj,field.attname)
+            if isinstance(value, models.Model):
+                compare_to = value._get_pk_val()
+            else:
+                compare_to = value
+            try:
+                changed = changed or current != compare_to
+            except TypeError:
+                # e.g. naive vs. timezone-aware datetimes
+                changed = True
+            setattr(obj,field.name,value)
 
-        for field in iter( self.get_default_fields(model_cls) ):
-            setattr(obj,field.name,defaults[field.name])
+        if created:
+            obj.save(force_insert=True)
+            if self.prefetched_objects is not None:
+                self.prefetched_objects[obj._get_pk_val()] = obj
+        elif changed:
+            obj.save(force_update=True)
+            self.stats.updated += 1
 
         return (obj,created)
 
@@ -402,23 +712,12 @@ class Provider(object):
         ``django.db.models.Model`` instance ``obj`` which ``Item`` is 'following'.
 
         """
-        item = None
         provider_cls = self.__class__
         model_cls = model_instance.__class__
 
-        if hasattr(self,'source_id'):
-            try:
-                item = Item.objects.find(self,model_cls,data)
-            except Item.DoesNotExist:
-                item = Item.objects.create_or_update(
-                    instance = model_instance,
-                    timestamp = data['timestamp'],
-                    source = provider_cls.__name__,
-                    source_id = self.source_id(model_cls,data),
-                    url = data['url'],
-                    tags = data['tags'],
-                )
-        elif created:
+        try:
+            item = self.find_item(model_cls,data)
+        except Item.DoesNotExist:
             item = Item.objects.create_or_update(
                 instance = model_instance,
                 timestamp = data['timestamp'],
@@ -427,9 +726,41 @@ class Provider(object):
                 url = data['url'],
                 tags = data['tags'],
             )
+            if item is not None and self.prefetched_items is not None:
+                self.prefetched_items[item.source_id] = item
+        else:
+            # The automatic update is disconnected while chunks are handled
+            # (see ``handle_chunk``), so bring a changed item up to date here.
+            if self.item_is_stale(item, model_instance, data):
+                item = Item.objects.create_or_update(
+                    instance = model_instance,
+                    item = item,
+                    timestamp = data['timestamp'],
+                    source = item.source,
+                    source_id = item.source_id,
+                    url = data['url'],
+                    tags = data['tags'],
+                )
 
         return item
 
+    def item_is_stale(self, item, model_instance, data):
+        """
+        Return ``True`` if ``item`` doesn't have the timestamp, url and tags
+        that ``Item.objects.create_or_update`` would give it for
+        ``model_instance`` and the data object ``data``.
+
+        """
+        timestamp = getattr(model_instance, 'timestamp', None) or data['timestamp']
+        url = data['url'] or getattr(model_instance, 'url', None)
+        tags = data['tags']
+        if not tags:
+            for f in model_instance._meta.fields:
+                if isinstance(f, TagField):
+                    tags = getattr(model_instance, f.attname)
+                    break
+        return item.timestamp != timestamp or item.url != url or (item.tags or "") != (tags or "")
+
     def post_handle_item(self, item_instance, model_instance, data, created):
         """
         This method is executed after ``handle_item`` with (possibly recently created)
@@ -458,6 +789,16 @@ class Provider(object):
         """
         pass
 
+    def post_handle_chunk(self, model_str, model_cls, records):
+        """
+        This method is called once a chunk of data objects has been handled,
+        inside the chunk's transaction, with the data objects in ``records``
+        that were handled successfully. Providers can use it to do work for
+        the whole chunk at once rather than a record at a time.
+
+        """
+        pass
+
 class StructuredDataProvider(Provider):
     """
     ``Provider`` subclass that has baked-in processing facilities
@@ -479,6 +820,14 @@ class StructuredDataProvider(Provider):
             'json': lambda x:x,
             'rss': lambda x:x.entries,
             }
+        # parsers for content already fetched with a conditional GET
+        self.DATA_PARSERS = {
+            'xml': utils.etree.fromstring,
+            'json': simplejson.loads,
+            'rss': feedparser.parse,
+            }
+        self.conditional_get = getattr(settings,'JELLYROLL_CONDITIONAL_GET',True)
+        self.pending_validators = {}
 
     def get_custom_data_interface_instance(self, interface_cls):
         """
@@ -532,20 +881,70 @@ class StructuredDataProvider(Provider):
             except NotImplementedError:
                 return self.DATA_INTERFACES[model_str]
 
-        for model, content in self.DATA_URLS.iteritems():
-            if type(content) == type(dict()):
-                data_dict = {}
-                for alias, data_tuple in content.iteritems():
-                    processor = self.DATA_PROCESSORS[data_tuple[1]]
-                    data_dict[alias] = self.DATA_ITERATORS[data_tuple[1]](
-                        processor(data_tuple[0])
-                        )
-                return data_dict
-            else:
-                processor = self.DATA_PROCESSORS[content[1]]
-                return self.DATA_ITERATORS[content[1]](
-                    processor(content[0])
-                    )
+        content = self.DATA_URLS[model_str]
+        if type(content) == type(dict()):
+            # Aliased URLs are handed to ``update_<model>`` together, so only
+            # skip the update if none of them has changed.
+            data_dict = {}
+            unchanged = []
+            for alias, data_tuple in content.iteritems():
+                try:
+                    data_dict[alias] = self.fetch_data(*data_tuple)
+                except NotModified:
+                    unchanged.append( alias )
+            if len(unchanged) == len(content):
+                raise NotModified()
+            for alias in unchanged:
+                data_dict[alias] = self.fetch_data(conditional=False, *content[alias])
+            return data_dict
+        else:
+            return self.fetch_data(*content)
+
+    def fetch_data(self, url, format, conditional=True):
+        """
+        Fetch, parse and return an iterator over the structured data at ``url``.
+
+        Unless ``settings.JELLYROLL_CONDITIONAL_GET`` is ``False``, the request
+        carries the ``ETag`` and ``Last-Modified`` validators from the previous
+        fetch of ``url`` and raises ``NotModified`` if the server answers 304.
+        The new validators are only stored once the fetched data has been
+        handled (see ``save_validators``) so a failed run is retried in full.
+
+        """
+        if not (conditional and self.conditional_get):
+            processor = self.DATA_PROCESSORS[format]
+            return self.DATA_ITERATORS[format]( processor(url) )
+
+        url, username, password = utils.split_url_credentials(url)
+        validator = HttpValidator.objects.get_for_url(url)
+        headers = utils.DEFAULT_HTTP_HEADERS.copy()
+        if validator.etag:
+            headers['If-None-Match'] = validator.etag
+        if validator.last_modified:
+            headers['If-Modified-Since'] = validator.last_modified
+
+        response, content = utils.fetch_response(url, username=username, password=password, headers=headers)
+        if response.status == 304:
+            log.debug( "%s has not been modified since %s" % (url,validator.updated) )
+            raise NotModified()
+
+        # Error pages have validators of their own, which mustn't stand in for the data's.
+        if response.status == 200:
+            self.pending_validators[url] = (response.get('etag',''),response.get('last-modified',''))
+        return self.DATA_ITERATORS[format]( self.DATA_PARSERS[format](content) )
+
+    def save_validators(self):
+        """
+        Store the validators of every URL fetched during this update.
+
+        """
+        for url, (etag, last_modified) in self.pending_validators.iteritems():
+            HttpValidator.objects.set_for_url(url, etag, last_modified)
+        self.pending_validators = {}
+
+    def handle_main(self):
+        super(StructuredDataProvider,self).handle_main()
+        self.save_validators()
 
 class GDataProvider(Provider):
     """
@@ -555,7 +954,7 @@ class GDataProvider(Provider):
     """
     class Meta:
         settings = ('GOOGLE_USERNAME','GOOGLE_PASSWORD')
-        modules  = ('gdata')
+        modules  = ('gdata',)
 
     def __init__(self):
         super(GDataProvider,self).__init__()
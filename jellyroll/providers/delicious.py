@@ -76,8 +76,7 @@ class DeliciousProvider(StructuredDataProvider):
         return interface_cls(settings.DELICIOUS_USERNAME,settings.DELICIOUS_PASSWORD)
 
     def update_bookmark(self, delicious):
-        last_update_date = Item.objects.get_last_update_of_model(Bookmark)
-        bookmarks = self.incoming['bookmark'] = list()
+        last_update_date = self.get_last_updated(Bookmark)
 
         last_post_date = utils.parsedate(delicious.posts.update().get("time"))
         if last_post_date <= last_update_date:
@@ -95,6 +94,6 @@ class DeliciousProvider(StructuredDataProvider):
                     info['url'] = info['href']
                     info['timestamp'] = utils.parsedate(info['time'])
 
-                    bookmarks.append( info )
+                    yield info
 
 register_provider( DeliciousProvider )
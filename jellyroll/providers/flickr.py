@@ -1,4 +1,5 @@
 import datetime
+import time
 import logging
 log = logging.getLogger("jellyroll.providers.flickr")
 import urllib
@@ -9,7 +10,7 @@ from django.db import transaction
 from django.utils.encoding import smart_unicode
 
 from jellyroll.core.models import Item
-from jellyroll.contrib.photo.models import Photo, Photoset
+from jellyroll.contrib.photo.models import Photo, PhotoExif, Photoset
 from jellyroll.providers import utils, register_provider, StructuredDataProvider
 
 try:
@@ -17,6 +18,8 @@ try:
 except NameError:
     from sets import Set as set     # Python 2.3 fallback
 
+CURSOR_FORMAT = "%Y-%m-%d %H:%M:%S"
+
 
 class FlickrError(Exception):
     def __init__(self, code, message):
@@ -25,12 +28,13 @@ class FlickrError(Exception):
         return 'FlickrError %s: %s' % (self.code, self.message)
 
 class FlickrClient(object):
-    def __init__(self, api_key, method='flickr'):
+    def __init__(self, api_key, method='flickr', rate_limiter=None):
         self.api_key = api_key
         self.method = method
+        self.rate_limiter = rate_limiter
         
     def __getattr__(self, method):
-        return FlickrClient(self.api_key, '%s.%s' % (self.method, method))
+        return FlickrClient(self.api_key, '%s.%s' % (self.method, method), self.rate_limiter)
         
     def __repr__(self):
         return "<FlickrClient: %s>" % self.method
@@ -41,6 +45,8 @@ class FlickrClient(object):
         params['format'] = 'json'
         params['nojsoncallback'] = '1'
         url = "http://flickr.com/services/rest/?" + urllib.urlencode(params)
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait()
         json = utils.getjson(url)
         if json.get("stat", "") == "fail":
             raise FlickrError(json["code"], json["message"])
@@ -56,9 +62,19 @@ class FlickrProvider(StructuredDataProvider):
 
     def __init__(self):
         super(FlickrProvider,self).__init__()
-        data_interface = FlickrClient(settings.FLICKR_API_KEY)
-        self.register_custom_data_interface(data_interface,Photo)
-        self.register_custom_data_interface(data_interface,Photoset)
+        self.register_custom_data_interface(FlickrClient,Photo)
+        self.register_custom_data_interface(FlickrClient,Photoset)
+        self.client = None
+
+    def get_custom_data_interface_instance(self, interface_cls):
+        # Flickr allows 3600 API calls an hour per key: one a second on
+        # average, which the worker threads below can spend in bursts. They
+        # share the one limiter, and so the one client.
+        if self.client is None:
+            rate_limiter = utils.RateLimiter(getattr(settings, 'FLICKR_API_CALLS_PER_SECOND', 1),
+                                             getattr(settings, 'FLICKR_API_BURST', 60))
+            self.client = interface_cls(settings.FLICKR_API_KEY, rate_limiter=rate_limiter)
+        return self.client
 
     def source_id(self, model_cls, extra):
         if model_cls == Photo:
@@ -86,53 +102,110 @@ class FlickrProvider(StructuredDataProvider):
             return super(FlickrProvider,self).get_default_fields(model_cls)
 
     def update_photo(self, flickr):
-        last_update_date = Item.objects.get_last_update_of_model(Photo)
+        # Photos are listed newest taken first, so a crawl's high-water mark
+        # is only recorded once it finishes; until then the checkpoint's
+        # cursor remembers the newest and oldest photos handled, and an
+        # interrupted crawl carries on from the oldest. That's kept as a date
+        # rather than a page, since photos uploaded or deleted in the
+        # meantime would shift the pages under it.
+        checkpoint = self.get_checkpoint(Photo)
+        last_update_date = checkpoint.timestamp
         log.debug("Last update date: %s", last_update_date)
+        resume_from = None
+        if checkpoint.cursor:
+            resume_from = self.parse_cursor(checkpoint.cursor)[1]
+            log.debug("Resuming an interrupted crawl from photos taken at %s", resume_from)
 
         licenses = licenses = flickr.photos.licenses.getInfo()
         licenses = dict((l["id"], smart_unicode(l["url"])) for l in licenses["licenses"]["license"])
 
-        page = 1
-        keep_working = True
-        photo_list = self.incoming["photo"] = list()
-        while True:
-            log.debug("Fetching page %s of photos", page)
-            resp = flickr.people.getPublicPhotos(user_id=settings.FLICKR_USER_ID, extras="license,date_taken", 
-                                                 per_page="500", page=str(page))
-            photos = resp["photos"]
-            if page > photos["pages"]:
-                log.debug("Ran out of photos; stopping.")
-                return
-
-            for photodict in photos["photo"]:
-                timestamp = utils.parsedate(str(photodict["datetaken"]))
-                if timestamp < last_update_date:
-                    log.debug("Hit an old photo (taken %s; last update was %s); stopping.", 
-                              timestamp, last_update_date)
-                    break
-
-                obj = {}
-                obj['photo_id'] = smart_unicode(photodict["id"])
-                obj['cc_license'] = licenses[photodict["license"]]
-                obj['secret'] = smart_unicode(photodict["secret"])
-
-                info = flickr.photos.getInfo(photo_id=obj['photo_id'], secret=obj['secret'])["photo"]
-
-                obj['server_id'] = utils.safeint(info["server"])
-                obj['farm_id'] = utils.safeint(info["farm"])
-                obj['taken_by'] = smart_unicode(info["owner"]["username"])
-                obj['title'] = smart_unicode(info["title"]["_content"])
-                obj['description'] = smart_unicode(info["description"]["_content"])
-                obj['comment_count'] = utils.safeint(info["comments"]["_content"])
-                obj['date_uploaded'] = datetime.datetime.fromtimestamp(utils.safeint(info["dates"]["posted"]))
-                obj['date_updated'] = datetime.datetime.fromtimestamp(utils.safeint(info["dates"]["lastupdate"]))
-
-                obj['tags'] = self.convert_tags(info["tags"])
-                obj['timestamp'] = timestamp
-                obj['photoset'] = None
-
-                photo_list.append( obj )
-            page += 1
+        # Photo details take two API calls each (getInfo, and getExif for new
+        # photos), so they're fetched by a pool of worker threads while the
+        # next page of the listing is requested in the background. The
+        # threads only make HTTP calls; everything touching the database
+        # stays in this thread.
+        pool = utils.get_thread_pool(getattr(settings, 'FLICKR_WORKERS', 4))
+        try:
+            page = 1
+            pending = None
+            while True:
+                log.debug("Fetching page %s of photos", page)
+                if pending is None:
+                    resp = self.fetch_photo_page(flickr, page, resume_from)
+                else:
+                    resp = pending.get()
+                photos = resp["photos"]
+                if page > photos["pages"]:
+                    log.debug("Ran out of photos; stopping.")
+                    return
+                if page < photos["pages"]:
+                    pending = pool.apply_async(self.fetch_photo_page, (flickr, page+1, resume_from))
+                else:
+                    pending = None
+
+                objs = []
+                finished = False
+                for photodict in photos["photo"]:
+                    timestamp = utils.parsedate(str(photodict["datetaken"]))
+                    if timestamp < last_update_date:
+                        log.debug("Hit an old photo (taken %s; last update was %s); stopping.", 
+                                  timestamp, last_update_date)
+                        finished = True
+                        break
+
+                    obj = {}
+                    obj['photo_id'] = smart_unicode(photodict["id"])
+                    obj['cc_license'] = licenses[photodict["license"]]
+                    obj['secret'] = smart_unicode(photodict["secret"])
+                    obj['timestamp'] = timestamp
+                    obj['photoset'] = None
+                    objs.append(obj)
+
+                # Only new photos need their EXIF data fetched.
+                existing = set(Photo.objects.filter(
+                        pk__in=[ obj['photo_id'] for obj in objs ]).values_list('pk', flat=True))
+                for obj in objs:
+                    obj['fetch_exif'] = obj['photo_id'] not in existing
+
+                for obj in pool.map(lambda obj: self.fetch_photo_details(flickr, obj), objs):
+                    yield obj
+
+                if finished:
+                    return
+                page += 1
+        finally:
+            pool.close()
+            pool.join()
+
+    def fetch_photo_page(self, flickr, page, taken_before=None):
+        """
+        Fetch a page of the user's public photos, newest taken first, taken
+        no later than ``taken_before`` if it's given.
+
+        """
+        params = dict(user_id=settings.FLICKR_USER_ID, extras="license,date_taken",
+                      sort="date-taken-desc", per_page="500", page=str(page))
+        if taken_before is not None:
+            params['max_taken_date'] = taken_before.strftime(CURSOR_FORMAT)
+        return flickr.photos.search(**params)
+
+    def fetch_photo_details(self, flickr, obj):
+        info = flickr.photos.getInfo(photo_id=obj['photo_id'], secret=obj['secret'])["photo"]
+
+        obj['server_id'] = utils.safeint(info["server"])
+        obj['farm_id'] = utils.safeint(info["farm"])
+        obj['taken_by'] = smart_unicode(info["owner"]["username"])
+        obj['title'] = smart_unicode(info["title"]["_content"])
+        obj['description'] = smart_unicode(info["description"]["_content"])
+        obj['comment_count'] = utils.safeint(info["comments"]["_content"])
+        obj['date_uploaded'] = datetime.datetime.fromtimestamp(utils.safeint(info["dates"]["posted"]))
+        obj['date_updated'] = datetime.datetime.fromtimestamp(utils.safeint(info["dates"]["lastupdate"]))
+        obj['tags'] = self.convert_tags(info["tags"])
+
+        if obj.pop('fetch_exif'):
+            obj['exif'] = self.convert_exif(
+                flickr.photos.getExif(photo_id=obj['photo_id'], secret=obj['secret']))
+        return obj
 
     def update_photoset(self, flickr):
         resp = flickr.people.getInfo(user_id=settings.FLICKR_USER_ID)
@@ -141,7 +214,6 @@ class FlickrProvider(StructuredDataProvider):
 
         resp = flickr.photosets.getList(user_id=settings.FLICKR_USER_ID)
         sets = resp["photosets"]
-        photoset_list = self.incoming["photoset"] = list()
         for photosetdict in sets["photoset"]:
 
             obj = {}
@@ -154,19 +226,58 @@ class FlickrProvider(StructuredDataProvider):
             obj['title'] = smart_unicode(photosetdict["title"]["_content"])
             obj['description'] = smart_unicode(photosetdict["description"]["_content"])
 
-            photoset_list.append( obj )
+            yield obj
+
+    def advance_checkpoints(self, model_cls, records):
+        if model_cls != Photo:
+            return super(FlickrProvider,self).advance_checkpoints(model_cls,records)
+        if not records:
+            return
+
+        # Keep the newest and oldest photos handled by this crawl in the
+        # cursor until the crawl is complete.
+        checkpoint = self.get_checkpoint(Photo)
+        timestamps = [ data['timestamp'] for data in records ]
+        newest, oldest = max(timestamps), min(timestamps)
+        if checkpoint.cursor:
+            cursor_newest, cursor_oldest = self.parse_cursor(checkpoint.cursor)
+            newest, oldest = max(newest, cursor_newest), min(oldest, cursor_oldest)
+        checkpoint.cursor = "%s,%s" % (newest.strftime(CURSOR_FORMAT), oldest.strftime(CURSOR_FORMAT))
+        checkpoint.save()
+
+    def complete_checkpoints(self, model_cls):
+        if model_cls != Photo:
+            return
+        checkpoint = self.get_checkpoint(Photo)
+        if checkpoint.cursor:
+            checkpoint.timestamp = self.parse_cursor(checkpoint.cursor)[0]
+        checkpoint.cursor = ""
+        checkpoint.save()
+
+    def parse_cursor(self, cursor):
+        """
+        Return the ``(newest, oldest)`` taken dates in a crawl's cursor.
+
+        """
+        dates = [ datetime.datetime(*time.strptime(value, CURSOR_FORMAT)[:6])
+                  for value in cursor.split(",") ]
+        return dates[0], dates[-1]
 
     def pre_handle_item_created(self, model_instance, data):
         if model_instance.__class__ == Photo:
-            data_interface = self.DATA_INTERFACES['photo']
-            model_instance.exif = self.convert_exif(
-                data_interface.photos.getExif(
-                    photo_id=data['photo_id'], secret=data['secret']))
+            exif = data.get('exif')
+            if exif is None:
+                data_interface = self.get_custom_data_interface_instance(FlickrClient)
+                exif = self.convert_exif(
+                    data_interface.photos.getExif(
+                        photo_id=data['photo_id'], secret=data['secret']))
+            model_instance.exif = exif
             model_instance.save()
+            PhotoExif.objects.update_for_photo(model_instance)
 
     def post_handle_default(self, model_instance, model_str, model_cls, data, created):
         if model_instance.__class__ == Photoset:
-            data_interface = self.DATA_INTERFACES['photoset']
+            data_interface = self.get_custom_data_interface_instance(FlickrClient)
             page = 1
             while True:
                 resp = data_interface.photosets.getPhotos(
@@ -1,73 +1,121 @@
-import re
 import time
 import logging
 log = logging.getLogger("jellyroll.providers.gitscm")
 import datetime
+import md5
+import os
 import shutil
 import tempfile
 import git
 
-from unipath import FSPath as Path
+from django.conf import settings
 from django.db import transaction
-from django.utils.encoding import smart_unicode
+from django.utils.encoding import smart_unicode, smart_str
 
 from jellyroll.core.models import Item
 from jellyroll.contrib.code.models import CodeRepository, CodeCommit
 from jellyroll.contrib.code.providers import CodeRepositoryProvider
 from jellyroll.providers import utils, register_provider
 
+# One commit per record: sha, commit time (UTC epoch), author email, message.
+LOG_FORMAT = "%H%x1f%ct%x1f%ae%x1f%B%x1e"
+
 
 class GitSCMProvider(CodeRepositoryProvider):
     """
-
+    Reads commits from git repositories, through bare mirrors kept in
+    ``settings.JELLYROLL_GIT_CACHE_DIR`` and fetched incrementally on each
+    update. Without that setting each update mirrors into a temporary
+    directory that's thrown away afterwards.
 
     """
     class Meta(CodeRepositoryProvider.Meta):
         repository_type = "git"
         modules         = ('git',)
 
-    def create_local_repo(self, repository):
-        working_dir = tempfile.mkdtemp()
-        g = git.Git(working_dir)
-
-        log.debug("Cloning %s into %s", repository.url, working_dir)
-        res = g.clone(repository.url)
-
-        # This is pretty nasty.
-        m = re.match('^Initialized empty Git repository in (.*)', res)
-        repo_location = Path(m.group(1).rstrip('/'))
-        if repo_location.name == ".git":
-            repo_location = repo_location.parent
-        return working_dir, git.Repo(repo_location)
-
-    def update_codecommit_git(self, repository, last_update_date, commit_list):
-        # Git chokes on the 1969-12-31 sentinal returned by 
-        # get_last_update_of_model, so fix that up.
-        if last_update_date.date() == datetime.date(1969, 12, 31):
-            last_update_date = datetime.datetime(1970, 1, 1)
-
-        working_dir, repo = self.create_local_repo(repository)
-        commits = repo.commits_since(since=last_update_date.strftime("%Y-%m-%d"))
-        log.debug("Handling %s commits", len(commits))
-
-        for commit in reversed(commits):
-            if commit.author.email == repository.username:
-                log.debug("Handling [%s] from %s", commit.id[:7], repository.url)
-
-                # stored as UTC
-                timestamp = datetime.datetime.fromtimestamp(time.mktime(commit.committed_date))
-                if utils.JELLYROLL_ADJUST_DATETIME:
-                    timestamp = utils.utc_to_local_timestruct(commit.committed_date)
-
-                obj = {}
-                obj['revision'] = commit.id
-                obj['repository'] = repository
-                obj['message'] = smart_unicode(commit.message)
-                obj['timestamp'] = timestamp
-                
-                commit_list.append( obj )
-
-        log.debug("Removing working dir %s.", working_dir)
-        shutil.rmtree(working_dir)
+    def get_mirror(self, repository, cache_dir):
+        """
+        Return the path of an up-to-date bare mirror of ``repository`` in
+        ``cache_dir``, cloning it if there isn't one yet.
+
+        """
+        mirror = os.path.join(cache_dir, md5.new(smart_str(repository.url)).hexdigest() + ".git")
+        if os.path.isdir(mirror):
+            log.debug("Fetching %s into %s", repository.url, mirror)
+            git.Git(mirror).fetch('origin', prune=True)
+        else:
+            log.debug("Mirroring %s into %s", repository.url, mirror)
+            git.Git(cache_dir).clone(repository.url, mirror, mirror=True)
+        return mirror
+
+    def get_new_commits(self, mirror, last_revision, last_update_date):
+        """
+        Return ``(sha, timestamp, email, message)`` for the commits reachable
+        from HEAD but not ``last_revision``, oldest first. Without a usable
+        ``last_revision`` (a first update, or history was rewritten), falls
+        back to the commits since ``last_update_date``.
+
+        """
+        g = git.Git(mirror)
+        output = None
+        if last_revision:
+            try:
+                output = g.log("%s..HEAD" % last_revision, reverse=True, format=LOG_FORMAT)
+            except git.GitCommandError:
+                log.warning("Revision %s is no longer in %s; falling back to dates", last_revision, mirror)
+        if output is None:
+            # Git chokes on the 1969-12-31 sentinal returned by
+            # get_last_update_of_model, so fix that up.
+            if last_update_date is None or last_update_date.date() <= datetime.date(1970, 1, 1):
+                output = g.log("HEAD", reverse=True, format=LOG_FORMAT)
+            else:
+                output = g.log("HEAD", reverse=True, format=LOG_FORMAT,
+                               since=last_update_date.strftime("%Y-%m-%d"))
+
+        commits = []
+        for record in output.split("\x1e"):
+            record = record.strip("\n")
+            if not record:
+                continue
+            sha, committed, email, message = record.split("\x1f", 3)
+            commits.append( (sha, int(committed), email, message.strip()) )
+        return commits
+
+    def update_codecommit_git(self, repository, last_update_date):
+        cache_dir = getattr(settings, 'JELLYROLL_GIT_CACHE_DIR', None)
+        temporary = not cache_dir
+        if temporary:
+            cache_dir = tempfile.mkdtemp()
+        elif not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        try:
+            mirror = self.get_mirror(repository, cache_dir)
+            commits = self.get_new_commits(mirror, self.get_last_revision(repository), last_update_date)
+            log.debug("Handling %s commits", len(commits))
+
+            for sha, committed, email, message in commits:
+                if email == repository.username:
+                    log.debug("Handling [%s] from %s", sha[:7], repository.url)
+
+                    # stored as UTC
+                    timestamp = datetime.datetime.utcfromtimestamp(committed)
+                    if utils.JELLYROLL_ADJUST_DATETIME:
+                        timestamp = utils.utc_to_local_timestamp(committed)
+
+                    obj = {}
+                    obj['revision'] = sha
+                    obj['repository'] = repository
+                    obj['message'] = smart_unicode(message)
+                    obj['timestamp'] = timestamp
+
+                    yield obj
+
+            if commits:
+                self.set_last_revision(repository, commits[-1][0])
+        finally:
+            if temporary:
+                log.debug("Removing working dir %s.", cache_dir)
+                shutil.rmtree(cache_dir)
 
 register_provider(GitSCMProvider)
@@ -35,36 +35,38 @@ class GoogleSearchProvider(StructuredDataProvider):
     def __init__(self):
         super(GoogleSearchProvider,self).__init__()
         feed_url = RSS_URL % (settings.GOOGLE_USERNAME,settings.GOOGLE_PASSWORD)
-        self.search_engine = SearchEngine.objects.get(name="Google")
         self.register_data_url(WebSearch,feed_url,'rss')
-        self.websearch_results = list()
+        self.websearch_results = dict()
         
     def source_id(self, model_cls, extra):
         return ":".join( [extra['engine'].name,extra['query'],extra['guid']] ) 
 
     def update_websearch(self, data_iterator):
-        websearch_list = self.incoming["websearch"] = list()
+        search_engine = SearchEngine.objects.get(name="Google")
+
+        # Results can appear anywhere in the feed, so gather them all before
+        # any of the searches they belong to are handled.
+        for entry in data_iterator:
+            if entry.tags[0].term == "web result":
+                obj = {}
+                obj['guid'] = smart_unicode(entry.query_guid)
+                obj['title'] = smart_unicode(entry.title)
+                obj['url'] = smart_unicode(entry.link)
+
+                self.websearch_results.setdefault(obj['guid'], []).append( obj )
+
         for entry in data_iterator:
             if entry.tags[0].term == "web query":
                 obj = {}
-                obj['engine'] = self.search_engine
+                obj['engine'] = search_engine
                 obj['guid'] = smart_unicode(urlparse.urlsplit(entry.guid)[2].replace("/searchhistory/", ""))
                 obj['query'] = smart_unicode(entry.title)
                 obj['timestamp'] = datetime.datetime(tzinfo=tzinfo.FixedOffset(0), *entry.updated_parsed[:6])
 
-                websearch_list.append( obj )
-
-            elif entry.tags[0].term == "web result":
-                obj = {}
-                obj['guid'] = smart_unicode(entry.query_guid)
-                obj['title'] = smart_unicode(entry.title)
-                obj['url'] = smart_unicode(entry.link)
-                
-                self.websearch_results.append( obj )
+                yield obj
 
     def post_handle_item(self, item_instance, model_instance, data, created):
-        results = [ result for result in self.websearch_results if result['guid'] == data['guid'] ]
-        for result_data in results:
+        for result_data in self.websearch_results.get(data['guid'], ()):
             result,created = WebSearchResult.objects.get_or_create(
                 title = result_data['title'],
                 url = result_data['url'],
@@ -7,13 +7,13 @@ from httplib2 import HttpLib2Error
 from django.conf import settings
 from django.db import transaction
 from django.template.defaultfilters import slugify
-from django.utils.functional import memoize
 from django.utils.http import urlquote
 from django.utils.encoding import smart_str, smart_unicode
 
 from jellyroll.core.models import Item
 from jellyroll.contrib.track.models import Track
 from jellyroll.providers import utils, register_provider, StructuredDataProvider
+from jellyroll.providers.utils.cache import PersistentCache
 
 RECENT_TRACKS_URL = "http://ws.audioscrobbler.com/1.0/user/%s/recenttracks.xml?limit=100"
 TRACK_TAGS_URL    = "http://ws.audioscrobbler.com/1.0/track/%s/%s/toptags.xml"
@@ -32,6 +32,9 @@ class LastfmProvider(StructuredDataProvider):
     def __init__(self):
         super(LastfmProvider,self).__init__()
         self.register_data_url(Track,RECENT_TRACKS_URL%settings.LASTFM_USERNAME,"xml")
+        self.tag_cache = PersistentCache("lastfm.tags",
+            ttl = getattr(settings, 'LASTFM_TAG_CACHE_TTL', 7*24*60*60),
+            max_entries = getattr(settings, 'LASTFM_TAG_CACHE_SIZE', 10000))
 
     def source_id(self, model_cls, extra):
         return md5.new(smart_str(extra['artist_name']) + \
@@ -39,10 +42,9 @@ class LastfmProvider(StructuredDataProvider):
                            str(extra['timestamp'])).hexdigest()
 
     def update_track(self, data_iterator_func):
-        last_update_date = Item.objects.get_last_update_of_model(Track)
+        last_update_date = self.get_last_updated(Track)
         log.debug("Last update date: %s", last_update_date)
-    
-        tracks = self.incoming["track"] = list()
+
         for track in data_iterator_func("track"):
 
             # date delivered as UTC
@@ -62,49 +64,63 @@ class LastfmProvider(StructuredDataProvider):
             obj['url']         = smart_unicode(track.find('url').text)
             obj['timestamp']   = timestamp
 
-            tracks.append( obj )
+            yield obj
 
     #
     # Private API
     #
 
+    def get_cache_stats(self):
+        return {self.tag_cache.namespace: self.tag_cache.stats()}
+
+    def handle_main(self):
+        super(LastfmProvider,self).handle_main()
+        stats = self.tag_cache.stats()
+        log.debug("Tag cache: %s hits, %s misses", stats['hits'], stats['misses'])
+        self.tag_cache.prune()
+
     def tags_for_track(self, artist_name, track_name):
         """
-        Get the top tags for a track. Also fetches tags for the artist. Only
+        Get the top tags for a track, as a space-separated string. Also fetches tags for the artist. Only
         includes tracks that break a certain threshold of usage, defined by
         settings.LASTFM_TAG_USAGE_THRESHOLD (which defaults to 15).
+
+        Tags are cached (see ``PersistentCache``) for LASTFM_TAG_CACHE_TTL
+        seconds; an artist's tags are cached once and shared by all of their
+        tracks. Tags that couldn't be fetched are left out (and not cached).
         """
-        
-        urls = [
-            ARTIST_TAGS_URL % (urlquote(artist_name)),
-            TRACK_TAGS_URL % (urlquote(artist_name), urlquote(track_name)),
-            ]
+        artist_key = u"artist:%s" % artist_name.lower()
+        track_key = u"track:%s/%s" % (artist_name.lower(), track_name.lower())
+
         tags = set()
-        for url in urls:
-            tags.update(self.tags_for_url(url))
+        tags.update(self.tag_cache.get_or_fetch(artist_key, 
+            lambda: self.tags_for_url(ARTIST_TAGS_URL % (urlquote(artist_name)))) or [])
+        tags.update(self.tag_cache.get_or_fetch(track_key, 
+            lambda: self.tags_for_url(TRACK_TAGS_URL % (urlquote(artist_name), urlquote(track_name)))) or [])
+        return " ".join(sorted(tags))
         
     def tags_for_url(self, url):
+        """
+        Fetch the tags at ``url`` as a sorted list, or ``None`` if they
+        couldn't be fetched.
+        """
         tags = set()
         try:
             xml = utils.getxml(url)
         except HttpLib2Error, e:
-            if e.code == 408:
-                return ""
+            if getattr(e, 'code', None) == 408:
+                return None
             else:
                 raise
         except SyntaxError:
-            return ""
+            return None
         for t in xml.getiterator("tag"):
             count = utils.safeint(t.find("count").text)
             if count >= getattr(settings, 'LASTFM_TAG_USAGE_THRESHOLD', 15):
                 tag = slugify(smart_unicode(t.find("name").text))
                 tags.add(tag[:50])
 
-        return tags
-
-    # Memoize tags to avoid unnecessary API calls.
-    tag_cache = {}
-    tags_for_url = memoize(tags_for_url, tag_cache, 1)
+        return sorted(tags)
 
 
 register_provider( LastfmProvider )
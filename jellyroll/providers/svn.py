@@ -5,6 +5,7 @@ import datetime
 import pysvn
 import md5
 
+from django.conf import settings
 from django.db import transaction
 from django.utils.encoding import smart_unicode, smart_str
 
@@ -13,33 +14,71 @@ from jellyroll.contrib.code.models import CodeRepository, CodeCommit
 from jellyroll.contrib.code.providers import CodeRepositoryProvider
 from jellyroll.providers import utils, register_provider
 
+# Only ask for the revision properties we use.
+LOG_REVPROPS = ['svn:author', 'svn:date', 'svn:log']
+
 
 class SubversionProvider(CodeRepositoryProvider):
     """
-    
+    Reads commits from Subversion repositories, oldest first, starting after
+    the last revision a previous update saw and fetching the log
+    ``settings.JELLYROLL_SVN_LOG_WINDOW`` (default 500) revisions at a time.
 
     """
-    class Meta(CodeRepositoryProvider):
+    class Meta(CodeRepositoryProvider.Meta):
         repository_type = "svn"
         modules = ('pysvn',)
 
-    def update_codecommit_svn(self, repository, last_update_date, commit_list):
-        # TODO: investigate issues with last_update_date, etc.
-        rev = pysvn.Revision(pysvn.opt_revision_kind.date, time.mktime(last_update_date.timetuple()))
+    def __init__(self):
+        super(SubversionProvider,self).__init__()
+        self.window_size = getattr(settings, 'JELLYROLL_SVN_LOG_WINDOW', 500)
+
+    def get_log_window(self, client, url, start, limit):
+        """
+        Return the log of (at most) ``limit`` revisions of ``url`` from
+        ``start`` on, with only the revision properties we use.
+
+        """
+        return client.log(url, revision_start=start,
+                          revision_end=pysvn.Revision(pysvn.opt_revision_kind.head),
+                          discover_changed_paths=False, limit=limit,
+                          revprops=LOG_REVPROPS)
+
+    def update_codecommit_svn(self, repository, last_update_date):
         c = pysvn.Client()
 
-        for revision_entry in reversed(c.log(repository.url, revision_end=rev)):
-            revision = revision_entry.revision
-            if revision_entry.author == repository.username:
-                log.debug("Handling [%s] from %s" % (revision.number, repository.url))
-                timestamp = datetime.datetime.fromtimestamp(revision_entry.date)
-                
-                obj = {}
-                obj['revision'] = str(revision.number)
-                obj['repository'] = repository
-                obj['message'] = smart_unicode(revision_entry.message)
-                obj['timestamp'] = timestamp
-                
-                commit_list.append( obj )
+        head = c.info2(repository.url, revision=pysvn.Revision(pysvn.opt_revision_kind.head),
+                       recurse=False)[0][1].rev.number
+        last_revision = self.get_last_revision(repository)
+        if last_revision:
+            if int(last_revision) >= head:
+                log.debug("No new revisions in %s", repository.url)
+                return
+            start = pysvn.Revision(pysvn.opt_revision_kind.number, int(last_revision) + 1)
+        else:
+            start = pysvn.Revision(pysvn.opt_revision_kind.date, time.mktime(last_update_date.timetuple()))
+
+        while True:
+            entries = self.get_log_window(c, repository.url, start, self.window_size)
+            for revision_entry in entries:
+                revision = revision_entry.revision
+                if revision_entry.get('author') == repository.username:
+                    log.debug("Handling [%s] from %s" % (revision.number, repository.url))
+                    timestamp = datetime.datetime.fromtimestamp(revision_entry.date)
+
+                    obj = {}
+                    obj['revision'] = str(revision.number)
+                    obj['repository'] = repository
+                    obj['message'] = smart_unicode(revision_entry.get('message') or '')
+                    obj['timestamp'] = timestamp
+
+                    yield obj
+
+            if entries:
+                last_revision = entries[-1].revision.number
+                self.set_last_revision(repository, last_revision)
+            if len(entries) < self.window_size or last_revision >= head:
+                return
+            start = pysvn.Revision(pysvn.opt_revision_kind.number, last_revision + 1)
 
 register_provider(SubversionProvider)
@@ -7,7 +7,7 @@ import re
 
 from httplib2 import HttpLib2Error
 from django.conf import settings
-from django.db import transaction
+from django.db import connection, transaction
 from django.template.defaultfilters import slugify
 from django.utils.functional import memoize
 from django.utils.http import urlquote
@@ -21,16 +21,20 @@ from jellyroll.providers import register_provider, utils, StructuredDataProvider
 RECENT_STATUSES_URL = "http://twitter.com/statuses/user_timeline/%s.rss"
 USER_URL = "http://twitter.com/%s"
 USER_LINK_TPL = "<a href='%s' title='%s'>%s</a>"
-TAG_RE = re.compile(r'(?P<tag>\#\w+)')
 USER_RE = re.compile(r'(?P<username>@\w+)')
-RT_RE = re.compile(r'RT\s+(?P<username>@\w+)')
-USERNAME_RE = re.compile(r'^%s:'%settings.TWITTER_USERNAME)
-URL_RE = re.compile( # modified from django.forms.fields.url_re
-    r'https?://'
-    r'(?:(?:[A-Z0-9-]+\.)+[A-Z]{2,6}|'
+# Everything parse_message looks for, in one pattern so a message is only
+# scanned once: URLs (modified from django.forms.fields.url_re, spelling out
+# the case-insensitivity so "RT" stays case-sensitive), RT-style retweets,
+# @user references and #tags.
+TOKEN_RE = re.compile(
+    r'(?P<url>[Hh][Tt][Tt][Pp][Ss]?://'
+    r'(?:(?:[A-Za-z0-9-]+\.)+[A-Za-z]{2,6}|'
     r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'
     r'(?::\d+)?'
-    r'(?:/\S+|/?)', re.IGNORECASE)
+    r'(?:/\S+|/?))'
+    r'|RT\s+(?P<retweet>@\w+)'
+    r'|(?P<username>@\w+)'
+    r'|\#(?P<tag>\w+)')
 
 
 class TwitterProvider(StructuredDataProvider):
@@ -45,6 +49,7 @@ class TwitterProvider(StructuredDataProvider):
     def __init__(self):
         super(TwitterProvider,self).__init__()
         self.register_data_url(Message,RECENT_STATUSES_URL%settings.TWITTER_USERNAME,"xml")
+        self.username_re = re.compile(r'^%s:' % re.escape(settings.TWITTER_USERNAME))
 
     def source_id(self, model_cls, extra):
         return md5.new(smart_str(extra['message']) + \
@@ -52,10 +57,9 @@ class TwitterProvider(StructuredDataProvider):
                        str(extra['timestamp'])).hexdigest()
 
     def update_message(self, data_iterator_func):
-        last_update_date = Item.objects.get_last_update_of_model(Message)
+        last_update_date = self.get_last_updated(Message)
         log.debug("Last update date: %s", last_update_date)
 
-        statuses = self.incoming['message'] = list()
         for status in data_iterator_func("item"):
 
             message = smart_unicode(status.find("title").text)
@@ -68,31 +72,72 @@ class TwitterProvider(StructuredDataProvider):
             obj['timestamp']                          = timestamp
             obj['url']                                = smart_unicode(status.find("link").text)
 
-            statuses.append( obj )
+            yield obj
 
     def post_handle_item(self, item_instance, model_instance, data, created):
-        if not created or 'links' not in data:
+        # Links are saved for the whole chunk at once in post_handle_chunk.
+        if created and data.get('links'):
+            data['message_pk'] = model_instance.pk
+
+    def post_handle_chunk(self, model_str, model_cls, records):
+        if model_cls != Message:
+            return
+        records = [ data for data in records if 'message_pk' in data ]
+        if not records:
             return
-        for link in data['links']:
-            l = ContentLink(
-                url = link,
-                identifier = link,
-                )
-            l.save()
-            model_instance.links.add(l)
-            #model_instance.save()
+
+        urls = set()
+        for data in records:
+            urls.update(data['links'])
+        link_ids = self.get_link_ids(urls)
+
+        rows = set()
+        for data in records:
+            for url in data['links']:
+                rows.add( (data['message_pk'], link_ids[url]) )
+
+        field = Message._meta.get_field('links')
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        cursor.executemany("INSERT INTO %s (%s, %s) VALUES (%%s, %%s)" % \
+                               (qn(field.m2m_db_table()), qn(field.m2m_column_name()), 
+                                qn(field.m2m_reverse_name())),
+                           list(rows))
+
+    def get_link_ids(self, urls):
+        """
+        Return a dictionary mapping each of ``urls`` to the id of its
+        ``ContentLink``, inserting the ones that don't exist yet in one go.
+
+        """
+        urls = list(urls)
+        link_ids = {}
+        for pk, url in ContentLink.objects.filter(url__in=urls).values_list('pk', 'url'):
+            link_ids.setdefault(url, pk)
+
+        missing = [ url for url in urls if url not in link_ids ]
+        if missing:
+            qn = connection.ops.quote_name
+            cursor = connection.cursor()
+            cursor.executemany("INSERT INTO %s (%s, %s) VALUES (%%s, %%s)" % \
+                                   (qn(ContentLink._meta.db_table), qn('url'), qn('identifier')),
+                               [ (url, url[:128]) for url in missing ])
+            for pk, url in ContentLink.objects.filter(url__in=missing).values_list('pk', 'url'):
+                link_ids.setdefault(url, pk)
+        return link_ids
 
     #
     # Private API
     #
-    def transform_retweet(self, matchobj):
+    def transform_retweet(self, username):
         TWITTER_RETWEET_TXT = "Forwarding from %s: "
         if hasattr(settings,'TWITTER_RETWEET_TXT'):
             TWITTER_RETWEET_TXT = settings.TWITTER_RETWEET_TXT
 
         if '%s' in TWITTER_RETWEET_TXT:
-            return TWITTER_RETWEET_TXT % matchobj.group('username')
-        return TWITTER_RETWEET_TXT
+            TWITTER_RETWEET_TXT = TWITTER_RETWEET_TXT % username
+        # @user references in the text are linked, as they would be anywhere else
+        return USER_RE.sub(self.transform_user_ref_to_link, TWITTER_RETWEET_TXT)
 
     def transform_user_ref_to_link(self, matchobj):
         user = matchobj.group('username')[1:]
@@ -103,39 +148,37 @@ class TwitterProvider(StructuredDataProvider):
     def parse_message(self, message_text):
         """
         Parse out some semantics for teh lulz.
+
+        Returns the message text with URLs replaced by ``[n]`` references, the
+        leading username removed, retweets and @user references rewritten and
+        #tags taken out, along with the (distinct) URLs and the tags.
         
         """
-        links = list()
-        tags = ""
-
-        # remove newlines
-        message_text = message_text.replace('\n','')
-        # remove URLs referenced in message content
-        # TODO: fix ungainly code below
-        links = [ link for link in URL_RE.findall(message_text) ]
-        link_ctr = 1
-        link_dict = {}
-        for link in URL_RE.finditer(message_text):
-            link_dict[link.group(0)] = link_ctr
-            link_ctr += 1
-        generate_link_num = lambda obj: "[%d]"%link_dict[obj.group(0)]
-        message_text = URL_RE.sub(generate_link_num,message_text)
-        # remove leading username
-        message_text = USERNAME_RE.sub('',message_text)
-        # check for RT-type retweet syntax
-        message_text = RT_RE.sub(self.transform_retweet,message_text)
-        # replace @user references with links to their timeline
-        message_text = USER_RE.sub(self.transform_user_ref_to_link,message_text)
-        # extract defacto #tag style tweet tags
-        tags = ' '.join( [tag[1:] for tag in TAG_RE.findall(message_text)] )
-        message_text = TAG_RE.sub('',message_text)
-
-        return (message_text.strip(),links,tags)
-
-    if not hasattr(settings,'TWITTER_TRANSFORM_MSG') or \
-       not settings.TWITTER_TRANSFORM_MSG:
-
-        log.info("Disabling message transforms")
-        TwitterProvider.parse_message = lambda self, msg: ( msg, list(), "" )
+        if not getattr(settings,'TWITTER_TRANSFORM_MSG',False):
+            return ( message_text, list(), "" )
+
+        links = []
+        link_nums = {}
+        tags = []
+
+        def transform(matchobj):
+            url = matchobj.group('url')
+            if url is not None:
+                if url not in link_nums:
+                    links.append(url)
+                    link_nums[url] = len(links)
+                return "[%d]" % link_nums[url]
+            if matchobj.group('retweet') is not None:
+                return self.transform_retweet(matchobj.group('retweet'))
+            if matchobj.group('username') is not None:
+                return self.transform_user_ref_to_link(matchobj)
+            tags.append(matchobj.group('tag'))
+            return ''
+
+        # remove newlines and the leading username
+        message_text = self.username_re.sub('',message_text.replace('\n',''))
+        message_text = TOKEN_RE.sub(transform,message_text)
+
+        return (message_text.strip(),links,' '.join(tags))
 
 register_provider( TwitterProvider )
@@ -1,10 +1,18 @@
-import httplib2
+import threading
+import time
+import urlparse
 import dateutil.parser
 import dateutil.tz
 from django.utils import simplejson
 from django.utils.encoding import force_unicode
 from django.conf import settings
 from anyetree import etree
+from session import HttpSessionPool
+
+try:
+    from multiprocessing.pool import ThreadPool
+except ImportError:
+    ThreadPool = None               # Python < 2.6 fallback; see get_thread_pool
 
 DEFAULT_HTTP_HEADERS = {
     "User-Agent" : "Jellyroll/1.0 (http://code.google.com/p/jellyroll)"
@@ -25,18 +33,120 @@ def getjson(url, **kwargs):
     return simplejson.loads(json)
 
 def fetch_resource(url, method="GET", body=None, username=None, password=None, headers=None):
-    h = httplib2.Http(timeout=15)
-    h.force_exception_to_status_code = True
-    
-    if username is not None or password is not None:
-        h.add_credentials(username, password)
-    
+    response, content = fetch_response(url, method, body, username, password, headers)
+    return content
+
+def fetch_response(url, method="GET", body=None, username=None, password=None, headers=None):
+    """Fetch a URL. Returns the ``(response, content)`` pair."""
     if headers is None:
         headers = DEFAULT_HTTP_HEADERS.copy()
+
+    return get_session_pool().request(url, method, body, headers, username, password)
+
+def split_url_credentials(url):
+    """
+    Split any ``user:password@`` out of a URL. Returns a tuple of ``(url,
+    username, password)``; the latter two are ``None`` if not given.
+    """
+    scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+    if '@' not in netloc:
+        return (url, None, None)
+    userinfo, netloc = netloc.rsplit('@', 1)
+    if ':' in userinfo:
+        username, password = userinfo.split(':', 1)
+    else:
+        username, password = userinfo, None
+    return (urlparse.urlunsplit((scheme, netloc, path, query, fragment)), username, password)
+
+_session_pool = None
+_session_pool_lock = threading.Lock()
+
+def get_session_pool():
+    """
+    Return the process-wide ``HttpSessionPool`` used by ``fetch_resource``,
+    creating it on first use. The number of sessions (and so of concurrent
+    requests) it allows per host and their socket timeout come from the
+    ``JELLYROLL_HTTP_POOL_SIZE`` (default 4) and ``JELLYROLL_HTTP_TIMEOUT``
+    (default 15 seconds) settings.
+    """
+    global _session_pool
+    if _session_pool is None:
+        _session_pool_lock.acquire()
+        try:
+            if _session_pool is None:
+                _session_pool = HttpSessionPool(
+                    size = getattr(settings, 'JELLYROLL_HTTP_POOL_SIZE', 4),
+                    timeout = getattr(settings, 'JELLYROLL_HTTP_TIMEOUT', 15),
+                )
+        finally:
+            _session_pool_lock.release()
+    return _session_pool
     
-    response, content = h.request(url, method, body, headers)
-    return content
-    
+#
+# Concurrency sugar
+#
+
+class RateLimiter(object):
+    """
+    A token bucket shared by every thread that makes calls through it: calls
+    average at most ``rate`` per second, but up to ``burst`` of them may go
+    out at once after a quiet spell. A ``rate`` of ``None`` or 0 means no
+    limit.
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Block until the caller may make its call."""
+        if not self.rate:
+            return
+        self.lock.acquire()
+        try:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Take a token even if there isn't one yet; the debt is how long
+            # this caller (behind any others already waiting) has to wait.
+            self.tokens -= 1
+            delay = -self.tokens / self.rate
+        finally:
+            self.lock.release()
+        if delay > 0:
+            time.sleep(delay)
+
+class SerialResult(object):
+    def __init__(self, func, args):
+        self.func, self.args = func, args
+    def get(self):
+        return self.func(*self.args)
+
+class SerialPool(object):
+    """
+    A stand-in for ``ThreadPool`` that does all its work in the calling thread
+    (``apply_async`` simply defers the call until its result is asked for).
+    """
+    def map(self, func, iterable):
+        return map(func, iterable)
+    def apply_async(self, func, args=()):
+        return SerialResult(func, args)
+    def close(self):
+        pass
+    def join(self):
+        pass
+
+def get_thread_pool(workers):
+    """
+    Return a pool of ``workers`` threads for I/O-bound work such as API calls,
+    or a ``SerialPool`` if ``workers`` is 1 or thread pools aren't available.
+    """
+    if ThreadPool is None or workers <= 1:
+        return SerialPool()
+    return ThreadPool(workers)
+
 #
 # Date handling utils
 #
@@ -45,7 +155,12 @@ def parsedate(s):
     """
     Convert a string into a (local, naive) datetime object.
     """
-    dt = dateutil.parser.parse(s)
+    return localdate(dateutil.parser.parse(s))
+
+def localdate(dt):
+    """
+    Convert a (possibly timezone-aware) datetime into a local, naive one.
+    """
     if dt.tzinfo:
         dt = dt.astimezone(dateutil.tz.tzlocal()).replace(tzinfo=None)
     return dt
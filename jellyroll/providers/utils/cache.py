@@ -0,0 +1,94 @@
+"""
+A bounded, persistent cache for values providers look up over and over again
+(tags for an artist, say) and which change rarely enough to survive between
+update runs.
+
+``PersistentCache`` keeps entries in the database (see ``CacheEntry``) with a
+time-to-live, and prunes the least recently used ones when there are more than
+``max_entries``. Entries looked up during a run are also kept in a small
+in-memory LRU so repeated lookups don't go back to the database.
+
+"""
+import threading
+from jellyroll.core.models import CacheEntry
+
+
+class PersistentCache(object):
+    """
+    A persistent cache of JSON-serializable values within a ``namespace``.
+
+    """
+    def __init__(self, namespace, ttl=7*24*60*60, max_entries=10000, memory_size=1000):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_size = memory_size
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}
+        self._order = []
+        self._lock = threading.Lock()
+
+    def _remember(self, key, value):
+        self._lock.acquire()
+        try:
+            if key in self._memory:
+                self._order.remove(key)
+            self._memory[key] = value
+            self._order.append(key)
+            while len(self._order) > self.memory_size:
+                del self._memory[self._order.pop(0)]
+        finally:
+            self._lock.release()
+
+    def get(self, key, default=None):
+        """
+        Return the value cached for ``key``, or ``default`` if there isn't one.
+
+        """
+        if key in self._memory:
+            self.hits += 1
+            value = self._memory[key]
+            self._remember(key, value)
+            return value
+
+        found, value = CacheEntry.objects.get_value(self.namespace, key)
+        if not found:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        CacheEntry.objects.set_value(self.namespace, key, value, self.ttl)
+        self._remember(key, value)
+
+    def get_or_fetch(self, key, fetch):
+        """
+        Return the value cached for ``key``, calling ``fetch()`` and caching
+        its result if there isn't one. A ``fetch`` that returns ``None`` isn't
+        cached, so failed lookups are tried again next time.
+
+        """
+        value = self.get(key)
+        if value is None:
+            value = fetch()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def prune(self):
+        """
+        Drop expired entries and enforce ``max_entries``; returns how many
+        entries remain.
+
+        """
+        return CacheEntry.objects.prune(self.namespace, self.max_entries)
+
+    def clear_memory(self):
+        self._memory = {}
+        self._order = []
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,118 @@
+"""
+A shared, thread-safe pool of keep-alive HTTP sessions for providers.
+
+``httplib2.Http`` already keeps one persistent connection open per scheme and
+host, but a single instance can't safely be used from more than one thread at
+a time. ``HttpSessionPool`` hands out whole ``Http`` instances instead, kept
+separately for each scheme and host: each request borrows one of its host's
+sessions (along with the connection it is holding open) and gives it back
+when it's done. At most ``size`` requests -- and therefore at most ``size``
+connections -- to any one host are in flight at once, and requests to
+different hosts never wait on each other.
+
+Observers (see ``add_observer``) are told about every request made through the
+pool, which is how provider runs count their HTTP traffic.
+
+"""
+import Queue
+import sys
+import threading
+import time
+import urlparse
+import httplib2
+
+
+def host_key(url):
+    """
+    The ``(scheme, host[:port])`` that sessions for ``url`` are pooled under.
+    """
+    scheme, netloc = urlparse.urlsplit(url)[:2]
+    return (scheme.lower(), netloc.lower())
+
+class HttpSessionPool(object):
+    """
+    Bounded pools of ``httplib2.Http`` sessions, ``size`` per host.
+
+    """
+    def __init__(self, size=4, timeout=15):
+        self.size = size
+        self.timeout = timeout
+        self._idle = {}
+        self._created = {}
+        self._lock = threading.Lock()
+        self.observers = []
+
+    def _new_session(self):
+        session = httplib2.Http(timeout=self.timeout)
+        session.force_exception_to_status_code = True
+        return session
+
+    def acquire(self, url):
+        """
+        Borrow a session for ``url``'s host, creating one if the host doesn't
+        have ``size`` yet and blocking until one is released otherwise.
+
+        """
+        host = host_key(url)
+        self._lock.acquire()
+        try:
+            idle = self._idle.setdefault(host, Queue.Queue())
+            try:
+                return idle.get_nowait()
+            except Queue.Empty:
+                pass
+            if self._created.get(host, 0) < self.size:
+                self._created[host] = self._created.get(host, 0) + 1
+                return self._new_session()
+        finally:
+            self._lock.release()
+
+        return idle.get()
+
+    def release(self, url, session):
+        """
+        Return a session borrowed for ``url`` to its host's pool, forgetting
+        any credentials it was given so they don't leak into the next request.
+
+        """
+        session.clear_credentials()
+        self._idle[host_key(url)].put(session)
+
+    def add_observer(self, observer):
+        """
+        Call ``observer(url, response, content, seconds)`` after each request.
+        Observers are called from whichever thread made the request. If the
+        request raised an exception, ``response`` and ``content`` are ``None``.
+
+        """
+        self.observers = self.observers + [observer]
+
+    def remove_observer(self, observer):
+        self.observers = [ o for o in self.observers if o != observer ]
+
+    def request(self, url, method="GET", body=None, headers=None, username=None, password=None):
+        """
+        Make a request with a pooled session. Returns ``(response, content)``
+        just like ``httplib2.Http.request``.
+
+        """
+        session = self.acquire(url)
+        began = time.time()
+        try:
+            try:
+                if username is not None or password is not None:
+                    session.add_credentials(username, password)
+                response, content = session.request(url, method, body, headers)
+            finally:
+                self.release(url, session)
+        except:
+            exc_info = sys.exc_info()
+            self._notify(url, None, None, time.time() - began)
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        self._notify(url, response, content, time.time() - began)
+        return response, content
+
+    def _notify(self, url, response, content, seconds):
+        for observer in self.observers:
+            observer(url, response, content, seconds)
@@ -0,0 +1,101 @@
+"""
+Counters for a single provider run, gathered into the report that
+``Provider.get_report`` returns and ``ProviderRun`` stores.
+
+``RunStats`` is handed every HTTP request the run makes (it observes the
+shared ``HttpSessionPool``; see ``HttpSessionPool.add_observer``) and counts
+records and database statements as the provider handles them. Records are
+``fetched`` once an updater produces them; those that aren't ``created``,
+``updated`` (rewritten by ``handle_default`` because something changed) or
+``failed`` were ``skipped`` as unchanged.
+
+"""
+import threading
+
+# Upper bounds, in seconds, of the HTTP latency histogram's buckets; anything
+# slower goes in a final, open-ended one.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class LatencyHistogram(object):
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+
+    def add(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds < bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def as_dict(self):
+        labels = [ "<%gs" % bound for bound in self.buckets ] + [ ">=%gs" % self.buckets[-1] ]
+        return dict(zip(labels, self.counts))
+
+class RunStats(object):
+    """
+    What happened during one provider run. HTTP requests may be observed from
+    several threads at once (see ``FlickrProvider``); everything else is
+    counted in the thread running the provider.
+
+    """
+    def __init__(self):
+        self.http_requests = 0
+        self.http_errors = 0
+        self.http_not_modified = 0
+        self.http_bytes = 0
+        self.http_seconds = 0.0
+        self.latency = LatencyHistogram()
+        self.fetched = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.queries = 0
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def observe_request(self, url, response, content, seconds):
+        """
+        Count an HTTP request (an ``HttpSessionPool`` observer). Requests
+        that raised, and so have no ``response``, count as errors.
+
+        """
+        self._lock.acquire()
+        try:
+            self.http_requests += 1
+            self.http_bytes += len(content or "")
+            self.http_seconds += seconds
+            self.latency.add(seconds)
+            if response is None:
+                self.http_errors += 1
+            elif response.status == 304:
+                self.http_not_modified += 1
+            elif response.status >= 400:
+                self.http_errors += 1
+        finally:
+            self._lock.release()
+
+    def add_phase(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def as_dict(self):
+        return {
+            'http': {
+                'requests': self.http_requests,
+                'errors': self.http_errors,
+                'not_modified': self.http_not_modified,
+                'bytes': self.http_bytes,
+                'seconds': self.http_seconds,
+                'latency': self.latency.as_dict(),
+            },
+            'records': {
+                'fetched': self.fetched,
+                'created': self.created,
+                'updated': self.updated,
+                'skipped': max(self.fetched - self.created - self.updated - self.failed, 0),
+                'failed': self.failed,
+            },
+            'queries': self.queries,
+            'phases': dict(self.phases),
+        }
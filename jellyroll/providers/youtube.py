@@ -23,18 +23,19 @@ class YoutubeProvider(GDataProvider):
 
     """
     class Meta:
-        models = (Video,)
+        models   = (Video,)
+        settings = ('GOOGLE_USERNAME','GOOGLE_PASSWORD')
+        modules  = ('gdata',)
 
     def __init__(self):
         super(YoutubeProvider,self).__init__()
         self.register_service_client(gdata.youtube.service.YouTubeService,Video)
-        self.source = VideoSource.objects.get(name="YouTube")
 
     def source_id(self, model_cls, extra):
         return md5.new( smart_str(extra['url']) ).hexdigest()
 
     def update_video(self, client):
-        video_list = self.incoming["video"] = list()
+        source = VideoSource.objects.get(name="YouTube")
         feed = client.GetUserFavoritesFeed()
         for entry in feed.entry:
             obj = {}
@@ -54,8 +55,8 @@ class YoutubeProvider(GDataProvider):
             obj['tags'] = ' '.join( tags )
 
             obj['timestamp'] = dateutil.parser.parse(entry.published.text)
-            obj['source'] = self.source
+            obj['source'] = source
 
-            video_list.append( obj )
+            yield obj
 
 register_provider( YoutubeProvider )
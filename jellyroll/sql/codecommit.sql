@@ -0,0 +1 @@
+CREATE INDEX jellyroll_codecommit_repository_timestamp ON jellyroll_codecommit (repository_id, timestamp);
@@ -0,0 +1,2 @@
+CREATE INDEX jellyroll_item_content_type_timestamp ON jellyroll_item (content_type_id, timestamp);
+CREATE INDEX jellyroll_item_source_source_id_hash ON jellyroll_item (source, source_id_hash);
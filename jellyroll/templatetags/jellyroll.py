@@ -1,20 +1,20 @@
 import datetime
 import dateutil.parser
+import md5
 import urllib
 
 from django import template
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
-from django.template.loader import render_to_string
+from django.template.loader import select_template
 from django.contrib.contenttypes.models import ContentType
 
-try:
-    from collections import defaultdict
-except ImportError:
-    defaultdict = None
-
 
 # Hack until relative imports
 Item = models.get_model("jellyroll", "item")
+ItemCount = models.get_model("jellyroll", "itemcount")
+instrumented_render = __import__("jellyroll.core.instrumentation", {}, {}, [""]).instrumented_render
 
 register = template.Library()
 
@@ -46,6 +46,11 @@ def jellyrender(parser, token):
             
     The rendered content will be displayed in the template unless the ``as
     <varname>`` clause is used to redirect the output into a context variable.
+
+    If ``settings.JELLYROLL_RENDER_CACHE_TIMEOUT`` is set, rendered items are
+    cached for that many seconds, or until the item is next saved. Only turn
+    this on if the snippet templates don't depend on anything in the context
+    but ``item`` and ``object``.
     """
     bits = token.split_contents()
     if len(bits) < 2:
@@ -67,6 +72,20 @@ def jellyrender(parser, token):
             
     return JellyrenderNode(item, **args)
 jellyrender = register.tag(jellyrender)
+
+# Snippet templates, by template list, so that they're only loaded and
+# compiled once per process (unless TEMPLATE_DEBUG is on).
+_snippet_templates = {}
+
+def get_snippet_template(template_list):
+    key = tuple(template_list)
+    try:
+        return _snippet_templates[key]
+    except KeyError:
+        t = select_template(template_list)
+        if not settings.TEMPLATE_DEBUG:
+            _snippet_templates[key] = t
+        return t
     
 class JellyrenderNode(template.Node):
         
@@ -75,6 +94,7 @@ class JellyrenderNode(template.Node):
         self.using = using
         self.asvar = asvar
         
+    @instrumented_render
     def render(self, context):
         try:
             item = template.resolve_variable(self.item, context)
@@ -106,14 +126,24 @@ class JellyrenderNode(template.Node):
             else:
                 template_list.insert(0, using)
                 
-        # Render content, and save to self.asvar if requested
-        context.push()
-        context.update({
-            "item" : item,
-            "object" : object
-        })
-        rendered = render_to_string(template_list, context)
-        context.pop()
+        # Render content (or fetch it from the cache), and save to
+        # self.asvar if requested
+        timeout = getattr(settings, 'JELLYROLL_RENDER_CACHE_TIMEOUT', 0)
+        rendered = None
+        if timeout:
+            cache_key = "jellyroll.render:%s:%s:%s" % (
+                item.pk, Item.objects.get_version(item), md5.new(",".join(template_list)).hexdigest())
+            rendered = cache.get(cache_key)
+        if rendered is None:
+            context.push()
+            context.update({
+                "item" : item,
+                "object" : object
+            })
+            rendered = get_snippet_template(template_list).render(context)
+            context.pop()
+            if timeout:
+                cache.set(cache_key, rendered, timeout)
         if self.asvar:
             context[self.asvar] = rendered
             return ""
@@ -233,8 +263,9 @@ class GetJellyrollItemsNode(template.Node):
         self.excludetypes = excludetypes
         self.reversed = reversed
         
+    @instrumented_render
     def render(self, context):
-        qs = Item.objects.all()
+        qs = Item.objects.with_objects()
         
         # Handle start/end dates if given
         if self.start:
@@ -301,33 +332,64 @@ get_jellyroll_recent_traffic = register.tag(get_jellyroll_recent_traffic)
 class JellyrollRecentTrafficNode(template.Node):
     def __init__(self, days, context_var, oftypes=[]):
         self.days = int(days)
-        self.oftypes = oftypes.split(",")
+        self.oftypes = oftypes and oftypes.split(",") or []
         self.context_var = context_var
 
+    @instrumented_render
     def render(self, context):
         CT = ContentType.objects.get_for_model
-        dt_start = datetime.date.today()
-        data = []
+        # Offset 0 is the day before today, as it always has been.
+        today = datetime.date.today()
+        days = [ today - datetime.timedelta(days=offset+1) for offset in range(0,self.days) ]
 
         if self.oftypes:
-            if defaultdict:
-                data = defaultdict(list)
-            else:
-                for item_type in self.oftypes: data[item_type] = []
-
-        for offset in range(0,self.days):
-            dt = dt_start - datetime.timedelta(days=offset)
-            step = datetime.timedelta(days=1)
-            if self.oftypes:
-                for item_type in self.oftypes:
-                    qs = Item.objects.filter(content_type__id=CT(Item.objects.models_by_name[item_type]).id)
-                    data[item_type].append(
-                        qs.filter(timestamp__range=(dt-step,dt)).count()
-                        )
-            else:
-                data.append(
-                    Item.objects.filter(timestamp__range=(dt-step,dt)).count()
-                    )
+            ctypes = dict([ (CT(Item.objects.models_by_name[item_type]).id, item_type)
+                            for item_type in self.oftypes ])
+            counts = dict([ (item_type, {}) for item_type in self.oftypes ])
+            if days:
+                rows = ItemCount.objects.filter(date__range=(days[-1], days[0]), content_type__in=ctypes.keys())
+                for date, content_type_id, count in rows.values_list('date', 'content_type', 'count'):
+                    counts[ctypes[content_type_id]][date] = count
+            data = {}
+            for item_type in self.oftypes:
+                data[item_type] = [ counts[item_type].get(day, 0) for day in days ]
+        else:
+            counts = days and ItemCount.objects.counts_by_day(days[-1], days[0]) or {}
+            data = [ counts.get(day, 0) for day in days ]
 
         context[self.context_var] = data
         return ''
+
+def get_jellyroll_tag_cloud(parser, token):
+    """
+    Load the tags used on jellyroll items into the context, alphabetically,
+    each with a ``count`` and a ``font_size`` from 1 to ``steps`` (4 unless
+    given)::
+
+        {% get_jellyroll_tag_cloud as tags [steps <n>] %}
+    """
+    bits = token.split_contents()
+    if len(bits) not in (3, 5):
+        raise template.TemplateSyntaxError("%r tag takes two or four arguments" % bits[0])
+    elif bits[1] != 'as':
+        raise template.TemplateSyntaxError("first argument to %r tag should be 'as'" % bits[0])
+    steps = 4
+    if len(bits) == 5:
+        if bits[3] != 'steps':
+            raise template.TemplateSyntaxError("third argument to %r tag should be 'steps'" % bits[0])
+        try:
+            steps = int(bits[4])
+        except ValueError:
+            raise template.TemplateSyntaxError("%r tag's steps must be a number" % bits[0])
+    return JellyrollTagCloudNode(bits[2], steps)
+get_jellyroll_tag_cloud = register.tag(get_jellyroll_tag_cloud)
+
+class JellyrollTagCloudNode(template.Node):
+    def __init__(self, context_var, steps=4):
+        self.context_var = context_var
+        self.steps = steps
+
+    @instrumented_render
+    def render(self, context):
+        context[self.context_var] = Item.objects.tag_cloud(self.steps)
+        return ''
@@ -1,4 +1,7 @@
 from test_items import *
 from test_tags import *
 from test_views import *
-from test_misc import *
\ No newline at end of file
+from test_misc import *
+from test_providers import *
+from test_twitter import *
+from test_flickr import *
@@ -0,0 +1,158 @@
+"""
+Canned responses from the APIs the providers read, used by
+``jellyroll.tests.benchmarks.providers`` to replay an update without touching
+the network.
+
+Each document follows the shape of the live service's response, cut down to
+a single record. The record is a ``%``-style template (``*_RECORD``) so the
+replayer can stamp out as many distinct records as a benchmark needs, and the
+document around it has a ``%(records)s`` slot for them to go into.
+
+"""
+
+#
+# Flickr (JSON, through the REST API)
+#
+
+FLICKR_LICENSES = """{"licenses": {"license": [
+    {"id": "0", "name": "All Rights Reserved", "url": ""},
+    {"id": "2", "name": "Attribution-NonCommercial License", "url": "http:\\/\\/creativecommons.org\\/licenses\\/by-nc\\/2.0\\/"},
+    {"id": "4", "name": "Attribution License", "url": "http:\\/\\/creativecommons.org\\/licenses\\/by\\/2.0\\/"}
+]}, "stat": "ok"}"""
+
+FLICKR_PERSON = """{"person": {"id": "%(user_id)s", "nsid": "%(user_id)s",
+    "username": {"_content": "jellyroll"},
+    "photosurl": {"_content": "http:\\/\\/www.flickr.com\\/photos\\/jellyroll\\/"}}, "stat": "ok"}"""
+
+FLICKR_PHOTOSETS = """{"photosets": {"photoset": []}, "stat": "ok"}"""
+
+FLICKR_PHOTOS = """{"photos": {"page": %(page)d, "pages": %(pages)d, "perpage": 500, "total": "%(total)d",
+    "photo": [%(records)s]}, "stat": "ok"}"""
+
+FLICKR_PHOTOS_RECORD = """{"id": "%(id)s", "owner": "%(user_id)s", "secret": "%(secret)s", "server": "3045", "farm": 4,
+    "title": "Photo %(id)s", "ispublic": 1, "isfriend": 0, "isfamily": 0, "license": "%(license)s",
+    "datetaken": "%(datetaken)s", "datetakengranularity": "0"}"""
+
+FLICKR_PHOTO_INFO = """{"photo": {"id": "%(id)s", "secret": "%(secret)s", "server": "3045", "farm": 4,
+    "dateuploaded": "%(posted)d", "license": "4",
+    "owner": {"nsid": "%(user_id)s", "username": "jellyroll", "realname": "Jelly Roll", "location": ""},
+    "title": {"_content": "Photo %(id)s"},
+    "description": {"_content": "Taken on the way home, frame %(id)s."},
+    "dates": {"posted": "%(posted)d", "taken": "%(datetaken)s", "takengranularity": "0", "lastupdate": "%(posted)d"},
+    "comments": {"_content": "%(comments)d"},
+    "tags": {"tag": [
+        {"id": "1-%(id)s-1", "author": "%(user_id)s", "raw": "street", "_content": "street", "machine_tag": 0},
+        {"id": "1-%(id)s-2", "author": "%(user_id)s", "raw": "%(tag)s", "_content": "%(tag)s", "machine_tag": 0},
+        {"id": "1-%(id)s-3", "author": "%(user_id)s", "raw": "geo:lat=51.5", "_content": "geolat515", "machine_tag": 1}
+    ]}}, "stat": "ok"}"""
+
+FLICKR_PHOTO_EXIF = """{"photo": {"id": "%(id)s", "secret": "%(secret)s", "server": "3045", "farm": 4, "exif": [
+    {"tagspace": "IFD0", "tagspaceid": 0, "tag": "271", "label": "Make", "raw": {"_content": "Canon"}},
+    {"tagspace": "IFD0", "tagspaceid": 0, "tag": "272", "label": "Model", "raw": {"_content": "Canon EOS 20D"}},
+    {"tagspace": "EXIF", "tagspaceid": 0, "tag": "33434", "label": "Exposure", "raw": {"_content": "1/125"}, "clean": {"_content": "0.008 sec (1/125)"}},
+    {"tagspace": "EXIF", "tagspaceid": 0, "tag": "33437", "label": "Aperture", "raw": {"_content": "56/10"}, "clean": {"_content": "f/5.6"}},
+    {"tagspace": "EXIF", "tagspaceid": 0, "tag": "34855", "label": "ISO Speed", "raw": {"_content": "400"}},
+    {"tagspace": "EXIF", "tagspaceid": 0, "tag": "37386", "label": "Focal Length", "raw": {"_content": "50/1"}, "clean": {"_content": "50 mm"}}
+]}, "stat": "ok"}"""
+
+#
+# Last.fm (XML, web services 1.0)
+#
+
+LASTFM_RECENT_TRACKS = """<?xml version="1.0" encoding="UTF-8"?>
+<recenttracks user="jellyroll">
+%(records)s
+</recenttracks>"""
+
+LASTFM_RECENT_TRACKS_RECORD = """<track streamable="false">
+    <artist mbid="%(artist_mbid)s">%(artist)s</artist>
+    <name>%(track)s</name>
+    <mbid>%(track_mbid)s</mbid>
+    <album mbid="">Album %(album)d</album>
+    <url>http://www.last.fm/music/%(artist_url)s/_/%(track_url)s</url>
+    <date uts="%(uts)d">%(date)s</date>
+</track>"""
+
+LASTFM_TOP_TAGS = """<?xml version="1.0" encoding="UTF-8"?>
+<toptags>
+<tag><name>indie</name><count>100</count><url>http://www.last.fm/tag/indie</url></tag>
+<tag><name>rock</name><count>74</count><url>http://www.last.fm/tag/rock</url></tag>
+<tag><name>%(tag)s</name><count>31</count><url>http://www.last.fm/tag/%(tag)s</url></tag>
+<tag><name>seen live</name><count>12</count><url>http://www.last.fm/tag/seen%%20live</url></tag>
+<tag><name>favourites</name><count>3</count><url>http://www.last.fm/tag/favourites</url></tag>
+</toptags>"""
+
+#
+# Twitter (RSS 2.0 user timeline)
+#
+
+TWITTER_TIMELINE = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0">
+  <channel>
+    <title>Twitter / jellyroll</title>
+    <link>http://twitter.com/jellyroll</link>
+    <description>Twitter updates from Jelly Roll / jellyroll.</description>
+    <language>en-us</language>
+    <ttl>40</ttl>
+%(records)s
+  </channel>
+</rss>"""
+
+TWITTER_TIMELINE_RECORD = """    <item>
+      <title>jellyroll: %(text)s</title>
+      <description>jellyroll: %(text)s</description>
+      <pubDate>%(date)s</pubDate>
+      <guid>http://twitter.com/jellyroll/statuses/%(id)d</guid>
+      <link>http://twitter.com/jellyroll/statuses/%(id)d</link>
+    </item>"""
+
+#
+# Delicious (XML, API v1)
+#
+
+DELICIOUS_UPDATE = """<?xml version="1.0" encoding="UTF-8"?>
+<update time="%(time)s" inboxnew="0"/>"""
+
+DELICIOUS_DATES = """<?xml version="1.0" encoding="UTF-8"?>
+<dates tag="" user="jellyroll">
+%(records)s
+</dates>"""
+
+DELICIOUS_DATES_RECORD = """  <date count="%(count)d" date="%(date)s"/>"""
+
+DELICIOUS_POSTS = """<?xml version="1.0" encoding="UTF-8"?>
+<posts dt="%(date)s" tag="" user="jellyroll">
+%(records)s
+</posts>"""
+
+DELICIOUS_POSTS_RECORD = """  <post href="http://example.com/articles/%(id)d/" hash="%(hash)s" description="Article %(id)d" tag="%(tags)s" time="%(time)s" extended="Worth reading again; see section %(id)d." shared="yes"/>"""
+
+#
+# Google search history (RSS 2.0)
+#
+
+GOOGLE_HISTORY = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:smh="http://www.google.com/searchhistory">
+  <channel>
+    <title>Google search history</title>
+    <link>http://www.google.com/searchhistory</link>
+    <description>Search history for jellyroll</description>
+%(records)s
+  </channel>
+</rss>"""
+
+GOOGLE_HISTORY_RECORD = """    <item>
+      <title>%(query)s</title>
+      <link>http://www.google.com/search?q=%(query_url)s</link>
+      <category>web query</category>
+      <pubDate>%(date)s</pubDate>
+      <guid isPermaLink="false">http://www.google.com/searchhistory/%(guid)s</guid>
+    </item>
+    <item>
+      <title>%(query)s - Result</title>
+      <link>http://example.com/results/%(id)d</link>
+      <category>web result</category>
+      <pubDate>%(date)s</pubDate>
+      <guid isPermaLink="false">http://www.google.com/searchhistory/r%(guid)s</guid>
+      <smh:query_guid>%(guid)s</smh:query_guid>
+    </item>"""
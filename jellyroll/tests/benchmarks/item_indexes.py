@@ -0,0 +1,113 @@
+"""
+Compare query plans and timings for the hot ``Item`` queries with and
+without the indexes from ``jellyroll/sql/item.sql``, on a SQLite table of
+synthetic items (a million by default)::
+
+    python -m jellyroll.tests.benchmarks.item_indexes [rows]
+
+This talks to SQLite directly, so it doesn't need a Django project.
+
+"""
+import datetime
+import md5
+import random
+import sqlite3
+import sys
+import time
+
+SCHEMA = """
+CREATE TABLE jellyroll_item (
+    id integer NOT NULL PRIMARY KEY,
+    content_type_id integer NOT NULL,
+    object_id text NOT NULL,
+    url varchar(1000) NOT NULL,
+    timestamp datetime NOT NULL,
+    tags varchar(2500) NOT NULL,
+    source varchar(100) NOT NULL,
+    source_id text NOT NULL,
+    source_id_hash varchar(32) NOT NULL,
+    object_str text NOT NULL,
+    UNIQUE (content_type_id, object_id)
+);
+"""
+
+INDEXES = [
+    "CREATE INDEX jellyroll_item_timestamp ON jellyroll_item (timestamp)",
+    "CREATE INDEX jellyroll_item_content_type_timestamp ON jellyroll_item (content_type_id, timestamp)",
+    "CREATE INDEX jellyroll_item_source_source_id_hash ON jellyroll_item (source, source_id_hash)",
+]
+
+SOURCES = ["FlickrProvider", "LastfmProvider", "TwitterProvider", "DeliciousProvider",
+           "GitSCMProvider", "YoutubeProvider", "GoogleSearchProvider", "MagnoliaProvider"]
+
+def source_id(n):
+    return "http://example.com/%s/some/long/source/id/%d" % (SOURCES[n % len(SOURCES)], n)
+
+FIND_SOURCE, FIND_SOURCE_ID = SOURCES[12345 % len(SOURCES)], source_id(12345)
+
+# (description, SQL, parameters[, SQL and parameters once there's an index to use])
+QUERIES = [
+    ("get_for_model, newest 20",
+     "SELECT id FROM jellyroll_item WHERE content_type_id = ? ORDER BY timestamp DESC LIMIT 20",
+     (3,)),
+    ("get_last_update_of_model",
+     "SELECT timestamp FROM jellyroll_item WHERE content_type_id = ? ORDER BY timestamp DESC LIMIT 1",
+     (5,)),
+    ("calendar day",
+     "SELECT id FROM jellyroll_item WHERE timestamp BETWEEN ? AND ? ORDER BY timestamp DESC",
+     ("2005-06-01 00:00:00", "2005-06-01 23:59:59")),
+    ("recent items",
+     "SELECT id FROM jellyroll_item ORDER BY timestamp DESC LIMIT 10",
+     ()),
+    ("find by source id",
+     "SELECT id FROM jellyroll_item WHERE source = ? AND source_id = ?",
+     (FIND_SOURCE, FIND_SOURCE_ID),
+     "SELECT id FROM jellyroll_item WHERE source = ? AND source_id_hash = ? AND source_id = ?",
+     (FIND_SOURCE, md5.new(FIND_SOURCE_ID).hexdigest(), FIND_SOURCE_ID)),
+]
+
+def populate(conn, rows):
+    start = datetime.datetime(2000, 1, 1)
+    def items():
+        for n in xrange(rows):
+            timestamp = start + datetime.timedelta(minutes=random.randint(0, 10*365*24*60))
+            sid = source_id(n)
+            yield (n + 1, n % len(SOURCES) + 1, str(n), "", timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                   "", SOURCES[n % len(SOURCES)], sid, md5.new(sid).hexdigest(), "")
+    conn.executemany("INSERT INTO jellyroll_item VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", items())
+    conn.commit()
+
+def run_queries(conn, indexed, repeat=20):
+    for query in QUERIES:
+        description, sql, params = query[:3]
+        if indexed and len(query) > 3:
+            sql, params = query[3:]
+        plan = "; ".join([ row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params) ])
+        began = time.time()
+        for i in range(repeat):
+            conn.execute(sql, params).fetchall()
+        elapsed = (time.time() - began) / repeat * 1000
+        print "  %-26s %9.3f ms  %s" % (description, elapsed, plan)
+
+def main(rows=1000000):
+    random.seed(0)
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(SCHEMA)
+    began = time.time()
+    populate(conn, rows)
+    print "Populated %d items in %.1fs" % (rows, time.time() - began)
+
+    print "Without indexes:"
+    run_queries(conn, False)
+
+    began = time.time()
+    for index in INDEXES:
+        conn.execute(index)
+    conn.execute("ANALYZE")
+    print "Created indexes in %.1fs" % (time.time() - began)
+
+    print "With indexes:"
+    run_queries(conn, True)
+
+if __name__ == "__main__":
+    main(*[ int(arg) for arg in sys.argv[1:] ])
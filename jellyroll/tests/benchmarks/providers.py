@@ -0,0 +1,363 @@
+"""
+Time ``Provider.run_update`` end to end, replaying canned API responses (see
+``fixtures``) through a stand-in for ``utils.fetch_response`` and storing the
+results in a fresh SQLite database::
+
+    python jellyroll/tests/benchmarks/providers.py [-p flickr,lastfm] [-s 1000,10000]
+
+Each provider is run at each scale (1,000, 10,000 and 100,000 records by
+default) in a process of its own, so peak RSS isn't inflated by earlier runs,
+and reports wall time, database statements per stored record, records per
+second and the peak RSS of the run.
+
+This configures its own settings, so it doesn't need a Django project; it does
+need the providers' own dependencies (httplib2, feedparser, dateutil, ...).
+It's run as a script rather than with ``python -m`` because importing the
+``jellyroll`` and ``jellyroll.tests`` packages on the way to it would need
+settings before it could configure them.
+Sleeps that only exist to be polite to a remote API (the Delicious client's
+throttle, Flickr's rate limiter) are skipped, as the network they stand in for
+is.
+
+"""
+import cgi
+import datetime
+import math
+import md5
+import optparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib
+import urlparse
+
+from django.utils import simplejson
+import fixtures
+
+SCALES = [1000, 10000, 100000]
+
+BENCHMARK_SETTINGS = dict(
+    DATABASE_ENGINE = 'sqlite3',
+    FLICKR_API_KEY = 'benchmark',
+    FLICKR_USER_ID = '12345678@N00',
+    FLICKR_API_CALLS_PER_SECOND = 0,
+    LASTFM_USERNAME = 'jellyroll',
+    TWITTER_USERNAME = 'jellyroll',
+    DELICIOUS_USERNAME = 'jellyroll',
+    DELICIOUS_PASSWORD = 'benchmark',
+    GOOGLE_USERNAME = 'jellyroll',
+    GOOGLE_PASSWORD = 'benchmark',
+)
+
+# Replayed records are a minute apart, newest first, counting back from here.
+NEWEST = datetime.datetime(2009, 1, 1, 12, 0)
+
+def record_time(i):
+    return NEWEST - datetime.timedelta(minutes=i)
+
+def rfc822(dt):
+    return dt.strftime("%a, %d %b %Y %H:%M:%S +0000")
+
+#
+# Replayed APIs
+#
+
+class ReplayResponse(dict):
+    status = 200
+
+class Replay(object):
+    """
+    A stand-in for one provider's API, serving ``records`` records. Calling it
+    with a URL returns the content the API would have.
+
+    """
+    # What goes between rendered records in a document.
+    separator = "\n"
+
+    def __init__(self, records):
+        self.records = records
+        self.requests = 0
+
+    def __call__(self, url):
+        self.requests += 1
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+        params = dict((k, v[0]) for k, v in cgi.parse_qs(query).items())
+        return self.respond(path, params)
+
+    def respond(self, path, params):
+        raise NotImplementedError()
+
+    def render(self, document, template, indices, **kwargs):
+        kwargs['records'] = self.separator.join([ template % self.record(i) for i in indices ])
+        return document % kwargs
+
+    def record(self, i):
+        raise NotImplementedError()
+
+class FlickrReplay(Replay):
+    per_page = 500
+    separator = ","
+
+    def respond(self, path, params):
+        method = params['method']
+        if method == 'flickr.photos.licenses.getInfo':
+            return fixtures.FLICKR_LICENSES
+        if method == 'flickr.people.getInfo':
+            return fixtures.FLICKR_PERSON % {'user_id': params['user_id']}
+        if method == 'flickr.photosets.getList':
+            return fixtures.FLICKR_PHOTOSETS
+        if method == 'flickr.photos.search':
+            # Skip the records taken after max_taken_date, if it's given.
+            start = 0
+            if 'max_taken_date' in params:
+                later = NEWEST - datetime.datetime.strptime(params['max_taken_date'], "%Y-%m-%d %H:%M:%S")
+                start = max(0, int(math.ceil(later.days * 24 * 60 + later.seconds / 60.0)))
+            total = max(0, self.records - start)
+            page = int(params['page'])
+            first = start + (page - 1) * self.per_page
+            return self.render(fixtures.FLICKR_PHOTOS, fixtures.FLICKR_PHOTOS_RECORD,
+                               xrange(first, min(first + self.per_page, self.records)),
+                               page = page,
+                               pages = max(1, (total + self.per_page - 1) // self.per_page),
+                               total = total)
+        if method == 'flickr.photos.getInfo':
+            return fixtures.FLICKR_PHOTO_INFO % self.record(int(params['photo_id']) - 1000000)
+        if method == 'flickr.photos.getExif':
+            return fixtures.FLICKR_PHOTO_EXIF % self.record(int(params['photo_id']) - 1000000)
+        raise ValueError("No recording of %s" % method)
+
+    def record(self, i):
+        taken = record_time(i)
+        return {
+            'id': str(1000000 + i),
+            'user_id': BENCHMARK_SETTINGS['FLICKR_USER_ID'],
+            'secret': md5.new(str(i)).hexdigest()[:10],
+            'license': ("0", "2", "4")[i % 3],
+            'datetaken': taken.strftime("%Y-%m-%d %H:%M:%S"),
+            'posted': time.mktime((taken + datetime.timedelta(hours=2)).timetuple()),
+            'comments': i % 7,
+            'tag': "roll%d" % (i % 40),
+        }
+
+class LastfmReplay(Replay):
+    artists = 250
+
+    def respond(self, path, params):
+        if path.endswith('/recenttracks.xml'):
+            return self.render(fixtures.LASTFM_RECENT_TRACKS, fixtures.LASTFM_RECENT_TRACKS_RECORD,
+                               xrange(self.records))
+        if path.endswith('/toptags.xml'):
+            return fixtures.LASTFM_TOP_TAGS % {'tag': "genre%d" % (int(md5.new(path).hexdigest()[:4], 16) % 40)}
+        raise ValueError("No recording of %s" % path)
+
+    def record(self, i):
+        played = record_time(i)
+        artist = "The Band %d" % (i % self.artists)
+        track = "Song %d" % i
+        return {
+            'artist': artist,
+            'artist_mbid': md5.new(artist).hexdigest(),
+            'artist_url': urllib.quote_plus(artist),
+            'track': track,
+            'track_mbid': md5.new(track).hexdigest(),
+            'track_url': urllib.quote_plus(track),
+            'album': i % 1000,
+            'uts': time.mktime(played.timetuple()),
+            'date': played.strftime("%d %b %Y, %H:%M"),
+        }
+
+class TwitterReplay(Replay):
+    def respond(self, path, params):
+        if path.startswith('/statuses/user_timeline/'):
+            return self.render(fixtures.TWITTER_TIMELINE, fixtures.TWITTER_TIMELINE_RECORD,
+                               xrange(self.records))
+        raise ValueError("No recording of %s" % path)
+
+    def record(self, i):
+        text = "Reading about #topic%d" % (i % 50)
+        if i % 3 == 0:
+            text += " at http://example.com/links/%d" % (i % 500)
+        if i % 4 == 0:
+            text += " with @friend%d" % (i % 20)
+        return {'id': 1000000 + i, 'text': text, 'date': rfc822(record_time(i))}
+
+class DeliciousReplay(Replay):
+    per_day = 100
+
+    def days(self):
+        return (self.records + self.per_day - 1) // self.per_day
+
+    def day(self, d):
+        return (NEWEST - datetime.timedelta(days=d)).date()
+
+    def respond(self, path, params):
+        if path == '/v1/posts/update':
+            return fixtures.DELICIOUS_UPDATE % {'time': NEWEST.strftime("%Y-%m-%dT%H:%M:%SZ")}
+        if path == '/v1/posts/dates':
+            dates = [ fixtures.DELICIOUS_DATES_RECORD % {'count': self.per_day, 'date': self.day(d)}
+                      for d in xrange(self.days()) ]
+            return fixtures.DELICIOUS_DATES % {'records': "\n".join(dates)}
+        if path == '/v1/posts/get':
+            dt = datetime.datetime.strptime(params['dt'], "%Y-%m-%d").date()
+            d = (NEWEST.date() - dt).days
+            first = d * self.per_day
+            return self.render(fixtures.DELICIOUS_POSTS, fixtures.DELICIOUS_POSTS_RECORD,
+                               xrange(first, min(first + self.per_day, self.records)),
+                               date = params['dt'])
+        raise ValueError("No recording of %s" % path)
+
+    def record(self, i):
+        d, n = divmod(i, self.per_day)
+        posted = datetime.datetime.combine(self.day(d), datetime.time(12)) - datetime.timedelta(minutes=n)
+        return {
+            'id': i,
+            'hash': md5.new("http://example.com/articles/%d/" % i).hexdigest(),
+            'tags': "reading topic%d" % (i % 60),
+            'time': posted.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+
+class GoogleReplay(Replay):
+    def respond(self, path, params):
+        if path == '/searchhistory/':
+            return self.render(fixtures.GOOGLE_HISTORY, fixtures.GOOGLE_HISTORY_RECORD,
+                               xrange(self.records))
+        raise ValueError("No recording of %s" % path)
+
+    def record(self, i):
+        query = "jellyroll question %d" % i
+        return {
+            'id': i,
+            'guid': "q%08d" % i,
+            'query': query,
+            'query_url': urllib.quote_plus(query),
+            'date': rfc822(record_time(i)),
+        }
+
+# name: (provider module, replay, the contrib apps its models and initial data come from)
+PROVIDERS = {
+    'flickr': ('jellyroll.providers.flickr', FlickrReplay, ['jellyroll.contrib.photo']),
+    'lastfm': ('jellyroll.providers.lastfm', LastfmReplay, ['jellyroll.contrib.track']),
+    'twitter': ('jellyroll.providers.twitter', TwitterReplay, ['jellyroll.contrib.message', 'jellyroll.contrib.utils']),
+    'delicious': ('jellyroll.providers.delicious', DeliciousReplay, ['jellyroll.contrib.bookmark']),
+    'gsearch': ('jellyroll.providers.gsearch', GoogleReplay, ['jellyroll.contrib.search']),
+}
+
+#
+# Running
+#
+
+def replay_through(replay):
+    """
+    Route every provider request to ``replay`` instead of the network.
+
+    """
+    from jellyroll.providers import utils
+
+    def fetch_response(url, method="GET", body=None, username=None, password=None, headers=None):
+        return ReplayResponse(), replay(url)
+
+    def fetch_resource(url, method="GET", body=None, username=None, password=None, headers=None):
+        return replay(url)
+
+    utils.fetch_response = fetch_response
+    utils.fetch_resource = fetch_resource
+
+class NoSleep(object):
+    """The parts of ``time`` the Delicious client uses, minus the sleeping."""
+    time = staticmethod(time.time)
+    def sleep(self, seconds):
+        pass
+
+def run(name, records, database):
+    """
+    Update ``name`` against ``records`` replayed records in a new database at
+    ``database``, returning the measurements.
+
+    """
+    module_name, replay_cls, apps = PROVIDERS[name]
+    from django.conf import settings
+    settings.configure(DATABASE_NAME=database, TEST_DATABASE_NAME=database,
+                       INSTALLED_APPS=['django.contrib.contenttypes', 'tagging', 'jellyroll'] + apps,
+                       **BENCHMARK_SETTINGS)
+
+    # Load the provider (and so its models) before the tables are created.
+    from jellyroll.core.registry import get_provider_info
+    provider_cls = get_provider_info(module_name).load()
+
+    from django.db import connection
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+    from jellyroll.core.instrumentation import StatementCounter
+    from jellyroll.core.models import Item
+    provider = provider_cls()
+    if name == 'delicious':
+        sys.modules[module_name].time = NoSleep()
+
+    replay = replay_cls(records)
+    replay_through(replay)
+    counter = StatementCounter(connection)
+    counter.install()
+    began = time.time()
+    try:
+        provider.run_update()
+    finally:
+        elapsed = time.time() - began
+        counter.uninstall()
+
+    stored = Item.objects.count()
+    return {
+        'provider': name,
+        'records': records,
+        'stored': stored,
+        'requests': replay.requests,
+        'seconds': elapsed,
+        'statements_per_record': float(counter.statements) / max(stored, 1),
+        'records_per_second': stored / max(elapsed, 1e-9),
+        # ru_maxrss is in kilobytes on Linux (bytes on Mac OS X)
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+    }
+
+def run_in_subprocess(name, records):
+    directory = tempfile.mkdtemp()
+    try:
+        child = subprocess.Popen([sys.executable, os.path.splitext(os.path.abspath(__file__))[0] + '.py',
+                                  '--run', name, str(records), os.path.join(directory, 'jellyroll.db')],
+                                 stdout=subprocess.PIPE)
+        output = child.communicate()[0]
+        if child.returncode:
+            raise RuntimeError("Benchmarking %s with %s records failed" % (name, records))
+        return simplejson.loads(output.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(directory)
+
+def main(argv):
+    parser = optparse.OptionParser(usage="%prog [-p provider,...] [-s records,...]")
+    parser.add_option("-p", "--providers", default=",".join(sorted(PROVIDERS)),
+                      help="Providers to benchmark (default: all of them).")
+    parser.add_option("-s", "--scales", default=",".join(map(str, SCALES)),
+                      help="Numbers of records to replay (default: %default).")
+    parser.add_option("--run", nargs=3, help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args(argv)
+
+    if options.run:
+        name, records, database = options.run
+        print simplejson.dumps(run(name, int(records), database))
+        return
+
+    print "%-10s %8s %8s %9s %9s %12s %10s" % (
+        "provider", "records", "stored", "wall (s)", "stmts/rec", "records/s", "peak (MB)")
+    for name in options.providers.split(","):
+        for records in [ int(scale) for scale in options.scales.split(",") ]:
+            result = run_in_subprocess(name, records)
+            print "%(provider)-10s %(records)8d %(stored)8d %(seconds)9.1f %(statements_per_record)9.2f " \
+                  "%(records_per_second)12.1f %(peak_rss_mb)10.1f" % result
+            sys.stdout.flush()
+
+if __name__ == "__main__":
+    # Make the checkout this script is in importable.
+    sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+    main(sys.argv[1:])
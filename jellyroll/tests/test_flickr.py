@@ -0,0 +1,81 @@
+import threading
+import time
+from django.conf import settings
+from django.test import TestCase
+from django.utils import simplejson
+from jellyroll.models import Checkpoint
+from jellyroll.contrib.photo.models import Photo, PhotoExif
+from jellyroll.providers import utils
+from jellyroll.providers.flickr import FlickrProvider, CURSOR_FORMAT
+from jellyroll.tests.benchmarks.providers import FlickrReplay, record_time
+
+class FakeFlickrClient(object):
+    """
+    Stands in for ``FlickrClient``, answering from a replayed API (see
+    ``jellyroll.tests.benchmarks.providers``) and noting which thread made
+    each call.
+
+    """
+    def __init__(self, replay, calls, method='flickr'):
+        self.replay = replay
+        self.calls = calls
+        self.method = method
+
+    def __getattr__(self, method):
+        return FakeFlickrClient(self.replay, self.calls, '%s.%s' % (self.method, method))
+
+    def __call__(self, **params):
+        params['method'] = self.method
+        self.calls.append( (self.method, threading.currentThread().getName()) )
+        time.sleep(0.01)
+        return simplejson.loads(self.replay.respond('/services/rest/', params))
+
+class FlickrProviderTest(TestCase):
+
+    def setUp(self):
+        self.old_settings = dict([ (name, getattr(settings, name)) for name in ('FLICKR_API_KEY', 'FLICKR_USER_ID')
+                                   if hasattr(settings, name) ])
+        settings.FLICKR_API_KEY = "test"
+        settings.FLICKR_USER_ID = "12345678@N00"
+
+    def tearDown(self):
+        for name in ('FLICKR_API_KEY', 'FLICKR_USER_ID'):
+            if name in self.old_settings:
+                setattr(settings, name, self.old_settings[name])
+            else:
+                delattr(settings, name)
+
+    def update(self, replay):
+        calls = []
+        provider = FlickrProvider()
+        provider.client = FakeFlickrClient(replay, calls)
+        provider.run_update()
+        return calls
+
+    def testDetailsAreFetchedConcurrently(self):
+        replay = FlickrReplay(12)
+        calls = self.update(replay)
+        self.assertEqual(Photo.objects.count(), 12)
+        self.assertEqual(PhotoExif.objects.filter(model=u"Canon EOS 20D", focal_length=50).count(), 12)
+        self.assertEqual(len([ method for method, thread in calls if method == 'flickr.photos.getExif' ]), 12)
+        if utils.ThreadPool is not None:
+            threads = set([ thread for method, thread in calls if method == 'flickr.photos.getInfo' ])
+            self.assert_(len(threads) > 1, threads)
+
+        # Photos that are already stored don't have their EXIF fetched again.
+        calls = self.update(replay)
+        self.assertEqual([ method for method, thread in calls if method == 'flickr.photos.getExif' ], [])
+        self.assertEqual(Photo.objects.count(), 12)
+
+    def testInterruptedCrawlResumesFromOldestPhoto(self):
+        # A crawl got through the photos taken at record_time(0) to
+        # record_time(5) before it was interrupted.
+        checkpoint = FlickrProvider().get_checkpoint(Photo)
+        checkpoint.cursor = "%s,%s" % (record_time(0).strftime(CURSOR_FORMAT), record_time(5).strftime(CURSOR_FORMAT))
+        checkpoint.save()
+
+        calls = self.update(FlickrReplay(12))
+        self.assertEqual(len([ method for method, thread in calls if method == 'flickr.photos.getInfo' ]), 7)
+        self.assertEqual(Photo.objects.count(), 7)
+        checkpoint = Checkpoint.objects.get(provider="FlickrProvider", model="photo")
+        self.assertEqual((checkpoint.timestamp, checkpoint.cursor), (record_time(0), u""))
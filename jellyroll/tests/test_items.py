@@ -83,6 +83,26 @@ class PhotosTest(TestCase):
         p = Photo.objects.get(pk="1")
         self.assertEqual(p.exif, {"Make" : "Nokia 6682", "Aperture" : "f/3.2"})
         
+    def testEXIFIsDecodedOnce(self):
+        p = Photo.objects.get(pk="1")
+        p.exif = {"Make" : "Canon"}
+        self.assert_(p.exif is p.exif)
+        p._exif = '{"Make": "Nikon"}'
+        self.assertEqual(p.exif, {"Make" : "Nikon"})
+        
+    def testPhotoExif(self):
+        from jellyroll.contrib.photo.models import PhotoExif
+        p = Photo.objects.get(pk="1")
+        p.exif = {"Make" : "Canon", "Model" : "Canon EOS 20D", "Lens" : "EF50mm f/1.8 II",
+                  "Focal Length" : "50 mm", "Exposure" : "0.008 sec (1/125)",
+                  "Aperture" : "f/5.6", "ISO Speed" : "400"}
+        p.save()
+        PhotoExif.objects.update_for_photo(p)
+        e = PhotoExif.objects.get(lens="EF50mm f/1.8 II")
+        self.assertEqual(e.photo, p)
+        self.assertEqual(e.model, "Canon EOS 20D")
+        self.assertEqual((e.focal_length, e.exposure, e.aperture, e.iso), (50.0, 0.008, 5.6, 400))
+        
 class CodeCommitTest(TestCase):
     fixtures = ["codecommits.json"]
             
@@ -142,3 +162,31 @@ class ItemTest(TestCase):
         #self.assertEqual(Item.objects.models_by_name["video"], Video)
         #self.assertEqual(Item.objects.models_by_name["websearch"], WebSearch)
         
+
+class ItemQuerySetTest(TestCase):
+    fixtures = ["bookmarks.json", "photos.json", "tracks.json", "videos.json"]
+
+    def setUp(self):
+        self.old_debug = settings.DEBUG
+        settings.DEBUG = True
+
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+
+    def testWithObjects(self):
+        from django.db import connection, reset_queries
+        ContentType.objects.clear_cache()
+        reset_queries()
+        items = list(Item.objects.with_objects())
+        for item in items:
+            self.assertNotEqual(item.object, None)
+            unicode(item)
+        types = len(set([ item.content_type_id for item in items ]))
+        # one query for the items, one each for the content types and objects
+        self.assertEqual(len(connection.queries), 1 + 2 * types)
+
+    def testWithObjectsSurvivesFiltering(self):
+        qs = Item.objects.with_objects().filter(content_type=CT(Photo))[:2]
+        self.assert_(qs._with_objects)
+        self.assertEqual([ item.object for item in qs ],
+                         [ Item.objects.get(pk=item.pk).object for item in qs ])
@@ -13,4 +13,100 @@ class MiscTests(unittest.TestCase):
             'jellyroll.providers.magnolia',
             'jellyroll.providers.svn',
             'jellyroll.providers.youtube',
-        ])
\ No newline at end of file
+        ])
+
+class FakeSession(object):
+    def __init__(self):
+        self.credentials = []
+    def add_credentials(self, username, password):
+        self.credentials.append( (username, password) )
+    def clear_credentials(self):
+        self.credentials = []
+    def request(self, url, method, body, headers):
+        if url.endswith("/timeout"):
+            import socket
+            raise socket.timeout("timed out")
+        return ({'status': '200'}, list(self.credentials))
+
+class HttpSessionPoolTests(unittest.TestCase):
+    def setUp(self):
+        from jellyroll.providers.utils.session import HttpSessionPool
+        self.pool = HttpSessionPool(size=2)
+        self.pool._new_session = FakeSession
+
+    def test_sessions_are_reused(self):
+        first = self.pool.acquire("http://example.com/a")
+        self.pool.release("http://example.com/a", first)
+        self.assert_(self.pool.acquire("http://EXAMPLE.com/b") is first)
+
+    def test_pool_is_bounded_per_host(self):
+        self.pool.acquire("http://example.com/")
+        self.pool.acquire("http://example.com/")
+        self.assertEqual(self.pool._created[("http", "example.com")], 2)
+        self.assert_(self.pool._idle[("http", "example.com")].empty())
+
+        # Other hosts (and schemes) have sessions of their own.
+        self.pool.acquire("https://example.com/")
+        self.pool.acquire("http://example.org:8000/")
+        self.assertEqual(self.pool._created[("https", "example.com")], 1)
+        self.assertEqual(self.pool._created[("http", "example.org:8000")], 1)
+
+    def test_credentials_do_not_leak(self):
+        response, creds = self.pool.request("http://example.com/", username="u", password="p")
+        self.assertEqual(creds, [("u", "p")])
+        response, creds = self.pool.request("http://example.com/")
+        self.assertEqual(creds, [])
+
+    def test_failed_requests_are_observed(self):
+        import socket
+        from jellyroll.providers.utils.stats import RunStats
+        stats = RunStats()
+        self.pool.add_observer(stats.observe_request)
+        self.assertRaises(socket.timeout, self.pool.request, "http://example.com/timeout")
+        self.assertEqual((stats.http_requests, stats.http_errors), (1, 1))
+        # The session went back to the pool all the same.
+        self.assertEqual(self.pool._idle[("http", "example.com")].qsize(), 1)
+
+
+class RateLimiterTests(unittest.TestCase):
+    def test_calls_are_spaced_out(self):
+        import time
+        from jellyroll.providers.utils import RateLimiter
+        limiter = RateLimiter(20)
+        start = time.time()
+        for i in range(4):
+            limiter.wait()
+        self.assert_(time.time() - start >= 0.14)
+
+    def test_bursts(self):
+        import time
+        from jellyroll.providers.utils import RateLimiter
+        limiter = RateLimiter(1, burst=3)
+        start = time.time()
+        for i in range(3):
+            limiter.wait()
+        self.assert_(time.time() - start < 0.5)
+
+    def test_no_limit(self):
+        from jellyroll.providers.utils import RateLimiter
+        limiter = RateLimiter(None)
+        limiter.wait()
+        self.assertEqual(limiter.tokens, limiter.burst)
+
+class RegistryTests(unittest.TestCase):
+    def test_builtin_providers_match_their_meta(self):
+        from jellyroll.core.registry import BUILTIN_PROVIDERS
+        for info in BUILTIN_PROVIDERS:
+            try:
+                provider_cls = info.load()
+            except ImportError:
+                continue    # its dependencies aren't installed here
+            self.assertEqual(jellyroll.providers.get_registered_provider(info.module), info.class_name)
+            self.assertEqual(tuple(getattr(provider_cls._meta, 'settings', ())), info.settings)
+            self.assertEqual(tuple(getattr(provider_cls._meta, 'modules', ())), info.modules)
+
+    def test_enabled(self):
+        from jellyroll.core.registry import ProviderInfo
+        self.assert_(ProviderInfo('example', 'ExampleProvider', settings=('INSTALLED_APPS',), modules=('os.path',)).enabled())
+        self.failIf(ProviderInfo('example', 'ExampleProvider', settings=('JELLYROLL_NO_SUCH_SETTING',)).enabled())
+        self.failIf(ProviderInfo('example', 'ExampleProvider', modules=('jellyroll_no_such_module',)).enabled())
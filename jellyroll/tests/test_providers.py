@@ -0,0 +1,525 @@
+import datetime
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from django.conf import settings
+from django.test import TestCase
+import jellyroll
+from jellyroll.models import Item, Checkpoint, CacheEntry, ItemCount, ProviderRun, HttpValidator
+from jellyroll.contrib.code.models import CodeRepository, CodeCommit
+from jellyroll.contrib.track.models import Track
+from jellyroll.core.managers import hash_source_id
+from jellyroll.providers import Provider, StructuredDataProvider, utils
+
+try:
+    import git
+except ImportError:
+    git = None
+
+try:
+    import pysvn
+except ImportError:
+    pysvn = None
+
+
+class DummyTrackProvider(Provider):
+    class Meta:
+        models = (Track,)
+        chunk_size = 2
+
+    def __init__(self, tracks):
+        super(DummyTrackProvider,self).__init__()
+        self.tracks = tracks
+
+    def source_id(self, model_cls, extra):
+        return "dummy:%s:%s" % (extra['artist_name'], extra['track_name'])
+
+    def get_update_data(self, model_cls, model_str):
+        return self.tracks
+
+    def update_track(self, tracks):
+        self.incoming['track'] = [ dict(track) for track in tracks ]
+
+class StreamingTrackProvider(DummyTrackProvider):
+    class Meta:
+        models = (Track,)
+        chunk_size = 2
+
+    def update_track(self, tracks):
+        for track in tracks:
+            if track is None:
+                raise ValueError("crawl interrupted")
+            yield dict(track)
+
+class FailingTrackProvider(DummyTrackProvider):
+    class Meta:
+        models = (Track,)
+        chunk_size = 2
+
+    fail_on = u'Track 2'
+
+    def post_handle_item(self, item_instance, model_instance, data, created):
+        if data['track_name'] == self.fail_on:
+            raise ValueError("post_handle_item failed")
+        super(FailingTrackProvider,self).post_handle_item(item_instance, model_instance, data, created)
+
+class MbidTrackProvider(DummyTrackProvider):
+    class Meta:
+        models = (Track,)
+
+    def source_id(self, model_cls, extra):
+        return "dummy:%s" % extra['track_mbid']
+
+def make_track(n, **kwargs):
+    track = {
+        'artist_name': u'Artist %d' % n,
+        'track_name': u'Track %d' % n,
+        'url': u'http://example.com/%d/' % n,
+        'track_mbid': u'',
+        'artist_mbid': u'',
+        'timestamp': datetime.datetime(2008, 1, n),
+        'tags': u'',
+    }
+    track.update(kwargs)
+    return track
+
+class ProviderHandlingTest(TestCase):
+
+    def testCreatesObjectsAndItems(self):
+        DummyTrackProvider([ make_track(n) for n in range(1, 6) ]).run_update()
+        self.assertEqual(Track.objects.count(), 5)
+        self.assertEqual(Item.objects.filter(source="DummyTrackProvider").count(), 5)
+
+    def testRerunIsIdempotent(self):
+        tracks = [ make_track(n) for n in range(1, 6) ]
+        DummyTrackProvider(tracks).run_update()
+        DummyTrackProvider(tracks).run_update()
+        self.assertEqual(Track.objects.count(), 5)
+        self.assertEqual(Item.objects.filter(source="DummyTrackProvider").count(), 5)
+
+    def testUpdatesChangedObjects(self):
+        DummyTrackProvider([ make_track(1) ]).run_update()
+        DummyTrackProvider([ make_track(1, url=u'http://example.com/moved/') ]).run_update()
+        self.assertEqual(Track.objects.get().url, u'http://example.com/moved/')
+
+    def testItemsAreFoundBySourceIdHash(self):
+        track = make_track(1)
+        provider = DummyTrackProvider([ track ])
+        provider.run_update()
+        item = Item.objects.find(provider, Track, track)
+        self.assertEqual(item.source_id_hash, hash_source_id(provider.source_id(Track, track)))
+
+    def testItemCountsFollowUpdates(self):
+        DummyTrackProvider([ make_track(1), make_track(2) ]).run_update()
+        self.assertEqual(ItemCount.objects.counts_by_day(datetime.date(2008, 1, 1), datetime.date(2008, 1, 31)),
+                         {datetime.date(2008, 1, 1): 1, datetime.date(2008, 1, 2): 1})
+        DummyTrackProvider([ make_track(1, timestamp=datetime.datetime(2008, 1, 2)) ]).run_update()
+        self.assertEqual(ItemCount.objects.counts_by_day(datetime.date(2008, 1, 1), datetime.date(2008, 1, 31)),
+                         {datetime.date(2008, 1, 1): 0, datetime.date(2008, 1, 2): 2})
+        self.assertEqual(Item.objects.get(object_id=Track.objects.get(track_name=u'Track 1').pk).timestamp,
+                         datetime.datetime(2008, 1, 2))
+
+        # Re-importing unchanged records leaves the counts alone.
+        DummyTrackProvider([ make_track(1, timestamp=datetime.datetime(2008, 1, 2)), make_track(2) ]).run_update()
+        self.assertEqual(ItemCount.objects.counts_by_day(datetime.date(2008, 1, 1), datetime.date(2008, 1, 31)),
+                         {datetime.date(2008, 1, 1): 0, datetime.date(2008, 1, 2): 2})
+
+    def testUpdateDropsCachedSnippet(self):
+        from django import template
+        settings.JELLYROLL_RENDER_CACHE_TIMEOUT = 60
+        try:
+            MbidTrackProvider([ make_track(1, track_mbid=u'1') ]).run_update()
+            t = template.Template('{% load jellyroll %}{% jellyrender i using "jellyroll/snippets/item.txt" %}')
+            item = Item.objects.get(source="MbidTrackProvider")
+            Item.objects.bump_version(item)
+            self.assertEqual(t.render(template.Context({'i': item})), u"Artist 1 - Track 1")
+
+            MbidTrackProvider([ make_track(1, track_mbid=u'1', track_name=u'Renamed') ]).run_update()
+            item = Item.objects.get(source="MbidTrackProvider")
+            self.assertEqual(t.render(template.Context({'i': item})), u"Artist 1 - Renamed")
+        finally:
+            del settings.JELLYROLL_RENDER_CACHE_TIMEOUT
+
+    def testItemCountsFollowInteractiveSaves(self):
+        today = datetime.date.today()
+        for n in (1, 2):
+            Track.objects.create(artist_name=u'Artist %d' % n, track_name=u'Track %d' % n)
+        self.assertEqual(ItemCount.objects.counts_by_day(today, today), {today: 2})
+        Item.objects.get_for_model(Track)[0].delete()
+        self.assertEqual(ItemCount.objects.counts_by_day(today, today), {today: 1})
+
+    def testBadRecordDoesNotSpoilChunk(self):
+        tracks = [ make_track(1), make_track(2), make_track(3) ]
+        del tracks[1]['url']
+        DummyTrackProvider(tracks).run_update()
+        self.assertEqual(Track.objects.count(), 2)
+
+    def testLateFailureLeavesNothingBehind(self):
+        tracks = [ make_track(1), make_track(2), make_track(3) ]
+        FailingTrackProvider(tracks).run_update()
+        self.assertEqual(Track.objects.count(), 2)
+        self.assertEqual(Item.objects.filter(source="FailingTrackProvider").count(), 2)
+
+        provider = FailingTrackProvider(tracks)
+        provider.fail_on = None
+        provider.run_update()
+        self.assertEqual(Track.objects.count(), 3)
+        self.assertEqual(Item.objects.filter(source="FailingTrackProvider").count(), 3)
+
+    def testStreamingUpdater(self):
+        StreamingTrackProvider([ make_track(n) for n in range(1, 6) ]).run_update()
+        self.assertEqual(Track.objects.count(), 5)
+        self.assertEqual(Item.objects.filter(source="StreamingTrackProvider").count(), 5)
+
+    def testInterruptedStreamKeepsHandledChunks(self):
+        tracks = [ make_track(1), make_track(2), make_track(3), None ]
+        provider = StreamingTrackProvider(tracks)
+        self.assertRaises(ValueError, provider.run_update)
+        self.assertEqual(Track.objects.count(), 2)
+
+    def testCheckpointAdvances(self):
+        provider = DummyTrackProvider([ make_track(n) for n in range(1, 6) ])
+        provider.run_update()
+        checkpoint = Checkpoint.objects.get(provider="DummyTrackProvider", model="track")
+        self.assertEqual(checkpoint.timestamp, datetime.datetime(2008, 1, 5))
+        self.assertEqual(DummyTrackProvider([]).get_last_updated(Track), datetime.datetime(2008, 1, 5))
+
+    def testInterruptedStreamCheckpoint(self):
+        tracks = [ make_track(1), make_track(2), make_track(3), None ]
+        self.assertRaises(ValueError, StreamingTrackProvider(tracks).run_update)
+        checkpoint = Checkpoint.objects.get(provider="StreamingTrackProvider", model="track")
+        self.assertEqual(checkpoint.timestamp, datetime.datetime(2008, 1, 2))
+
+    def testReportCountsRecords(self):
+        DummyTrackProvider([ make_track(1), make_track(2) ]).run_update()
+        tracks = [ make_track(1), make_track(2, url=u'http://example.com/moved/'), make_track(3), make_track(4) ]
+        del tracks[3]['url']
+        provider = DummyTrackProvider(tracks)
+        provider.run_update()
+        report = provider.get_report()
+        self.assertEqual(report['records'], {'fetched': 4, 'created': 1, 'updated': 1, 'skipped': 1, 'failed': 1})
+        self.assert_(report['queries'] > 0)
+        self.assert_('update_main' in report['phases'] and 'handle_main' in report['phases'])
+
+    def testRunsAreRecorded(self):
+        jellyroll._update_provider(("dummy", lambda: DummyTrackProvider([ make_track(1) ])))
+        jellyroll._update_provider(("dummy", lambda: StreamingTrackProvider([ make_track(2), make_track(3), None ])))
+        failed, succeeded = ProviderRun.objects.filter(provider="dummy")
+        self.assertEqual((succeeded.succeeded, failed.succeeded), (True, False))
+        self.assertEqual(succeeded.get_report()['records']['created'], 1)
+        self.assertEqual(failed.get_report()['records']['created'], 2)
+
+    def testRunHistoryKeepsRunsTiedWithTheCutoff(self):
+        settings.JELLYROLL_PROVIDER_RUN_HISTORY = 2
+        try:
+            started = datetime.datetime(2009, 1, 1)
+            for i in range(3):
+                ProviderRun.objects.record("dummy", started, 1.0, True, {})
+            self.assertEqual(ProviderRun.objects.filter(provider="dummy").count(), 2)
+        finally:
+            del settings.JELLYROLL_PROVIDER_RUN_HISTORY
+
+class FakeResponse(dict):
+    def __init__(self, status, **headers):
+        dict.__init__(self, headers)
+        self.status = status
+
+class JsonTrackProvider(StructuredDataProvider):
+    class Meta:
+        models = (Track,)
+
+    url = "http://example.com/tracks.json"
+
+    def __init__(self):
+        super(JsonTrackProvider,self).__init__()
+        self.register_data_url(Track, self.url, "json")
+
+    def source_id(self, model_cls, extra):
+        return "json:%s" % extra['track_name']
+
+    def update_track(self, numbers):
+        self.incoming['track'] = [ make_track(n) for n in numbers ]
+
+class BrokenJsonTrackProvider(JsonTrackProvider):
+    class Meta:
+        models = (Track,)
+
+    def handle_records(self, model_str, records):
+        raise RuntimeError("handling failed")
+
+class ConditionalGetTest(TestCase):
+
+    def setUp(self):
+        self.requests = []
+        self.responses = []
+        self.fetch_response = utils.fetch_response
+        utils.fetch_response = self.fake_fetch_response
+
+    def tearDown(self):
+        utils.fetch_response = self.fetch_response
+
+    def fake_fetch_response(self, url, username=None, password=None, headers=None):
+        self.requests.append(headers)
+        return self.responses.pop(0)
+
+    def testValidatorsAreSentAndStored(self):
+        self.responses = [
+            (FakeResponse(200, etag='"v1"', **{'last-modified': 'Tue, 01 Jan 2008 00:00:00 GMT'}), "[1, 2]"),
+            (FakeResponse(304), ""),
+        ]
+        JsonTrackProvider().run_update()
+        self.failIf('If-None-Match' in self.requests[0] or 'If-Modified-Since' in self.requests[0])
+        self.assertEqual(Track.objects.count(), 2)
+        validator = HttpValidator.objects.get_for_url(JsonTrackProvider.url)
+        self.assertEqual((validator.etag, validator.last_modified), ('"v1"', 'Tue, 01 Jan 2008 00:00:00 GMT'))
+
+        provider = JsonTrackProvider()
+        provider.run_update()
+        self.assertEqual(self.requests[1]['If-None-Match'], '"v1"')
+        self.assertEqual(self.requests[1]['If-Modified-Since'], 'Tue, 01 Jan 2008 00:00:00 GMT')
+        self.assertEqual(provider.get_report()['records']['fetched'], 0)
+        self.assertEqual(Track.objects.count(), 2)
+
+    def testValidatorsWaitForHandling(self):
+        self.responses = [ (FakeResponse(200, etag='"v1"'), "[1]") ]
+        self.assertRaises(RuntimeError, BrokenJsonTrackProvider().run_update)
+        self.assertEqual(HttpValidator.objects.count(), 0)
+
+    def testErrorValidatorsAreIgnored(self):
+        self.responses = [ (FakeResponse(500, etag='"error"'), "[]") ]
+        JsonTrackProvider().run_update()
+        self.assertEqual(HttpValidator.objects.count(), 0)
+
+class PersistentCacheTest(TestCase):
+
+    def setUp(self):
+        from jellyroll.providers.utils.cache import PersistentCache
+        self.cache = PersistentCache("test", ttl=60, max_entries=2)
+
+    def testMissThenHit(self):
+        calls = []
+        fetch = lambda: calls.append(1) or ["rock", "indie"]
+        self.assertEqual(self.cache.get_or_fetch("artist:a", fetch), ["rock", "indie"])
+        self.cache.clear_memory()
+        self.assertEqual(self.cache.get_or_fetch("artist:a", fetch), ["rock", "indie"])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1})
+
+    def testFailedFetchIsNotCached(self):
+        self.assertEqual(self.cache.get_or_fetch("artist:a", lambda: None), None)
+        self.assertEqual(CacheEntry.objects.count(), 0)
+
+    def testExpiredEntriesAreIgnored(self):
+        self.cache.set("artist:a", ["rock"])
+        CacheEntry.objects.update(expires=datetime.datetime.now() - datetime.timedelta(seconds=1))
+        self.cache.clear_memory()
+        self.assertEqual(self.cache.get("artist:a"), None)
+
+    def testPruneEvictsLeastRecentlyUsed(self):
+        for key in ("a", "b", "c"):
+            self.cache.set(key, [key])
+        CacheEntry.objects.filter(key="a").update(accessed=datetime.datetime(2000, 1, 1))
+        self.assertEqual(self.cache.prune(), 2)
+        self.assertEqual(sorted(CacheEntry.objects.values_list('key', flat=True)), [u"b", u"c"])
+
+    def testPruneKeepsEntriesTiedWithTheCutoff(self):
+        for key in ("a", "b", "c"):
+            self.cache.set(key, [key])
+        CacheEntry.objects.update(accessed=datetime.datetime(2000, 1, 1))
+        self.assertEqual(self.cache.prune(), 2)
+        self.assertEqual(CacheEntry.objects.count(), 2)
+
+class LastfmTagsTest(TestCase):
+
+    def setUp(self):
+        self.getxml = utils.getxml
+        utils.getxml = self.fake_getxml
+        self.had_username = hasattr(settings, 'LASTFM_USERNAME')
+        settings.LASTFM_USERNAME = 'jellyroll'
+
+    def tearDown(self):
+        utils.getxml = self.getxml
+        if not self.had_username:
+            del settings.LASTFM_USERNAME
+
+    def fake_getxml(self, url):
+        raise SyntaxError("not XML")
+
+    def testFailedFetchesAreSkipped(self):
+        from jellyroll.providers.lastfm import LastfmProvider
+        provider = LastfmProvider()
+        self.assertEqual(provider.tags_for_track(u"Artist", u"Track"), u"")
+        self.assertEqual(CacheEntry.objects.count(), 0)
+
+if git is not None:
+    class GitSCMProviderTest(TestCase):
+
+        def setUp(self):
+            self.tmp = tempfile.mkdtemp()
+            self.origin = os.path.join(self.tmp, "origin")
+            os.mkdir(self.origin)
+            self.git("init", "-q")
+            self.old_cache_dir = getattr(settings, 'JELLYROLL_GIT_CACHE_DIR', None)
+            settings.JELLYROLL_GIT_CACHE_DIR = os.path.join(self.tmp, "cache")
+            self.repository = CodeRepository.objects.create(
+                type="git", name="origin", slug="origin", username="me@example.com",
+                url="file://%s" % self.origin)
+
+        def tearDown(self):
+            settings.JELLYROLL_GIT_CACHE_DIR = self.old_cache_dir
+            shutil.rmtree(self.tmp)
+
+        def git(self, *args, **env):
+            environ = dict(os.environ, GIT_COMMITTER_NAME="me", GIT_COMMITTER_EMAIL="me@example.com",
+                           GIT_AUTHOR_NAME="me", GIT_AUTHOR_EMAIL="me@example.com")
+            environ.update(env)
+            subprocess.check_call(("git",) + args, cwd=self.origin, env=environ)
+
+        def commit(self, message, email="me@example.com"):
+            self.git("commit", "-q", "--allow-empty", "-m", message, GIT_AUTHOR_EMAIL=email)
+
+        def update(self):
+            from jellyroll.providers.gitscm import GitSCMProvider
+            GitSCMProvider().run_update()
+
+        def testIncrementalUpdates(self):
+            self.commit("first")
+            self.commit("someone else's", email="them@example.com")
+            self.update()
+            self.assertEqual([ c.message for c in CodeCommit.objects.all() ], [u"first"])
+            self.assertEqual(len(os.listdir(settings.JELLYROLL_GIT_CACHE_DIR)), 1)
+
+            self.commit("second")
+            self.update()
+            self.assertEqual(sorted([ c.message for c in CodeCommit.objects.all() ]), [u"first", u"second"])
+
+            head = subprocess.Popen(["git", "rev-parse", "HEAD"], cwd=self.origin,
+                                    stdout=subprocess.PIPE).communicate()[0].strip()
+            checkpoint = Checkpoint.objects.get(provider="GitSCMProvider", scope=str(self.repository.pk))
+            self.assertEqual(checkpoint.cursor, head)
+
+if pysvn is not None:
+    class SubversionProviderTest(TestCase):
+
+        def setUp(self):
+            self.tmp = tempfile.mkdtemp()
+            subprocess.check_call(["svnadmin", "create", os.path.join(self.tmp, "repo")])
+            self.url = "file://%s" % os.path.join(self.tmp, "repo")
+            self.old_window = getattr(settings, 'JELLYROLL_SVN_LOG_WINDOW', 500)
+            settings.JELLYROLL_SVN_LOG_WINDOW = 2
+            self.repository = CodeRepository.objects.create(
+                type="svn", name="repo", slug="repo", username="me", url=self.url)
+
+        def tearDown(self):
+            settings.JELLYROLL_SVN_LOG_WINDOW = self.old_window
+            shutil.rmtree(self.tmp)
+
+        def commit(self, path, username="me"):
+            subprocess.check_call(["svn", "mkdir", "-q", "-m", path, "--username", username,
+                                   "%s/%s" % (self.url, path)])
+
+        def update(self):
+            from jellyroll.providers.svn import SubversionProvider
+            SubversionProvider().run_update()
+
+        def testIncrementalUpdates(self):
+            for path in ("a", "b", "c"):
+                self.commit(path)
+            self.commit("d", username="them")
+            self.update()
+            self.assertEqual(sorted([ c.message for c in CodeCommit.objects.all() ]), [u"a", u"b", u"c"])
+
+            self.commit("e")
+            self.update()
+            self.assertEqual(CodeCommit.objects.count(), 4)
+            checkpoint = Checkpoint.objects.get(provider="SubversionProvider", scope=str(self.repository.pk))
+            self.assertEqual(checkpoint.cursor, "5")
+
+class FakeSvnRevision(object):
+    def __init__(self, kind, number=None):
+        self.kind = kind
+        self.number = number
+
+class FakeSvnEntry(dict):
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+class FakeSvnClient(object):
+    """
+    A ``pysvn.Client`` with one revision per author in ``authors``, which
+    remembers the windows of the log it was asked for.
+
+    """
+    def __init__(self, authors):
+        self.entries = [ FakeSvnEntry(revision=FakeSvnRevision("number", i + 1), date=1230768000 + i,
+                                      author=author, message="r%s" % (i + 1))
+                         for i, author in enumerate(authors) ]
+        self.windows = []
+
+    def info2(self, url, revision, recurse):
+        return [ (url, FakeSvnEntry(rev=self.entries[-1].revision)) ]
+
+    def log(self, url, revision_start, revision_end, discover_changed_paths, limit, revprops):
+        if revision_start.kind == "number":
+            first = revision_start.number
+        else:
+            first = None
+        self.windows.append( (first, limit, revprops) )
+        return [ e for e in self.entries if e.revision.number >= (first or 0) ][:limit]
+
+class FakePysvn(object):
+    """
+    Just enough of the ``pysvn`` module for ``SubversionProvider``.
+
+    """
+    Revision = FakeSvnRevision
+
+    class opt_revision_kind:
+        head, number, date = "head", "number", "date"
+
+    def __init__(self, client):
+        self.Client = lambda: client
+
+class SubversionLogWindowTest(TestCase):
+    """
+    Reads a Subversion log in windows through a stub client, so it runs
+    whether pysvn is installed or not.
+
+    """
+    def setUp(self):
+        self.svn_client = FakeSvnClient(["me", "them", "me", "me", "them"])
+        fake = FakePysvn(self.svn_client)
+        self.stubbed = pysvn is None
+        if self.stubbed:
+            sys.modules['pysvn'] = fake
+        __import__('jellyroll.providers.svn')
+        self.svn = sys.modules['jellyroll.providers.svn']
+        self.real_pysvn = self.svn.pysvn
+        self.svn.pysvn = fake
+        self.old_window = getattr(settings, 'JELLYROLL_SVN_LOG_WINDOW', 500)
+        settings.JELLYROLL_SVN_LOG_WINDOW = 2
+        self.repository = CodeRepository.objects.create(
+            type="svn", name="stub", slug="stub", username="me", url="svn://example.com/stub")
+
+    def tearDown(self):
+        settings.JELLYROLL_SVN_LOG_WINDOW = self.old_window
+        self.svn.pysvn = self.real_pysvn
+        if self.stubbed:
+            # Don't leave a provider wired to the stub behind.
+            del sys.modules['pysvn']
+            del sys.modules['jellyroll.providers.svn']
+
+    def testLogIsReadInWindows(self):
+        provider = self.svn.SubversionProvider()
+        commits = list(provider.update_codecommit_svn(self.repository, datetime.datetime(2009, 1, 1)))
+        self.assertEqual([ c['revision'] for c in commits ], ["1", "3", "4"])
+        self.assertEqual([ c['message'] for c in commits ], [u"r1", u"r3", u"r4"])
+        self.assertEqual(self.svn_client.windows, [ (None, 2, self.svn.LOG_REVPROPS),
+                                                    (3, 2, self.svn.LOG_REVPROPS),
+                                                    (5, 2, self.svn.LOG_REVPROPS) ])
+        self.assertEqual(provider.pending_revisions[self.repository.pk], (self.repository, 5))
@@ -1,3 +1,4 @@
+import datetime
 from django import template
 from django.test import TestCase
 from jellyroll.models import *
@@ -34,6 +35,20 @@ class RenderTagTest(TagTestCase):
         o = self.renderTemplate('{% load jellyroll %}{% jellyrender i as o using "jellyroll/snippets/item.txt" %} -- {{ o }}', i=i)
         self.assertEqual(" -- %s" % str(i.object), o)
 
+    def testRenderCache(self):
+        from django.conf import settings
+        settings.JELLYROLL_RENDER_CACHE_TIMEOUT = 60
+        try:
+            i = Item.objects.get(pk=1)
+            tstr = '{% load jellyroll %}{% jellyrender i using "jellyroll/snippets/item.txt" %}'
+            original = self.renderTemplate(tstr, i=i)
+            i.object.title = u"Changed"
+            self.assertEqual(self.renderTemplate(tstr, i=i), original)
+            i.save()
+            self.assertEqual(self.renderTemplate(tstr, i=i), u"Changed")
+        finally:
+            del settings.JELLYROLL_RENDER_CACHE_TIMEOUT
+
 class GetJellyrollItemsTagSyntaxTest(TestCase):
     
     def getNode(self, str):
@@ -149,3 +164,105 @@ class GetJellyrollItemsTagTest(TagTestCase):
                                 "{% get_jellyroll_items excludetype photo excludetype video limit 10 as items %}"\
                                 "{{ items|length }}")
         self.assertEqual(o, "3")
+
+class RecentTrafficTagTest(TagTestCase):
+    fixtures = ["photos.json", "videos.json"]
+
+    def setUp(self):
+        self.installTagLibrary('jellyroll.templatetags.jellyroll')
+        ItemCount.objects.rebuild()
+
+    def testTrafficFromCounts(self):
+        from jellyroll.contrib.photo.models import Photo
+        photo = Item.objects.get_for_model(Photo)[0].object
+        photo.date_uploaded = datetime.datetime.now() - datetime.timedelta(days=1)
+        photo.save()
+        o = self.renderTemplate("{% load jellyroll %}"\
+                                "{% get_jellyroll_recent_traffic 3 as traffic photo,video %}"\
+                                "{{ traffic.photo.0 }} {{ traffic.video.0 }} {{ traffic.photo|length }}")
+        self.assertEqual(o, "1 0 3")
+
+class CommitsForRepositoryTagTest(TagTestCase):
+
+    def setUp(self):
+        from jellyroll.contrib.code.models import CodeRepository, CodeCommit
+        self.installTagLibrary('jellyroll.contrib.code.templatetags.jellyroll_code_tags')
+        for name in ("one", "two"):
+            repository = CodeRepository.objects.create(type="git", name=name, slug=name, 
+                                                       username="me", url="http://example.com/%s" % name)
+            for n in range(1, 4):
+                commit = CodeCommit.objects.create(repository=repository, revision="%s%s" % (name, n), 
+                                                   message="%s %s" % (name, n),
+                                                   timestamp=datetime.datetime(2008, 1, n))
+                Item.objects.create_or_update(commit, source="GitSCMProvider", 
+                                              source_id="%s:r%s" % (repository.url, commit.revision))
+
+    def testCommitsForRepository(self):
+        tstr = '{% load jellyroll_code_tags %}{% get_commits_for_repository "one" as commits limit 2 %}'\
+               '{% for item in commits %}{{ item.object.message }};{% endfor %}'
+        self.assertEqual(self.renderTemplate(tstr), "one 3;one 2;")
+
+        from jellyroll.contrib.code.models import CodeRepository, CodeCommit
+        commit = CodeCommit.objects.create(repository=CodeRepository.objects.get(name="one"), 
+                                           revision="one4", message="one 4", timestamp=datetime.datetime(2008, 1, 4))
+        Item.objects.create_or_update(commit, source="GitSCMProvider", source_id="http://example.com/one:rone4")
+        self.assertEqual(self.renderTemplate(tstr), "one 4;one 3;")
+
+    def testHandEnteredCommits(self):
+        from jellyroll.contrib.code.models import CodeRepository, CodeCommit
+        CodeCommit.objects.create(repository=CodeRepository.objects.get(name="two"), revision="two4", message="two 4")
+        tstr = '{% load jellyroll_code_tags %}{% get_commits_for_repository "two" as commits %}'\
+               '{% for item in commits %}{{ item.object.message }};{% endfor %}'
+        self.assertEqual(self.renderTemplate(tstr), "two 4;two 3;two 2;two 1;")
+
+    def testItemTimestampsNeedNotMatchCommits(self):
+        from jellyroll.contrib.code.models import CodeCommit
+        tstr = '{% load jellyroll_code_tags %}{% get_commits_for_repository "one" as commits limit 2 %}'\
+               '{% for item in commits %}{{ item.object.message }};{% endfor %}'
+        self.assertEqual(self.renderTemplate(tstr), "one 3;one 2;")
+
+        commit = CodeCommit.objects.get(revision="one2")
+        item = Item.objects.get_for_model(CodeCommit).get(object_id=str(commit.pk))
+        item.timestamp = datetime.datetime(2008, 1, 2, 12, 30)
+        item.url = "http://example.com/moved"
+        item.save()
+        self.assertEqual(self.renderTemplate(tstr.replace("item.object.message", "item.url")),
+                         ";http://example.com/moved;")
+
+        CodeCommit.objects.get(revision="one3").delete()
+        self.assertEqual(self.renderTemplate(tstr), "one 2;one 1;")
+
+class TagCloudTagTest(TagTestCase):
+    fixtures = ["bookmarks.json"]
+
+    def setUp(self):
+        from django.core.cache import cache
+        self.installTagLibrary('jellyroll.templatetags.jellyroll')
+        cache.delete("jellyroll.item.tags")
+
+    def renderCloud(self):
+        return self.renderTemplate("{% load jellyroll %}{% get_jellyroll_tag_cloud as tags %}"\
+                                   "{% for tag in tags %}{{ tag.name }}={{ tag.count }} {% endfor %}")
+
+    def expectedCloud(self):
+        from tagging.models import Tag
+        tags = sorted(Tag.objects.usage_for_model(Item, counts=True), key=lambda tag: tag.name.lower())
+        return "".join([ "%s=%s " % (tag.name, tag.count) for tag in tags ])
+
+    def testCloud(self):
+        self.assertEqual(self.renderCloud(), self.expectedCloud())
+
+    def testCloudTagsAreSaved(self):
+        from tagging.models import Tag
+        for tag in Item.objects.tag_cloud():
+            self.assertEqual(Tag.objects.get(pk=tag.pk).name, tag.name)
+
+    def testCloudFollowsItems(self):
+        self.renderCloud()
+        item = Item.objects.all()[0]
+        Item.objects.create_or_update(item.object, tags=item.tags + " brandnewtag",
+                                      source=item.source, source_id=item.source_id)
+        self.assert_("brandnewtag=1" in self.renderCloud())
+        self.assertEqual(self.renderCloud(), self.expectedCloud())
+        Item.objects.get(pk=item.pk).delete()
+        self.assertEqual(self.renderCloud(), self.expectedCloud())
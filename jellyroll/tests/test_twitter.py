@@ -0,0 +1,98 @@
+import datetime
+import re
+from django.conf import settings
+from django.test import TestCase
+from jellyroll.contrib.message.models import Message
+from jellyroll.contrib.utils.models import ContentLink
+from jellyroll.providers.twitter import TwitterProvider
+
+LEGACY_URL_RE = re.compile(
+    r'https?://'
+    r'(?:(?:[A-Z0-9-]+\.)+[A-Z]{2,6}|'
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'
+    r'(?::\d+)?'
+    r'(?:/\S+|/?)', re.IGNORECASE)
+LEGACY_TAG_RE = re.compile(r'(?P<tag>\#\w+)')
+LEGACY_USER_RE = re.compile(r'(?P<username>@\w+)')
+LEGACY_RT_RE = re.compile(r'RT\s+(?P<username>@\w+)')
+
+def legacy_parse_message(provider, message_text):
+    """
+    ``TwitterProvider.parse_message`` as it was before it scanned messages in
+    a single pass, to check the rewrite against.
+
+    """
+    message_text = message_text.replace('\n','')
+    links = LEGACY_URL_RE.findall(message_text)
+    link_dict = {}
+    for n, link in enumerate(LEGACY_URL_RE.finditer(message_text)):
+        link_dict[link.group(0)] = n + 1
+    message_text = LEGACY_URL_RE.sub(lambda m: "[%d]" % link_dict[m.group(0)], message_text)
+    message_text = re.compile(r'^%s:' % settings.TWITTER_USERNAME).sub('', message_text)
+    retweet = getattr(settings, 'TWITTER_RETWEET_TXT', "Forwarding from %s: ")
+    message_text = LEGACY_RT_RE.sub(lambda m: '%s' in retweet and retweet % m.group('username') or retweet,
+                                    message_text)
+    message_text = LEGACY_USER_RE.sub(provider.transform_user_ref_to_link, message_text)
+    tags = ' '.join([ tag[1:] for tag in LEGACY_TAG_RE.findall(message_text) ])
+    message_text = LEGACY_TAG_RE.sub('', message_text)
+    return (message_text.strip(), links, tags)
+
+def resolve_links(parsed):
+    """
+    Put the URLs back in place of a parsed message's ``[n]`` references.
+
+    """
+    text, links, tags = parsed
+    return (re.sub(r'\[(\d+)\]', lambda m: links[int(m.group(1)) - 1], text), tags)
+
+class TwitterProviderTest(TestCase):
+
+    def setUp(self):
+        self.old_settings = dict([ (name, getattr(settings, name)) for name in ('TWITTER_USERNAME', 'TWITTER_TRANSFORM_MSG')
+                                   if hasattr(settings, name) ])
+        settings.TWITTER_USERNAME = "jellyroll"
+        settings.TWITTER_TRANSFORM_MSG = True
+        self.provider = TwitterProvider()
+
+    def tearDown(self):
+        for name in ('TWITTER_USERNAME', 'TWITTER_TRANSFORM_MSG'):
+            if name in self.old_settings:
+                setattr(settings, name, self.old_settings[name])
+            else:
+                delattr(settings, name)
+
+    def testParseMessageMatchesLegacy(self):
+        for message in (u"jellyroll: reading http://example.com/page#section now",
+                        u"jellyroll: mail http://example.com/~me/@home please @bob",
+                        u"jellyroll: RT @bob: great #news",
+                        u"jellyroll: RT @bob: see http://example.com/a?x=1&y=2 from @carol #tag",
+                        u"jellyroll: jellyroll: said twice",
+                        u"jellyroll: line one\nline two #tag"):
+            self.assertEqual(self.provider.parse_message(message), legacy_parse_message(self.provider, message))
+
+    def testRepeatedUrlsAreNumberedOnce(self):
+        message = u"jellyroll: http://a.example.com/ and http://b.example.com/ then http://a.example.com/ again"
+        parsed = self.provider.parse_message(message)
+        self.assertEqual(parsed[0], u"[1] and [2] then [1] again")
+        self.assertEqual(parsed[1], [u"http://a.example.com/", u"http://b.example.com/"])
+        self.assertEqual(resolve_links(parsed), resolve_links(legacy_parse_message(self.provider, message)))
+
+    def testChunkLinksAreDeduped(self):
+        existing = ContentLink.objects.create(url=u"http://example.com/a", identifier=u"http://example.com/a")
+        long_url = u"http://example.com/" + u"x" * 200
+        records = [
+            {'message': u'first', 'links': [u"http://example.com/a", long_url, long_url],
+             'timestamp': datetime.datetime(2008, 1, 1), 'url': u'http://twitter.com/jellyroll/statuses/1', 'tags': u''},
+            {'message': u'second', 'links': [u"http://example.com/a"],
+             'timestamp': datetime.datetime(2008, 1, 2), 'url': u'http://twitter.com/jellyroll/statuses/2', 'tags': u''},
+        ]
+        self.provider.prepare()
+        self.provider.handle_records('message', records)
+
+        self.assertEqual(ContentLink.objects.count(), 2)
+        self.assertEqual(ContentLink.objects.get(url=long_url).identifier, long_url[:128])
+        first, second = Message.objects.get(message=u'first'), Message.objects.get(message=u'second')
+        self.assertEqual(sorted(first.links.values_list('pk', flat=True)),
+                         sorted([ existing.pk, ContentLink.objects.get(url=long_url).pk ]))
+        self.assertEqual(list(second.links.all()), [existing])
+        self.assertEqual(existing.message_set.count(), 2)
@@ -1,6 +1,7 @@
 import datetime
 from django.test import TestCase
 from django.conf import settings
+from jellyroll.core import instrumentation
 from jellyroll.models import Item
 
 class CalendarViewTest(TestCase):
@@ -8,6 +9,7 @@ class CalendarViewTest(TestCase):
     
     def setUp(self):
         settings.ROOT_URLCONF = "jellyroll.urls.calendar"
+        Item.objects.invalidate_bounds()
         
     def callView(self, url):
         today = datetime.date.today()
@@ -34,6 +36,44 @@ class CalendarViewTest(TestCase):
         self.assertEqual(context["day"], today)
         self.assertEqual(len(context["items"]), Item.objects.count())
         
+    def testPlainQuerySet(self):
+        from django.db.models.query import QuerySet
+        from django.http import HttpRequest
+        from jellyroll.views import calendar
+        today = datetime.date.today()
+        year, month, day = today.strftime("%Y %b %d").lower().split()
+        for view, args in [(calendar.year, (year,)), (calendar.month, (year, month)), (calendar.day, (year, month, day))]:
+            response = view(HttpRequest(), *args, **{"queryset": QuerySet(Item)})
+            self.assertEqual(response.status_code, 200)
+
+    def testBoundsFollowItems(self):
+        first, last = Item.objects.get_bounds()
+        self.assertEqual(first, Item.objects.order_by("timestamp")[0].timestamp)
+        item = Item.objects.order_by("timestamp")[0]
+        item.timestamp = first - datetime.timedelta(days=365)
+        item.save()
+        self.assertEqual(Item.objects.get_bounds()[0], item.timestamp)
+        Item.objects.all().delete()
+        self.assertEqual(Item.objects.get_bounds(), None)
+
+    def testYearViewPages(self):
+        settings.JELLYROLL_PAGINATE_BY = 2
+        try:
+            today, response, context = self.callView("/%Y/")
+            pages = [ context["items"] ]
+            while context["page"].has_next:
+                today, response, context = self.callView("/%Y/" + context["page"].next_link)
+                pages.append(context["items"])
+            seen = [ item.pk for page in pages for item in page ]
+            expected = [ item.pk for item in Item.objects.filter(timestamp__year=today.year).order_by("timestamp", "id") ]
+            self.assertEqual(seen, expected)
+            self.assert_(max([ len(page) for page in pages ]) <= 2)
+
+            today, response, context = self.callView("/%Y/" + context["page"].previous_link)
+            self.assertEqual(context["items"], pages[-2])
+        finally:
+            del settings.JELLYROLL_PAGINATE_BY
+
     def testTodayView(self):
         today, response, context = self.callView("/")
         self.assertEqual(context["day"], today)
@@ -51,4 +91,109 @@ class CalendarViewTest(TestCase):
         today, response, context = self.callView("/")
         first = context["items"][0].timestamp
         last = list(context["items"])[-1].timestamp
-        self.assert_(first > last, "first: %s, last: %s" % (first, last))
\ No newline at end of file
+        self.assert_(first > last, "first: %s, last: %s" % (first, last))
+
+    def testInstrumentation(self):
+        instrumentation.start()
+        try:
+            today, response, context = self.callView("/")
+        finally:
+            measurements = instrumentation.finish()
+        names = [ m.name for m in measurements ]
+        self.assert_("calendar.today" in names and "calendar.day" in names, names)
+        self.assert_(measurements[names.index("calendar.today")].queries > 0)
+        self.assertEqual(instrumentation.finish(), [])
+
+    def testInstrumentationMiddleware(self):
+        middleware = settings.MIDDLEWARE_CLASSES
+        settings.MIDDLEWARE_CLASSES = tuple(middleware) + ("jellyroll.core.instrumentation.InstrumentationMiddleware",)
+        settings.JELLYROLL_INSTRUMENTATION = True
+        try:
+            today, response, context = self.callView("/")
+            self.assert_("calendar.today 1x" in response["X-Jellyroll-Instrumentation"])
+        finally:
+            settings.MIDDLEWARE_CLASSES = middleware
+            del settings.JELLYROLL_INSTRUMENTATION
+
+class StubFeedGenerator(object):
+    mime_type = "application/rss+xml"
+
+    def write(self, outfile, encoding):
+        outfile.write("<rss/>")
+
+class StubFeed(object):
+    slug = "stub"
+
+    def __init__(self, latest):
+        self.latest = latest
+        self.rendered = 0
+
+    def latest_timestamp(self):
+        return self.latest
+
+    def get_feed(self, param):
+        self.rendered += 1
+        return StubFeedGenerator()
+
+class FeedViewTest(TestCase):
+    fixtures = ["photos.json"]
+
+    def setUp(self):
+        import md5
+        from django.core.cache import cache
+        self.latest = datetime.datetime(2008, 1, 1, 12, 0)
+        self.url = "stub/"
+        cache.delete("jellyroll.feed:%s" % md5.new(self.url).hexdigest())
+
+    def request(self, **meta):
+        from django.http import HttpRequest
+        request = HttpRequest()
+        request.META.update(meta)
+        return request
+
+    def testItemLimit(self):
+        from django.http import HttpRequest
+        from jellyroll.core.feeds import JellyrollBaseRSSFeed
+        from jellyroll.contrib.photo.models import Photo
+        class PhotoFeed(JellyrollBaseRSSFeed):
+            item_class = Photo
+        settings.JELLYROLL_FEED_ITEM_LIMIT = 3
+        try:
+            feed = PhotoFeed("photos", HttpRequest())
+            self.assertEqual(len(list(feed.items())), 3)
+            self.assertEqual(feed.latest_timestamp(), Item.objects.get_for_model(Photo).order_by('-timestamp')[0].timestamp)
+        finally:
+            del settings.JELLYROLL_FEED_ITEM_LIMIT
+
+    def testNotModified(self):
+        from jellyroll.views.feeds import not_modified
+        from email.Utils import formatdate
+        self.failIf(not_modified(self.request(), '"a"', 1000))
+        self.assert_(not_modified(self.request(HTTP_IF_NONE_MATCH='"b", "a"'), '"a"', 1000))
+        self.failIf(not_modified(self.request(HTTP_IF_NONE_MATCH='"b"'), '"a"', 1000))
+        self.assert_(not_modified(self.request(HTTP_IF_MODIFIED_SINCE=formatdate(1000, usegmt=True)), '"a"', 1000))
+        self.failIf(not_modified(self.request(HTTP_IF_MODIFIED_SINCE=formatdate(999, usegmt=True)), '"a"', 1000))
+
+    def testConditionalGet(self):
+        from jellyroll.views.feeds import serve_feed
+        f = StubFeed(self.latest)
+        response = serve_feed(self.request(), self.url, f, "")
+        self.assertEqual((response.status_code, response.content), (200, "<rss/>"))
+
+        response = serve_feed(self.request(HTTP_IF_NONE_MATCH=response['ETag']), self.url, f, "")
+        self.assertEqual(response.status_code, 304)
+        self.assert_(response.has_header('ETag') and response.has_header('Last-Modified'))
+
+    def testRenderedFeedIsCached(self):
+        from jellyroll.views.feeds import serve_feed
+        f = StubFeed(self.latest)
+        first = serve_feed(self.request(), self.url, f, "")
+        second = serve_feed(self.request(), self.url, f, "")
+        self.assertEqual(f.rendered, 1)
+        self.assertEqual((second['ETag'], second['Content-Type'], second.content),
+                         (first['ETag'], first['Content-Type'], first.content))
+
+        f.latest = self.latest + datetime.timedelta(hours=1)
+        third = serve_feed(self.request(), self.url, f, "")
+        self.assertEqual(f.rendered, 2)
+        self.assertNotEqual(third['ETag'], first['ETag'])
@@ -7,15 +7,24 @@ arguments as generic views do (i.e. ``template_name``, ``extra_context``, etc.)
 They all also take an argument ``queryset`` which should be an ``Item``
 queryset; it'll be used as the *starting point* for the the view in question
 instead of ``Item.objects.all()``.
+
+The year and month views show their items a page at a time (see
+``jellyroll.views.pagination``), ``paginate_by`` (or
+``settings.JELLYROLL_PAGINATE_BY``, or 100) to a page, ordered by timestamp.
 """
 
 import time
 import datetime
 from django.core import urlresolvers
 from django.template import loader, RequestContext
+from django.conf import settings
 from django.http import Http404, HttpResponse
-from jellyroll.core.models import Item
+from jellyroll.core.instrumentation import instrumented
+from jellyroll.core.managers import with_objects
+from jellyroll.core.models import Item, ItemCount
+from jellyroll.views.pagination import keyset_paginate
 
+@instrumented("calendar.today")
 def today(request, **kwargs):
     """
     Jellyroll'd items today
@@ -27,7 +36,8 @@ def today(request, **kwargs):
         kwargs['template_name'] = "jellyroll/calendar/today.html"
     return day(request, y, m, d, recent_first=True, **kwargs)
 
-def year(request, year, queryset=None,
+@instrumented("calendar.year")
+def year(request, year, queryset=None, paginate_by=None,
     template_name="jellyroll/calendar/year.html", template_loader=loader,
     extra_context=None, context_processors=None, mimetype=None):
     """
@@ -44,7 +54,9 @@ def year(request, year, queryset=None,
     Templates: ``jellyroll/calendar/year.html`` (default)
     Context:
         ``items``
-            Items from the year, earliest first.
+            A page of items from the year, earliest first.
+        ``page``
+            The ``KeysetPage`` with links to the next and previous pages.
         ``year``
             The year.
         ``previous``
@@ -56,21 +68,24 @@ def year(request, year, queryset=None,
             The next year; ``None`` if it's in the future.
         ``next_year``
             Link to the next year
+        ``item_counts``
+            A dictionary mapping each day of the year that has items (of
+            any kind, whatever ``queryset`` is) to how many it has.
     """
     # Make sure we've requested a valid year
     year = int(year)
-    try:
-        first = Item.objects.order_by("timestamp")[0]
-    except IndexError:
+    bounds = Item.objects.get_bounds()
+    if bounds is None:
         raise Http404("No items; no views.")
+    first = bounds[0]
     today = datetime.date.today()
-    if year < first.timestamp.year or year > today.year:
-        raise Http404("Invalid year (%s .. %s)" % (first.timestamp.year, today.year))
+    if year < first.year or year > today.year:
+        raise Http404("Invalid year (%s .. %s)" % (first.year, today.year))
     
     # Calculate the previous year
     previous = year - 1
     previous_link = urlresolvers.reverse("jellyroll.views.calendar.year", args=[previous])
-    if previous < first.timestamp.year:
+    if previous < first.year:
         previous = previous_link = None
     
     # And the next year
@@ -82,13 +97,14 @@ def year(request, year, queryset=None,
     # Handle the initial queryset
     if not queryset:
         queryset = Item.objects.all()
-    queryset = queryset.filter(timestamp__year=year)
-    if not queryset.query.order_by:
-        queryset = queryset.order_by("timestamp")
+    queryset = with_objects(queryset.filter(timestamp__year=year))
+    page = keyset_paginate(request, queryset, paginate_by or getattr(settings, 'JELLYROLL_PAGINATE_BY', 100))
         
     # Build the context
     context = RequestContext(request, {
-        "items"         : queryset.filter(timestamp__year=year).order_by("timestamp"),
+        "items"         : page.object_list,
+        "page"          : page,
+        "item_counts"   : ItemCount.objects.counts_by_day(datetime.date(year, 1, 1), datetime.date(year, 12, 31)),
         "year"          : year,
         "previous"      : previous,
         "previous_link" : previous_link,
@@ -106,7 +122,8 @@ def year(request, year, queryset=None,
     t = template_loader.get_template(template_name)
     return HttpResponse(t.render(context), mimetype=mimetype)
 
-def month(request, year, month, queryset=None,
+@instrumented("calendar.month")
+def month(request, year, month, queryset=None, paginate_by=None,
     template_name="jellyroll/calendar/month.html", template_loader=loader,
     extra_context=None, context_processors=None, mimetype=None):
     """
@@ -123,7 +140,9 @@ def month(request, year, month, queryset=None,
     Templates: ``jellyroll/calendar/month.html`` (default)
     Context:
         ``items``
-            Items from the month, earliest first.
+            A page of items from the month, earliest first.
+        ``page``
+            The ``KeysetPage`` with links to the next and previous pages.
         ``month``
             The month (a ``datetime.date`` object).
         ``previous``
@@ -135,16 +154,19 @@ def month(request, year, month, queryset=None,
             The next month; ``None`` if it's in the future.
         ``next_link``
             Link to the next month
+        ``item_counts``
+            A dictionary mapping each day of the month that has items (of
+            any kind, whatever ``queryset`` is) to how many it has.
     """
     # Make sure we've requested a valid month
     try:
         date = datetime.date(*time.strptime(year+month, '%Y%b')[:3])
     except ValueError:
         raise Http404("Invalid month string")
-    try:
-        first = Item.objects.order_by("timestamp")[0]
-    except IndexError:
+    bounds = Item.objects.get_bounds()
+    if bounds is None:
         raise Http404("No items; no views.")
+    first = bounds[0]
     
     # Calculate first and last day of month, for use in a date-range lookup.
     today = datetime.date.today()
@@ -154,13 +176,13 @@ def month(request, year, month, queryset=None,
     else:
         last_day = first_day.replace(month=first_day.month + 1)
     
-    if first_day < first.timestamp.date().replace(day=1) or date > today:
-        raise Http404("Invalid month (%s .. %s)" % (first.timestamp.date(), today))
+    if first_day < first.date().replace(day=1) or date > today:
+        raise Http404("Invalid month (%s .. %s)" % (first.date(), today))
     
     # Calculate the previous month
     previous = (first_day - datetime.timedelta(days=1)).replace(day=1)
     previous_link = urlresolvers.reverse("jellyroll.views.calendar.month", args=previous.strftime("%Y %b").lower().split())
-    if previous < first.timestamp.date().replace(day=1):
+    if previous < first.date().replace(day=1):
         previous = None
     
     # And the next month
@@ -172,13 +194,14 @@ def month(request, year, month, queryset=None,
     # Handle the initial queryset
     if not queryset:
         queryset = Item.objects.all()
-    queryset = queryset.filter(timestamp__range=(first_day, last_day))
-    if not queryset.query.order_by:
-        queryset = queryset.order_by("timestamp")
+    queryset = with_objects(queryset.filter(timestamp__range=(first_day, last_day)))
+    page = keyset_paginate(request, queryset, paginate_by or getattr(settings, 'JELLYROLL_PAGINATE_BY', 100))
     
     # Build the context
     context = RequestContext(request, {
-        "items"         : queryset,
+        "items"         : page.object_list,
+        "page"          : page,
+        "item_counts"   : ItemCount.objects.counts_by_day(first_day, last_day - datetime.timedelta(days=1)),
         "month"         : date,
         "previous"      : previous,
         "previous_link" : previous_link,
@@ -196,6 +219,7 @@ def month(request, year, month, queryset=None,
     t = template_loader.get_template(template_name)
     return HttpResponse(t.render(context), mimetype=mimetype)
         
+@instrumented("calendar.day")
 def day(request, year, month, day, queryset=None, recent_first=False,
     template_name="jellyroll/calendar/day.html", template_loader=loader,
     extra_context=None, context_processors=None, mimetype=None):
@@ -236,19 +260,19 @@ def day(request, year, month, day, queryset=None, recent_first=False,
         day = datetime.date(*time.strptime(year+month+day, '%Y%b%d')[:3])
     except ValueError:
         raise Http404("Invalid day string")
-    try:
-        first = Item.objects.order_by("timestamp")[0]
-    except IndexError:
+    bounds = Item.objects.get_bounds()
+    if bounds is None:
         raise Http404("No items; no views.")
+    first = bounds[0]
     
     today = datetime.date.today()
-    if day < first.timestamp.date() or day > today:
-        raise Http404("Invalid day (%s .. %s)" % (first.timestamp.date(), today))
+    if day < first.date() or day > today:
+        raise Http404("Invalid day (%s .. %s)" % (first.date(), today))
     
     # Calculate the previous day
     previous = day - datetime.timedelta(days=1)
     previous_link = urlresolvers.reverse("jellyroll.views.calendar.day", args=previous.strftime("%Y %b %d").lower().split())
-    if previous < first.timestamp.date():
+    if previous < first.date():
         previous = previous_link = None
     
     # And the next month
@@ -270,6 +294,7 @@ def day(request, year, month, day, queryset=None, recent_first=False,
             queryset = queryset.order_by("-timestamp")
         else:
             queryset = queryset.order_by("timestamp")
+    queryset = with_objects(queryset)
     
     # Build the context
     context = RequestContext(request, {
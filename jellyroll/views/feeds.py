@@ -0,0 +1,95 @@
+"""
+A drop-in replacement for ``django.contrib.syndication.views.feed`` that
+caches feeds and answers conditional GETs.
+
+Feeds with a ``latest_timestamp`` method (like those based on
+``jellyroll.feeds.JellyrollBaseFeed``) get ``ETag`` and ``Last-Modified``
+headers derived from their newest item, so feed readers polling an
+unchanged feed get a ``304 Not Modified``. The rendered feed is cached
+(for ``settings.JELLYROLL_FEED_CACHE_TIMEOUT`` seconds, 600 by default)
+under a key that changes whenever a newer item arrives. Other feeds are
+served as usual.
+
+Each feed is instrumented as ``feeds.<slug>`` (see
+``jellyroll.core.instrumentation``).
+"""
+
+import md5
+import time
+from email.Utils import formatdate, parsedate_tz, mktime_tz
+
+from django.conf import settings
+from django.contrib.syndication.feeds import FeedDoesNotExist
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils.encoding import smart_str
+from jellyroll.core.instrumentation import measure
+
+
+def feed(request, url, feed_dict=None):
+    if not feed_dict:
+        raise Http404("No feeds are registered.")
+
+    try:
+        slug, param = url.split('/', 1)
+    except ValueError:
+        slug, param = url, ''
+
+    try:
+        f = feed_dict[slug](slug, request)
+    except KeyError:
+        raise Http404("Slug %r isn't registered." % slug)
+
+    return measure("feeds.%s" % slug, serve_feed, request, url, f, param)
+
+def serve_feed(request, url, f, param):
+    latest = getattr(f, 'latest_timestamp', None) and f.latest_timestamp()
+    if latest is None:
+        return render_feed(f, param)
+
+    modified = time.mktime(latest.timetuple())
+    etag = '"%s"' % md5.new(smart_str("%s:%s" % (url, latest.isoformat()))).hexdigest()
+    if not_modified(request, etag, modified):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Last-Modified'] = formatdate(modified, usegmt=True)
+        return response
+
+    cache_key = "jellyroll.feed:%s" % md5.new(smart_str(url)).hexdigest()
+    cached = cache.get(cache_key)
+    if cached is not None and cached[0] == etag:
+        response = HttpResponse(cached[2], mimetype=cached[1])
+    else:
+        response = render_feed(f, param)
+        cache.set(cache_key, (etag, response['Content-Type'], response.content),
+                  getattr(settings, 'JELLYROLL_FEED_CACHE_TIMEOUT', 600))
+
+    response['ETag'] = etag
+    response['Last-Modified'] = formatdate(modified, usegmt=True)
+    return response
+
+def render_feed(f, param):
+    try:
+        feedgen = f.get_feed(param)
+    except FeedDoesNotExist:
+        raise Http404("Invalid feed parameters. Slug %r is valid, but other parameters, or lack thereof, are not." % f.slug)
+
+    response = HttpResponse(mimetype=feedgen.mime_type)
+    feedgen.write(response, 'utf-8')
+    return response
+
+def not_modified(request, etag, modified):
+    """
+    Whether the client already has the feed with ``etag`` (or one from no
+    earlier than ``modified``, a Unix time).
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return etag in [ tag.strip() for tag in if_none_match.split(',') ] or if_none_match.strip() == '*'
+
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since is not None:
+        parsed = parsedate_tz(if_modified_since.split(';')[0])
+        if parsed is not None:
+            return int(modified) <= mktime_tz(parsed)
+    return False
@@ -0,0 +1,91 @@
+"""
+Keyset ("cursor") pagination for ``Item`` querysets.
+
+Pages are ordered by ``(timestamp, pk)`` and found by filtering on the last
+(or first) item of the neighbouring page rather than with an ``OFFSET``, so
+page 500 costs the same as page one and pages don't shift when new items
+arrive. Cursors are passed in the query string as ``after`` or ``before``.
+"""
+
+import datetime
+from django.db.models import Q
+from django.http import Http404
+
+CURSOR_FORMAT = "%Y%m%d%H%M%S"
+
+
+def encode_cursor(item):
+    """Return the cursor for ``item``."""
+    timestamp = item.timestamp
+    return "%s%06d-%s" % (timestamp.strftime(CURSOR_FORMAT), timestamp.microsecond, item.pk)
+
+def decode_cursor(cursor):
+    """
+    Return the ``(timestamp, pk)`` encoded in ``cursor``; raises ``ValueError``
+    if it isn't a valid cursor.
+    """
+    stamp, pk = cursor.split("-", 1)
+    if len(stamp) != 20:
+        raise ValueError("Invalid cursor %r" % cursor)
+    timestamp = datetime.datetime(int(stamp[0:4]), int(stamp[4:6]), int(stamp[6:8]), int(stamp[8:10]),
+                                  int(stamp[10:12]), int(stamp[12:14]), int(stamp[14:20]))
+    return timestamp, int(pk)
+
+class KeysetPage(object):
+    """
+    A page of items, with ``object_list``, ``has_next`` and ``has_previous``,
+    and the ``next_cursor``/``previous_cursor`` (and ``next_link``/
+    ``previous_link`` query strings) for the pages either side.
+    """
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = self.previous_cursor = None
+        self.next_link = self.previous_link = None
+        if has_next and object_list:
+            self.next_cursor = encode_cursor(object_list[-1])
+            self.next_link = "?after=%s" % self.next_cursor
+        if has_previous and object_list:
+            self.previous_cursor = encode_cursor(object_list[0])
+            self.previous_link = "?before=%s" % self.previous_cursor
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+def _beyond(timestamp, pk, later):
+    if later:
+        return Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, pk__gt=pk)
+    return Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lt=pk)
+
+def keyset_paginate(request, queryset, per_page, recent_first=False):
+    """
+    Return the ``KeysetPage`` of ``queryset`` that ``request`` asks for:
+    the first page, or the one after or before the cursor in its ``after``
+    or ``before`` parameter. Items are ordered by timestamp, earliest first
+    unless ``recent_first`` is true. Raises ``Http404`` for a bad cursor.
+    """
+    after, before = request.GET.get("after"), request.GET.get("before")
+    try:
+        cursor = (after or before) and decode_cursor(after or before)
+    except ValueError:
+        raise Http404("Invalid page")
+
+    # "Forwards" is the order the page is displayed in; a page before the
+    # cursor is found by walking backwards from it.
+    forwards = not before
+    later = forwards != recent_first
+    if later:
+        queryset = queryset.order_by("timestamp", "pk")
+    else:
+        queryset = queryset.order_by("-timestamp", "-pk")
+    if cursor:
+        queryset = queryset.filter(_beyond(cursor[0], cursor[1], later))
+
+    items = list(queryset[:per_page + 1])
+    more = len(items) > per_page
+    items = items[:per_page]
+    if forwards:
+        return KeysetPage(items, has_next=more, has_previous=bool(after))
+    items.reverse()
+    return KeysetPage(items, has_next=True, has_previous=more)
@@ -3,27 +3,42 @@ Views for looking at Jellyroll items by tag.
 
 """
 
+from django.conf import settings
 from django.shortcuts import get_object_or_404, render_to_response
 from django.contrib.contenttypes.models import ContentType
-from django.views.generic.list_detail import object_list
 from django.template import RequestContext
 from django.http import Http404
+from jellyroll.core.instrumentation import instrumented
+from jellyroll.core.managers import with_objects
 from jellyroll.core.models import Item
+from jellyroll.views.pagination import keyset_paginate
 from tagging.models import TaggedItem, Tag
 
 
+@instrumented("tags.tag_list")
 def tag_list(request):
-    #tags = sorted( Tag.objects.usage_for_model(Item),
-    #               cmp=lambda x,y: cmp(x.name.lower(),y.name.lower()) )
-    item_ct = ContentType.objects.get_for_model(Item)
-    tag_items = TaggedItem.objects.filter(content_type=item_ct)
-    tags = Tag.objects.filter(pk__in=[ tag_item.tag.pk for tag_item in tag_items ])
-    return object_list(request, tags, template_object_name='tag',
-                       template_name='jellyroll/tags/tag_list.html')
+    """
+    All the tags used on items, with their usage (see
+    ``ItemManager.tag_cloud``), in ``tag_list``.
 
-def tag_item_list(request, tag):
+    """
+    return render_to_response('jellyroll/tags/tag_list.html', 
+                              {'tag_list': Item.objects.tag_cloud(), 'is_paginated': False},
+                              context_instance=RequestContext(request))
+
+@instrumented("tags.tag_item_list")
+def tag_item_list(request, tag, paginate_by=None):
+    """
+    Items tagged with ``tag``, newest first, a page at a time (see
+    ``jellyroll.views.pagination``): ``item_list`` holds the page's items
+    and ``page`` the ``KeysetPage``.
+
+    """
     tag = get_object_or_404(Tag,name=tag)
-    items = TaggedItem.objects.get_by_model(Item,tag)
-    return object_list(request, items, template_object_name='item',
-                       template_name='jellyroll/tags/tag_item_list.html', 
-                       extra_context={'tag':tag})
+    items = with_objects(TaggedItem.objects.get_by_model(Item,tag))
+    page = keyset_paginate(request, items, paginate_by or getattr(settings, 'JELLYROLL_PAGINATE_BY', 100),
+                           recent_first=True)
+    return render_to_response('jellyroll/tags/tag_item_list.html',
+                              {'item_list': page.object_list, 'page': page, 
+                               'is_paginated': page.has_other_pages(), 'tag': tag},
+                              context_instance=RequestContext(request))